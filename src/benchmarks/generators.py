@@ -0,0 +1,71 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+# =================================================================
+#  SYNTHETIC POLICY AND SCENARIO DATA
+# =================================================================
+# Generates Policies and EconomicScenarios uploads with the columns and
+# value ranges of schema.sql. Everything is driven by a seeded generator, so
+# a given (size, seed) always produces byte-identical CSVs.
+
+PRODUCT_CODES = ["FIA_GLWB_A", "FIA_GLWB_B", "VA_GLWB_C", "FIA_ACC_D"]
+TENORS = {
+    "Rate_0_25_yr": 0.25, "Rate_0_5_yr": 0.5, "Rate_1_yr": 1, "Rate_2_yr": 2, "Rate_3_yr": 3,
+    "Rate_5_yr": 5, "Rate_7_yr": 7, "Rate_10_yr": 10, "Rate_20_yr": 20, "Rate_30_yr": 30,
+}
+
+
+def policies_frame(n_policies: int, seed: int = 0, id_prefix: str = "P") -> pd.DataFrame:
+    """
+    A Policies upload of n_policies rows spread over PRODUCT_CODES. Policy_ID is unique
+    across every user's sets, so uploads that are stored side by side need distinct id_prefixes.
+    """
+    rng = np.random.default_rng(seed)
+    issue_age = rng.integers(45, 80, n_policies)
+    duration_months = rng.integers(0, 180, n_policies)
+    valuation_date = pd.Timestamp("2024-12-31")
+    account_value = rng.lognormal(mean=11.5, sigma=0.8, size=n_policies).round(2)
+    return pd.DataFrame({
+        "Policy_ID": [f"{id_prefix}{i:08d}" for i in range(n_policies)],
+        "Product_Code": rng.choice(PRODUCT_CODES, n_policies),
+        "Valuation_Date": valuation_date.date().isoformat(),
+        "Issue_Date": (valuation_date - pd.to_timedelta(duration_months * 30, unit="D")).strftime("%Y-%m-%d"),
+        "Issue_Age": issue_age,
+        "Gender": rng.choice(["M", "F"], n_policies),
+        "Policy_Status_Code": 1,
+        "Account_Value": account_value,
+        "Surrender_Charge_Schedule": "0.07,0.06,0.05,0.04,0.03,0.02,0.01",
+        "Guaranteed_Crediting_Rate": rng.choice([0.01, 0.015, 0.02, 0.025, 0.03], n_policies),
+        "Index_Strategy_Code": rng.choice(["SP500_PTP", "FIXED", "BLEND"], n_policies),
+        "Sub_Account_Allocation": "FIXED:0.4;SP500:0.6",
+        "Rider_Codes": rng.choice(["GLWB", "GLWB;DB", ""], n_policies),
+        "GLWB_Benefit_Base": (account_value * rng.uniform(1.0, 1.4, n_policies)).round(2),
+        "GLWB_Withdrawal_Rate": rng.choice([0.04, 0.045, 0.05, 0.055], n_policies),
+    })
+
+
+def scenarios_frame(n_scenarios: int, n_months: int = 360, seed: int = 0) -> pd.DataFrame:
+    """An EconomicScenarios upload: n_scenarios mean-reverting yield curve paths of n_months each."""
+    rng = np.random.default_rng(seed)
+    # Short rate follows a discretised Vasicek process; longer tenors add a term premium
+    short = np.empty((n_scenarios, n_months))
+    rate = np.full(n_scenarios, 0.035)
+    shocks = rng.normal(0.0, 0.004, (n_scenarios, n_months))
+    for month in range(n_months):
+        rate = rate + 0.02 * (0.035 - rate) + shocks[:, month]
+        short[:, month] = rate
+    frame = {
+        "ScenarioID": np.repeat(np.arange(1, n_scenarios + 1), n_months),
+        "Month": np.tile(np.arange(1, n_months + 1), n_scenarios),
+    }
+    for column, years in TENORS.items():
+        frame[column] = np.clip(short + 0.012 * (1 - np.exp(-years / 5)), 0.0, None).ravel().round(8)
+    return pd.DataFrame(frame)
+
+
+def write_csv(df: pd.DataFrame, path: str) -> int:
+    """Writes an upload CSV and returns its size in bytes."""
+    df.to_csv(path, index=False)
+    return os.path.getsize(path)
@@ -0,0 +1,232 @@
+import os
+import re
+import sqlite3
+import types
+
+import numpy as np
+from azure.core.exceptions import ResourceExistsError, ResourceNotFoundError
+from sqlalchemy import create_engine, event, text
+
+import db
+import result_store
+import snapshots
+import validation
+
+# =================================================================
+#  LOCAL STAND-IN FOR AZURE SQL AND BLOB STORAGE
+# =================================================================
+# Lets the benchmarks call the real function and activity bodies on one
+# machine: db's shared engine is pointed at a SQLite file, the few T-SQL
+# idioms the app uses are rewritten on the way to the driver, and the
+# snapshot, result and quarantine containers are backed by a local directory.
+# Table keys match schema.sql, so a key collision fails here as it would in
+# production (SQLite's NOCASE stands in for the case-insensitive collation).
+#
+# Absolute numbers are not comparable to Azure SQL; the point is a stable
+# baseline for spotting regressions in our own code paths.
+
+SQLITE_SCHEMA = """
+CREATE TABLE Users (UserID TEXT PRIMARY KEY, IdentityProvider TEXT, Email TEXT, DisplayName TEXT);
+CREATE TABLE UserVersions (UserID TEXT NOT NULL, Scope TEXT NOT NULL, Version INTEGER NOT NULL, PRIMARY KEY (UserID, Scope));
+CREATE TABLE PolicySets (
+    PolicySetID INTEGER PRIMARY KEY AUTOINCREMENT, UserID TEXT NOT NULL, SetName TEXT NOT NULL, OriginalFileName TEXT,
+    UploadTimestamp TEXT DEFAULT CURRENT_TIMESTAMP, RecordCount INTEGER, IngestStatus TEXT, RowsLoaded INTEGER, RowsRejected INTEGER, ContentHash TEXT,
+    EditVersion INTEGER NOT NULL DEFAULT 0, LastEditTimestamp TEXT, PendingEditSince TEXT
+);
+CREATE TABLE ScenarioSets (
+    ScenarioSetID INTEGER PRIMARY KEY AUTOINCREMENT, UserID TEXT NOT NULL, SetName TEXT NOT NULL, OriginalFileName TEXT,
+    Granularity TEXT, CreatedTimestamp TEXT DEFAULT CURRENT_TIMESTAMP, RecordCount INTEGER, IngestStatus TEXT,
+    RowsLoaded INTEGER, RowsRejected INTEGER, ContentHash TEXT, ScenarioCount INTEGER, MonthCount INTEGER
+);
+CREATE TABLE Policies (
+    Policy_ID TEXT NOT NULL COLLATE NOCASE PRIMARY KEY, Product_Code TEXT NOT NULL, Valuation_Date TEXT, Issue_Date TEXT, Issue_Age INTEGER,
+    Gender TEXT, Policy_Status_Code INTEGER, Account_Value REAL, Surrender_Charge_Schedule TEXT,
+    Guaranteed_Crediting_Rate REAL, Index_Strategy_Code TEXT, Sub_Account_Allocation TEXT, Rider_Codes TEXT,
+    GLWB_Benefit_Base REAL, GLWB_Withdrawal_Rate REAL, Load_Timestamp TEXT DEFAULT CURRENT_TIMESTAMP,
+    UserID TEXT, PolicySetID INTEGER
+);
+CREATE INDEX IX_Policies_UserSet_PolicyID ON Policies (UserID, PolicySetID, Policy_ID);
+CREATE INDEX IX_Policies_UserSet_Product ON Policies (UserID, PolicySetID, Product_Code, Policy_ID);
+CREATE INDEX IX_Policies_User_Product ON Policies (UserID, Product_Code, Policy_ID);
+CREATE INDEX IX_PolicySets_User ON PolicySets (UserID, UploadTimestamp);
+CREATE INDEX IX_ScenarioSets_User ON ScenarioSets (UserID, CreatedTimestamp);
+CREATE TABLE PolicySetProducts (
+    PolicySetID INTEGER NOT NULL, Product_Code TEXT NOT NULL, PolicyCount INTEGER NOT NULL, AccountValueTotal REAL NOT NULL,
+    PRIMARY KEY (PolicySetID, Product_Code)
+);
+CREATE TABLE EconomicScenarios (
+    ScenarioID INTEGER NOT NULL, Month INTEGER NOT NULL, Rate_0_25_yr REAL, Rate_0_5_yr REAL, Rate_1_yr REAL,
+    Rate_2_yr REAL, Rate_3_yr REAL, Rate_5_yr REAL, Rate_7_yr REAL, Rate_10_yr REAL, Rate_20_yr REAL, Rate_30_yr REAL,
+    Load_Timestamp TEXT DEFAULT CURRENT_TIMESTAMP, UserID TEXT, ScenarioSetID INTEGER,
+    PRIMARY KEY (ScenarioSetID, ScenarioID, Month)
+);
+CREATE TABLE CalculationJobs (
+    JobID INTEGER PRIMARY KEY AUTOINCREMENT, Product_Code TEXT NOT NULL, Job_Status TEXT NOT NULL,
+    Requested_Timestamp TEXT DEFAULT CURRENT_TIMESTAMP, Completed_Timestamp TEXT, UserID TEXT NOT NULL,
+    ScenarioSetID INTEGER, RunStochastic INTEGER, Compression INTEGER, BatchPlan TEXT, Sensitivities TEXT
+);
+CREATE TABLE JobBatchCheckpoints (
+    JobID INTEGER, Batch TEXT, Aggregate TEXT, CreatedTimestamp TEXT DEFAULT CURRENT_TIMESTAMP, PRIMARY KEY (JobID, Batch)
+);
+CREATE INDEX IX_CalculationJobs_User ON CalculationJobs (UserID, JobID);
+CREATE TABLE Results (ResultID INTEGER PRIMARY KEY AUTOINCREMENT, JobID INTEGER, Result_Type TEXT, Result_Value REAL);
+CREATE TABLE ResultCache (CacheKey TEXT PRIMARY KEY, Product_Code TEXT, EngineVersion TEXT, Aggregate TEXT, CreatedTimestamp TEXT);
+CREATE TABLE JobProductResults (JobID INTEGER, Product_Code TEXT, Reserve REAL, CacheHit INTEGER, Aggregate TEXT, PRIMARY KEY (JobID, Product_Code));
+CREATE TABLE PolicyDeltas (
+    DeltaID INTEGER PRIMARY KEY AUTOINCREMENT, JobID INTEGER NOT NULL, Policy_ID TEXT NOT NULL, Product_Code TEXT NOT NULL,
+    Delta_Reserve REAL NOT NULL, CreatedTimestamp TEXT DEFAULT CURRENT_TIMESTAMP, EditID TEXT UNIQUE
+);
+CREATE TABLE JobResultFiles (
+    JobID INTEGER, Path TEXT, Kind TEXT, Row_Count INTEGER, Byte_Count INTEGER,
+    CreatedTimestamp TEXT DEFAULT CURRENT_TIMESTAMP, PRIMARY KEY (JobID, Path)
+);
+CREATE TABLE JobMetrics (
+    MetricID INTEGER PRIMARY KEY AUTOINCREMENT, JobID INTEGER, Activity TEXT, Batch TEXT, Phase TEXT, Started TEXT,
+    Duration_Ms REAL, Row_Count INTEGER, Byte_Count INTEGER, Peak_RSS_MB REAL
+);
+"""
+
+# T-SQL statements with no mechanical SQLite rewrite
+SQLITE_STATEMENTS = {
+    "UPSERT_JOB_RESULT_FILE": text(
+        "INSERT INTO JobResultFiles (JobID, Kind, Path, Row_Count, Byte_Count) VALUES (:jobid, :kind, :path, :rows, :bytes) "
+        "ON CONFLICT (JobID, Path) DO UPDATE SET Row_Count = excluded.Row_Count, Byte_Count = excluded.Byte_Count"
+    ),
+    "BUMP_USER_VERSION": text(
+        "INSERT INTO UserVersions (UserID, Scope, Version) VALUES (:uid, :scope, 1) "
+        "ON CONFLICT (UserID, Scope) DO UPDATE SET Version = Version + 1"
+    ),
+    "INSERT_BATCH_CHECKPOINT": text(
+        "INSERT OR IGNORE INTO JobBatchCheckpoints (JobID, Batch, Aggregate) VALUES (:jobid, :batch, :aggregate)"
+    ),
+    "SELECT_EDIT_TIMESTAMP": text("SELECT strftime('%Y-%m-%dT%H:%M:%f', 'now')"),
+    "SELECT_POLICY_SETS_DUE_FOR_REBUILD": text(
+        "SELECT PolicySetID FROM PolicySets WHERE IngestStatus = 'Ready' AND PendingEditSince IS NOT NULL "
+        "AND (strftime('%s', 'now') - strftime('%s', LastEditTimestamp) >= :quiet "
+        "OR strftime('%s', 'now') - strftime('%s', PendingEditSince) >= :maxwait)"
+    ),
+    "INSERT_CACHED_RESULT": text(
+        "INSERT OR IGNORE INTO ResultCache (CacheKey, Product_Code, EngineVersion, Aggregate) "
+        "VALUES (:key, :pcode, :version, :aggregate)"
+    ),
+}
+
+_REWRITES = [
+    (re.compile(r"^SELECT TOP \(?(:?\w+)\)? (.*)$", re.S), r"SELECT \2 LIMIT \1"),
+    (re.compile(r"OUTPUT INSERTED\.(\w+) (VALUES \(.*\))", re.S), r"\2 RETURNING \1"),
+    (re.compile(r"\s*WITH \(UPDLOCK\)"), ""),
+    (re.compile(r"GETDATE\(\)"), "CURRENT_TIMESTAMP"),
+    (re.compile(r"COLLATE Latin1_General_BIN2"), "COLLATE BINARY"),
+]
+
+
+def _to_sqlite(statement: str) -> str:
+    for pattern, replacement in _REWRITES:
+        statement = pattern.sub(replacement, statement)
+    return statement
+
+
+class _LocalBlob:
+    def __init__(self, path):
+        self._path = path
+
+    def readall(self) -> bytes:
+        with open(self._path, "rb") as f:
+            return f.read()
+
+    def readinto(self, stream) -> int:
+        data = self.readall()
+        stream.write(data)
+        return len(data)
+
+
+class LocalContainer:
+    """The subset of azure.storage.blob.ContainerClient used by snapshots and result_store, on a local directory."""
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.root, *name.split("/"))
+
+    def create_container(self):
+        if os.path.isdir(self.root):
+            raise ResourceExistsError("container exists")
+        os.makedirs(self.root)
+
+    def upload_blob(self, name: str, data: bytes, overwrite: bool = False):
+        path = self._path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(data)
+
+    def delete_blob(self, name: str):
+        try:
+            os.remove(self._path(name))
+        except FileNotFoundError:
+            raise ResourceNotFoundError(name)
+
+    def list_blobs(self, name_starts_with: str = ""):
+        for directory, _, files in os.walk(self.root):
+            for file_name in sorted(files):
+                name = os.path.relpath(os.path.join(directory, file_name), self.root).replace(os.sep, "/")
+                if name.startswith(name_starts_with):
+                    yield types.SimpleNamespace(name=name)
+
+    def download_blob(self, name: str) -> _LocalBlob:
+        if not os.path.exists(self._path(name)):
+            raise ResourceNotFoundError(name)
+        return _LocalBlob(self._path(name))
+
+    def get_blob_client(self, name: str):
+        def get_blob_properties():
+            if not os.path.exists(self._path(name)):
+                raise ResourceNotFoundError(name)
+            return {"size": os.path.getsize(self._path(name))}
+        return types.SimpleNamespace(get_blob_properties=get_blob_properties)
+
+
+class LocalBlobInput:
+    """Stands in for func.InputStream when calling the blob-triggered ingest functions directly."""
+
+    def __init__(self, path: str, name: str):
+        self.name = name
+        self.length = os.path.getsize(path)
+        self._file = open(path, "rb")
+
+    def read(self, size: int = -1) -> bytes:
+        return self._file.read(size)
+
+    def close(self):
+        self._file.close()
+
+
+def install(work_dir: str):
+    """Points db, snapshots, result_store and the quarantine at local stand-ins under work_dir and creates the schema."""
+    os.makedirs(work_dir, exist_ok=True)
+    # numpy scalars reach the driver from DataFrame rows; pyodbc accepts them, sqlite3 needs adapters
+    for numpy_type, python_type in ((np.int64, int), (np.int32, int), (np.float64, float), (np.float32, float), (np.bool_, bool)):
+        sqlite3.register_adapter(numpy_type, python_type)
+
+    engine = create_engine(f"sqlite:///{os.path.join(work_dir, 'vm22.db')}", paramstyle="named")
+
+    @event.listens_for(engine, "before_cursor_execute", retval=True)
+    def _rewrite(conn, cursor, statement, parameters, context, executemany):
+        return _to_sqlite(statement), parameters
+
+    db._instrument(engine)
+    with engine.begin() as con:
+        for statement in SQLITE_SCHEMA.split(";"):
+            if statement.strip():
+                con.exec_driver_sql(statement)
+    db._engine = engine
+    for name, statement in SQLITE_STATEMENTS.items():
+        setattr(db, name, statement)
+
+    snapshots._container = lambda: LocalContainer(os.path.join(work_dir, snapshots.SNAPSHOT_CONTAINER))
+    result_store._container = lambda: LocalContainer(os.path.join(work_dir, result_store.RESULTS_CONTAINER))
+    validation._container = lambda: LocalContainer(os.path.join(work_dir, validation.QUARANTINE_CONTAINER))
+    # Without a storage connection string ingest reads the trigger's stream directly
+    os.environ.pop("AzureWebJobsStorage", None)
+    os.environ.setdefault("SqlConnectionString", "sqlite (benchmark stand-in)")
+    return engine
@@ -0,0 +1,264 @@
+"""
+Engine benchmark suite.
+
+Generates synthetic policy and scenario uploads, runs the real ingest functions,
+the RunCalculationEngine activity body and the read endpoints against a local
+SQLite/filesystem stand-in (see local_stand_in.py), and reports throughput,
+latency percentiles and peak memory per case.
+
+    python src/benchmarks/run_benchmarks.py --profile ci --output results.json
+    python src/benchmarks/run_benchmarks.py --profile ci --baseline src/benchmarks/baseline.json
+
+With --baseline the run exits non-zero if any case regressed by more than
+--tolerance against the stored numbers; --update-baseline rewrites the file.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+WORK_DIR = os.environ.get("BenchmarkWorkDir", os.path.join(tempfile.gettempdir(), "vm22-benchmarks"))
+
+# Engine settings are read at import time, so they are pinned before the engine modules load
+os.environ["SnapshotCacheDir"] = os.path.join(WORK_DIR, "snapshot-cache")
+os.environ["ScenarioCacheDir"] = os.path.join(WORK_DIR, "scenario-cache")
+sys.path.insert(0, os.path.join(HERE, "..", "engine"))
+
+import azure.functions as func  # noqa: E402
+
+import generators  # noqa: E402
+import local_stand_in  # noqa: E402
+
+PROFILES = {
+    # Small enough for every CI run
+    "ci": {"policies": [1_000, 10_000], "scenarios": [1, 100], "months": 120, "read_repeats": 30},
+    "full": {"policies": [1_000, 10_000, 100_000, 1_000_000], "scenarios": [1, 100, 1_000, 10_000], "months": 360, "read_repeats": 100},
+}
+BASELINE_VERSION = 1
+# Metric -> True if higher is better
+COMPARED_METRICS = {"throughput": True, "p95_ms": False, "peak_mb": False}
+
+
+def user_function(function_builder):
+    """The plain Python function behind an Azure Functions decorator."""
+    return function_builder._function.get_user_function()
+
+
+def request(user_id: str, route: str, params: dict = None) -> func.HttpRequest:
+    return func.HttpRequest(method="GET", url=f"/api/{route}", headers={"x-ms-client-principal-id": user_id}, params=params or {}, body=b"")
+
+
+def summarize(latencies_ms, units: int, elapsed_s: float, peak_bytes: int, unit: str) -> dict:
+    latencies = np.asarray(latencies_ms)
+    return {
+        "calls": len(latencies),
+        "units": units,
+        "unit": unit,
+        "throughput": units / elapsed_s if elapsed_s > 0 else None,
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p95_ms": float(np.percentile(latencies, 95)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+        "max_ms": float(latencies.max()),
+        "peak_mb": peak_bytes / 2**20,
+    }
+
+
+def measure(calls, units: int, unit: str) -> dict:
+    """Runs each zero-argument callable once, timing every call and tracing peak allocations over all of them."""
+    latencies = []
+    tracemalloc.start()
+    start = time.perf_counter()
+    for call in calls:
+        call_start = time.perf_counter()
+        call()
+        latencies.append((time.perf_counter() - call_start) * 1000.0)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return summarize(latencies, units, elapsed, peak, unit)
+
+
+def check_response(response: func.HttpResponse):
+    if response.status_code >= 400:
+        raise RuntimeError(f"HTTP {response.status_code}: {response.get_body()[:200]!r}")
+
+
+def ingest_case(function_app, engine, kind: str, user_id: str, df) -> tuple:
+    """Uploads one generated CSV through the blob-triggered ingest function and returns (metrics, set id)."""
+    path = os.path.join(WORK_DIR, "uploads", f"{user_id}-{kind}.csv")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    size = generators.write_csv(df, path)
+    blob = local_stand_in.LocalBlobInput(path, f"raw-uploads/{user_id}/{kind}/{os.path.basename(path)}")
+    ingest_function = function_app.blob_ingest_policies if kind == "policies" else function_app.blob_ingest_scenarios
+    try:
+        result = measure([lambda: user_function(ingest_function)(blob)], len(df), "rows")
+    finally:
+        blob.close()
+
+    table, set_table, id_column = (
+        ("Policies", "PolicySets", "PolicySetID") if kind == "policies" else ("EconomicScenarios", "ScenarioSets", "ScenarioSetID")
+    )
+    with engine.connect() as con:
+        set_id, status = con.exec_driver_sql(f"SELECT MAX({id_column}), MAX(IngestStatus) FROM {set_table} WHERE UserID = ?", (user_id,)).fetchone()
+        loaded = con.exec_driver_sql(f"SELECT COUNT(*) FROM {table} WHERE {id_column} = ?", (set_id,)).scalar()
+    if status != "Ready" or loaded != len(df):
+        raise RuntimeError(f"{kind} ingest for {user_id} failed: status {status}, {loaded} of {len(df)} rows loaded")
+    result["bytes"] = size
+    return result, set_id
+
+
+def engine_case(durable_blueprints, engine, user_id: str, scenario_set_id: int, n_scenarios: int) -> dict:
+    """Plans a job and runs every batch through the RunCalculationEngine activity body."""
+    with engine.begin() as con:
+        job_id = con.exec_driver_sql(
+            "INSERT INTO CalculationJobs (Product_Code, Job_Status, UserID, ScenarioSetID, RunStochastic) VALUES (?, 'Pending', ?, ?, ?) RETURNING JobID",
+            ("[]", user_id, scenario_set_id, n_scenarios > 1),
+        ).scalar()
+        product_codes = [row[0] for row in con.exec_driver_sql("SELECT DISTINCT Product_Code FROM Policies WHERE UserID = ?", (user_id,))]
+
+    plan = user_function(durable_blueprints.PlanCalculationBatches)({
+        "job_id": job_id, "product_codes": product_codes, "user_id": user_id,
+        "scenarioId": scenario_set_id, "runStochastic": n_scenarios > 1,
+    })
+    run_engine = user_function(durable_blueprints.RunCalculationEngine)
+    calls = [
+        (lambda batch=batch: run_engine({
+            "job_id": job_id, "product_code": batch["product_code"], "user_id": user_id,
+            "policy_range": batch["policy_range"], "scenario_range": batch["scenario_range"],
+            "n_scenarios": plan["n_scenarios"], "scenarioId": scenario_set_id, "runStochastic": n_scenarios > 1,
+        }))
+        for batch in plan["batches"]
+    ]
+    with engine.connect() as con:
+        n_policies = con.exec_driver_sql("SELECT COUNT(*) FROM Policies WHERE UserID = ?", (user_id,)).scalar()
+    return measure(calls, n_policies * plan["n_scenarios"], "policy-scenarios")
+
+
+def read_cases(function_app, user_id: str, policy_set_id: int, repeats: int) -> dict:
+    """Times the policy grid (first page and a deep keyset page), product codes and set listing endpoints."""
+    get_policies = user_function(function_app.http_get_policies)
+    first_page = get_policies(request(user_id, "policies", {"setId": str(policy_set_id), "limit": "1000"}))
+    check_response(first_page)
+    cursor = first_page.headers.get("X-Next-Cursor")
+
+    endpoints = {
+        "read_policies_first_page": (get_policies, "policies", {"setId": str(policy_set_id), "limit": "1000"}),
+        "read_policies_arrow_page": (get_policies, "policies", {"setId": str(policy_set_id), "limit": "1000", "format": "arrow"}),
+        "read_product_codes": (user_function(function_app.http_get_product_codes_for_sets), "product-codes", {"setIds": str(policy_set_id)}),
+        "list_policy_sets": (user_function(function_app.http_list_policy_sets), "policy-sets", {}),
+    }
+    if cursor:
+        endpoints["read_policies_next_page"] = (get_policies, "policies", {"setId": str(policy_set_id), "limit": "1000", "cursor": cursor})
+
+    results = {}
+    for name, (endpoint, route, params) in endpoints.items():
+        calls = [lambda: check_response(endpoint(request(user_id, route, params)))] * repeats
+        results[name] = measure(calls, repeats, "requests")
+    return results
+
+
+def run(profile: dict) -> dict:
+    shutil.rmtree(WORK_DIR, ignore_errors=True)
+    engine = local_stand_in.install(WORK_DIR)
+    import durable_blueprints
+    import function_app
+
+    cases = {}
+    scenario_sets = {}
+    for n_scenarios in profile["scenarios"]:
+        df = generators.scenarios_frame(n_scenarios, profile["months"], seed=n_scenarios)
+        cases[f"ingest_scenarios/{n_scenarios}"], scenario_sets[n_scenarios] = ingest_case(
+            function_app, engine, "scenarios", f"bench-scenarios-{n_scenarios}", df
+        )
+        logging.info(f"Ingested {n_scenarios} scenarios x {profile['months']} months.")
+
+    for n_policies in profile["policies"]:
+        # One user per policy count, so the engine only sees that user's set
+        user_id = f"bench-policies-{n_policies}"
+        cases[f"ingest_policies/{n_policies}"], policy_set_id = ingest_case(
+            function_app, engine, "policies", user_id, generators.policies_frame(n_policies, seed=n_policies, id_prefix=f"P{n_policies}-")
+        )
+        for n_scenarios, scenario_set_id in scenario_sets.items():
+            cases[f"engine/{n_policies}x{n_scenarios}"] = engine_case(durable_blueprints, engine, user_id, scenario_set_id, n_scenarios)
+            logging.info(f"Ran engine over {n_policies} policies x {n_scenarios} scenarios.")
+        for name, result in read_cases(function_app, user_id, policy_set_id, profile["read_repeats"]).items():
+            cases[f"{name}/{n_policies}"] = result
+
+    return {
+        "version": BASELINE_VERSION,
+        "profile": profile,
+        "environment": {"python": platform.python_version(), "machine": platform.machine(), "numpy": np.__version__},
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0,
+        "cases": cases,
+    }
+
+
+def compare(current: dict, baseline: dict, tolerance: float) -> list:
+    """Returns a description of every compared metric that is worse than the baseline by more than tolerance."""
+    regressions = []
+    for name, base in baseline.get("cases", {}).items():
+        result = current["cases"].get(name)
+        if result is None:
+            continue
+        for metric, higher_is_better in COMPARED_METRICS.items():
+            old, new = base.get(metric), result.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            if (-change if higher_is_better else change) > tolerance:
+                regressions.append(f"{name} {metric}: {old:,.2f} -> {new:,.2f} ({change:+.0%})")
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--profile", choices=PROFILES, default="ci")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--baseline", help="compare against this baseline JSON")
+    parser.add_argument("--tolerance", type=float, default=0.30, help="allowed relative regression per metric (default 0.30)")
+    parser.add_argument("--update-baseline", action="store_true", help="overwrite --baseline with this run")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    # The function bodies log every request; keep the benchmark output readable
+    logging.getLogger().setLevel(logging.WARNING)
+    current = run(PROFILES[args.profile])
+
+    print(f"{'case':40} {'throughput':>16} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10} {'peak MB':>9}")
+    for name, result in current["cases"].items():
+        throughput = f"{result['throughput']:,.0f} {result['unit']}/s" if result["throughput"] else "-"
+        print(f"{name:40} {throughput:>16} {result['p50_ms']:10.1f} {result['p95_ms']:10.1f} {result['p99_ms']:10.1f} {result['peak_mb']:9.1f}")
+    print(f"Process peak RSS: {current['peak_rss_mb']:,.0f} MB")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(current, f, indent=2)
+    if args.baseline and args.update_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(current, f, indent=2)
+        return 0
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("profile") != current["profile"]:
+            print("Baseline was recorded with a different profile; not comparing.")
+            return 0
+        regressions = compare(current, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
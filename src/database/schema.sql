@@ -177,4 +177,254 @@ GO
 
 IF NOT EXISTS (SELECT * FROM sys.columns WHERE Name = N'RecordCount' AND Object_ID = Object_ID(N'PolicySets'))
     ALTER TABLE PolicySets ADD RecordCount INT DEFAULT 0;   
-GO
\ No newline at end of file
+GO
+
+-- Streaming ingestion: sets are created up front and report load progress
+IF NOT EXISTS (SELECT * FROM sys.columns WHERE Name = N'IngestStatus' AND Object_ID = Object_ID(N'PolicySets'))
+    ALTER TABLE PolicySets ADD IngestStatus NVARCHAR(20) DEFAULT 'Ready';
+IF NOT EXISTS (SELECT * FROM sys.columns WHERE Name = N'RowsLoaded' AND Object_ID = Object_ID(N'PolicySets'))
+    ALTER TABLE PolicySets ADD RowsLoaded INT DEFAULT 0;
+IF NOT EXISTS (SELECT * FROM sys.columns WHERE Name = N'IngestStatus' AND Object_ID = Object_ID(N'ScenarioSets'))
+    ALTER TABLE ScenarioSets ADD IngestStatus NVARCHAR(20) DEFAULT 'Ready';
+IF NOT EXISTS (SELECT * FROM sys.columns WHERE Name = N'RowsLoaded' AND Object_ID = Object_ID(N'ScenarioSets'))
+    ALTER TABLE ScenarioSets ADD RowsLoaded INT DEFAULT 0;
+IF NOT EXISTS (SELECT * FROM sys.columns WHERE Name = N'RecordCount' AND Object_ID = Object_ID(N'ScenarioSets'))
+    ALTER TABLE ScenarioSets ADD RecordCount INT DEFAULT 0;
+GO
+
+-- Ingest validation: rows that fail are quarantined instead of loaded (see validation.py)
+IF NOT EXISTS (SELECT * FROM sys.columns WHERE Name = N'RowsRejected' AND Object_ID = Object_ID(N'PolicySets'))
+    ALTER TABLE PolicySets ADD RowsRejected INT DEFAULT 0;
+IF NOT EXISTS (SELECT * FROM sys.columns WHERE Name = N'RowsRejected' AND Object_ID = Object_ID(N'ScenarioSets'))
+    ALTER TABLE ScenarioSets ADD RowsRejected INT DEFAULT 0;
+GO
+
+
+-- Keyset pagination of the policy grid (/policies): seek on (set, sort key, Policy_ID)
+IF NOT EXISTS (SELECT * FROM sys.indexes WHERE name = N'IX_Policies_UserSet_PolicyID' AND object_id = OBJECT_ID(N'Policies'))
+    CREATE NONCLUSTERED INDEX IX_Policies_UserSet_PolicyID ON Policies (UserID, PolicySetID, Policy_ID);
+IF NOT EXISTS (SELECT * FROM sys.indexes WHERE name = N'IX_Policies_UserSet_Product' AND object_id = OBJECT_ID(N'Policies'))
+    CREATE NONCLUSTERED INDEX IX_Policies_UserSet_Product ON Policies (UserID, PolicySetID, Product_Code, Policy_ID);
+GO
+
+
+-- Content hashes for result memoization (cleared on PolicySets when a policy is edited)
+IF NOT EXISTS (SELECT * FROM sys.columns WHERE Name = N'ContentHash' AND Object_ID = Object_ID(N'PolicySets'))
+    ALTER TABLE PolicySets ADD ContentHash CHAR(64);
+IF NOT EXISTS (SELECT * FROM sys.columns WHERE Name = N'ContentHash' AND Object_ID = Object_ID(N'ScenarioSets'))
+    ALTER TABLE ScenarioSets ADD ContentHash CHAR(64);
+GO
+
+-- Product-level results keyed by (policy hashes, scenario hash, product, options, engine version)
+IF NOT EXISTS (SELECT * FROM sysobjects WHERE name='ResultCache' and xtype='U')
+BEGIN
+    CREATE TABLE ResultCache (
+        CacheKey CHAR(64) NOT NULL PRIMARY KEY,
+        Product_Code NVARCHAR(50) NOT NULL,
+        EngineVersion NVARCHAR(20) NOT NULL,
+        Aggregate NVARCHAR(MAX) NOT NULL, -- JSON partial aggregate (see aggregation.py)
+        CreatedTimestamp DATETIME DEFAULT GETDATE()
+    );
+END
+GO
+
+-- Per-product outcome of each job, including whether it came from the result cache
+IF NOT EXISTS (SELECT * FROM sysobjects WHERE name='JobProductResults' and xtype='U')
+BEGIN
+    CREATE TABLE JobProductResults (
+        JobID INT NOT NULL FOREIGN KEY REFERENCES CalculationJobs(JobID),
+        Product_Code NVARCHAR(50) NOT NULL,
+        Reserve DECIMAL(18, 2) NOT NULL,
+        CacheHit BIT NOT NULL,
+        PRIMARY KEY (JobID, Product_Code)
+    );
+END
+GO
+
+
+-- Delta recalculation: jobs remember their inputs and keep each product's per-scenario aggregate
+IF NOT EXISTS (SELECT * FROM sys.columns WHERE Name = N'ScenarioSetID' AND Object_ID = Object_ID(N'CalculationJobs'))
+    ALTER TABLE CalculationJobs ADD ScenarioSetID INT;
+IF NOT EXISTS (SELECT * FROM sys.columns WHERE Name = N'RunStochastic' AND Object_ID = Object_ID(N'CalculationJobs'))
+    ALTER TABLE CalculationJobs ADD RunStochastic BIT;
+IF NOT EXISTS (SELECT * FROM sys.columns WHERE Name = N'Aggregate' AND Object_ID = Object_ID(N'JobProductResults'))
+    ALTER TABLE JobProductResults ADD Aggregate NVARCHAR(MAX); -- JSON partial aggregate (see aggregation.py)
+GO
+
+-- Audit trail of policy edits applied to completed jobs without a rerun
+IF NOT EXISTS (SELECT * FROM sysobjects WHERE name='PolicyDeltas' and xtype='U')
+BEGIN
+    CREATE TABLE PolicyDeltas (
+        DeltaID INT IDENTITY(1,1) PRIMARY KEY,
+        JobID INT NOT NULL FOREIGN KEY REFERENCES CalculationJobs(JobID),
+        Policy_ID NVARCHAR(50) NOT NULL,
+        Product_Code NVARCHAR(50) NOT NULL,
+        Delta_Reserve DECIMAL(18, 2) NOT NULL, -- change in the mean reserve
+        CreatedTimestamp DATETIME DEFAULT GETDATE()
+    );
+END
+GO
+
+-- Index of each job's columnar result files (see result_store.py)
+IF NOT EXISTS (SELECT * FROM sysobjects WHERE name='JobResultFiles' and xtype='U')
+BEGIN
+    CREATE TABLE JobResultFiles (
+        JobID INT NOT NULL FOREIGN KEY REFERENCES CalculationJobs(JobID),
+        Path NVARCHAR(400) NOT NULL, -- blob name in the 'results' container
+        Kind NVARCHAR(20) NOT NULL, -- 'policies' or 'scenarios'
+        Row_Count INT NOT NULL,
+        Byte_Count BIGINT NOT NULL,
+        CreatedTimestamp DATETIME DEFAULT GETDATE(),
+        PRIMARY KEY (JobID, Path)
+    );
+END
+GO
+
+-- Timing spans per activity, batch and phase (see telemetry.py)
+IF NOT EXISTS (SELECT * FROM sysobjects WHERE name='JobMetrics' and xtype='U')
+BEGIN
+    CREATE TABLE JobMetrics (
+        MetricID BIGINT IDENTITY(1,1) PRIMARY KEY,
+        JobID INT NOT NULL FOREIGN KEY REFERENCES CalculationJobs(JobID),
+        Activity NVARCHAR(100) NOT NULL,
+        Batch NVARCHAR(400), -- product|policy range|scenario range, NULL for job-level activities
+        Phase NVARCHAR(50) NOT NULL, -- e.g. 'load_policies', 'compute', 'write_results'
+        Started DATETIME2 NOT NULL, -- UTC
+        Duration_Ms FLOAT NOT NULL,
+        Row_Count BIGINT,
+        Byte_Count BIGINT,
+        Peak_RSS_MB FLOAT
+    );
+    CREATE NONCLUSTERED INDEX IX_JobMetrics_Job ON JobMetrics (JobID, Started);
+END
+GO
+
+-- Per-set summaries filled during ingest (see set_summaries.py), read by the set listings,
+-- /product-codes and the batch planner instead of aggregating over Policies / EconomicScenarios
+IF NOT EXISTS (SELECT * FROM sysobjects WHERE name='PolicySetProducts' and xtype='U')
+BEGIN
+    CREATE TABLE PolicySetProducts (
+        PolicySetID INT NOT NULL FOREIGN KEY REFERENCES PolicySets(PolicySetID),
+        Product_Code NVARCHAR(50) NOT NULL,
+        PolicyCount INT NOT NULL,
+        AccountValueTotal DECIMAL(38, 2) NOT NULL,
+        PRIMARY KEY (PolicySetID, Product_Code)
+    );
+    -- Backfill sets loaded before the summaries existed
+    INSERT INTO PolicySetProducts (PolicySetID, Product_Code, PolicyCount, AccountValueTotal)
+    SELECT PolicySetID, Product_Code, COUNT(*), SUM(Account_Value) FROM Policies
+    WHERE PolicySetID IS NOT NULL GROUP BY PolicySetID, Product_Code;
+END
+GO
+IF NOT EXISTS (SELECT * FROM sys.columns WHERE Name = N'ScenarioCount' AND Object_ID = Object_ID(N'ScenarioSets'))
+    ALTER TABLE ScenarioSets ADD ScenarioCount INT, MonthCount INT;
+GO
+UPDATE s SET ScenarioCount = c.ScenarioCount, MonthCount = c.MonthCount
+FROM ScenarioSets s JOIN (
+    SELECT ScenarioSetID, COUNT(DISTINCT ScenarioID) AS ScenarioCount, COUNT(DISTINCT Month) AS MonthCount
+    FROM EconomicScenarios GROUP BY ScenarioSetID
+) c ON c.ScenarioSetID = s.ScenarioSetID
+WHERE s.ScenarioCount IS NULL;
+GO
+
+-- Covering indexes for the engine's reads and the UI listings
+-- Batch policy loads and batch boundaries (SELECT_POLICIES_FOR_BATCH, SELECT_POLICY_BATCH_STARTS)
+IF NOT EXISTS (SELECT * FROM sys.indexes WHERE name = N'IX_Policies_User_Product' AND object_id = OBJECT_ID(N'Policies'))
+    CREATE NONCLUSTERED INDEX IX_Policies_User_Product ON Policies (UserID, Product_Code, Policy_ID)
+    INCLUDE (Account_Value, Guaranteed_Crediting_Rate, GLWB_Benefit_Base, GLWB_Withdrawal_Rate);
+-- Scenario loads by set, until PK_EconomicScenarios (below) replaces the key that led with ScenarioID
+IF NOT EXISTS (SELECT * FROM sys.indexes WHERE name = N'IX_EconomicScenarios_Set' AND object_id = OBJECT_ID(N'EconomicScenarios'))
+    AND NOT EXISTS (SELECT * FROM sys.key_constraints WHERE name = N'PK_EconomicScenarios' AND parent_object_id = OBJECT_ID(N'EconomicScenarios'))
+    CREATE NONCLUSTERED INDEX IX_EconomicScenarios_Set ON EconomicScenarios (ScenarioSetID, ScenarioID, Month)
+    INCLUDE (Rate_0_25_yr, Rate_0_5_yr, Rate_1_yr, Rate_2_yr, Rate_3_yr, Rate_5_yr, Rate_7_yr, Rate_10_yr, Rate_20_yr, Rate_30_yr);
+-- /policy-sets, /scenario-sets and /jobs listings
+IF NOT EXISTS (SELECT * FROM sys.indexes WHERE name = N'IX_PolicySets_User' AND object_id = OBJECT_ID(N'PolicySets'))
+    CREATE NONCLUSTERED INDEX IX_PolicySets_User ON PolicySets (UserID, UploadTimestamp DESC)
+    INCLUDE (SetName, RecordCount, RowsRejected, ContentHash);
+IF NOT EXISTS (SELECT * FROM sys.indexes WHERE name = N'IX_ScenarioSets_User' AND object_id = OBJECT_ID(N'ScenarioSets'))
+    CREATE NONCLUSTERED INDEX IX_ScenarioSets_User ON ScenarioSets (UserID, CreatedTimestamp DESC)
+    INCLUDE (SetName, Granularity, ScenarioCount, MonthCount);
+IF NOT EXISTS (SELECT * FROM sys.indexes WHERE name = N'IX_CalculationJobs_User' AND object_id = OBJECT_ID(N'CalculationJobs'))
+    CREATE NONCLUSTERED INDEX IX_CalculationJobs_User ON CalculationJobs (UserID, JobID DESC)
+    INCLUDE (Job_Status, Requested_Timestamp);
+GO
+
+-- Per-user listing versions behind the ETags of /jobs, /policy-sets and /scenario-sets (see user_versions.py)
+IF NOT EXISTS (SELECT * FROM sysobjects WHERE name='UserVersions' and xtype='U')
+BEGIN
+    CREATE TABLE UserVersions (
+        UserID NVARCHAR(100) NOT NULL,
+        Scope NVARCHAR(20) NOT NULL, -- 'jobs', 'policy-sets' or 'scenario-sets'
+        Version BIGINT NOT NULL,
+        PRIMARY KEY (UserID, Scope)
+    );
+END
+GO
+
+-- Resumable jobs: the batch plan is kept on the job and each completed batch checkpoints its
+-- partial aggregate, so retries and resumed jobs skip finished batches
+IF NOT EXISTS (SELECT * FROM sys.columns WHERE Name = N'Compression' AND Object_ID = Object_ID(N'CalculationJobs'))
+    ALTER TABLE CalculationJobs ADD Compression BIT;
+IF NOT EXISTS (SELECT * FROM sys.columns WHERE Name = N'BatchPlan' AND Object_ID = Object_ID(N'CalculationJobs'))
+    ALTER TABLE CalculationJobs ADD BatchPlan NVARCHAR(MAX); -- JSON PlanCalculationBatches output
+GO
+IF NOT EXISTS (SELECT * FROM sysobjects WHERE name='JobBatchCheckpoints' and xtype='U')
+BEGIN
+    CREATE TABLE JobBatchCheckpoints (
+        JobID INT NOT NULL FOREIGN KEY REFERENCES CalculationJobs(JobID),
+        Batch NVARCHAR(400) NOT NULL, -- product|policy range|scenario range, as in JobMetrics
+        Aggregate NVARCHAR(MAX) NOT NULL, -- JSON partial aggregate (see aggregation.py)
+        CreatedTimestamp DATETIME DEFAULT GETDATE(),
+        PRIMARY KEY (JobID, Batch)
+    );
+END
+GO
+
+-- Batched sensitivities: the job's validated sensitivity list, each valued in the same pass as the
+-- base run and stored in Results as Result_Type 'Sensitivity_{name}'
+IF NOT EXISTS (SELECT * FROM sys.columns WHERE Name = N'Sensitivities' AND Object_ID = Object_ID(N'CalculationJobs'))
+    ALTER TABLE CalculationJobs ADD Sensitivities NVARCHAR(MAX); -- JSON [{"name", "kind", "shift"}]
+GO
+
+-- Policy edits bump EditVersion; a policy set's snapshot marker records the EditVersion it was
+-- written at, so the engine reads only stale sets from SQL until their snapshot is rebuilt
+IF NOT EXISTS (SELECT * FROM sys.columns WHERE Name = N'EditVersion' AND Object_ID = Object_ID(N'PolicySets'))
+    ALTER TABLE PolicySets ADD EditVersion INT NOT NULL DEFAULT 0;
+GO
+
+-- When a set was last edited and since when it has had edits its snapshot doesn't include; snapshot
+-- rebuilds wait for a set's edits to settle (SnapshotRebuildQuietSeconds / SnapshotRebuildMaxWaitSeconds)
+IF NOT EXISTS (SELECT * FROM sys.columns WHERE Name = N'LastEditTimestamp' AND Object_ID = Object_ID(N'PolicySets'))
+    ALTER TABLE PolicySets ADD LastEditTimestamp DATETIME;
+GO
+IF NOT EXISTS (SELECT * FROM sys.columns WHERE Name = N'PendingEditSince' AND Object_ID = Object_ID(N'PolicySets'))
+    ALTER TABLE PolicySets ADD PendingEditSince DATETIME;
+GO
+
+-- Policy edits carry an ID that is recorded with their delta, so a redelivered queue message is skipped
+IF NOT EXISTS (SELECT * FROM sys.columns WHERE Name = N'EditID' AND Object_ID = Object_ID(N'PolicyDeltas'))
+    ALTER TABLE PolicyDeltas ADD EditID NVARCHAR(64);
+GO
+IF NOT EXISTS (SELECT * FROM sys.indexes WHERE name = N'UX_PolicyDeltas_EditID' AND object_id = OBJECT_ID(N'PolicyDeltas'))
+    CREATE UNIQUE NONCLUSTERED INDEX UX_PolicyDeltas_EditID ON PolicyDeltas (EditID) WHERE EditID IS NOT NULL;
+GO
+
+-- ScenarioIDs are only unique within their set (every upload numbers its scenarios from 1), so
+-- EconomicScenarios is keyed on (ScenarioSetID, ScenarioID, Month) instead of (ScenarioID, Month),
+-- which failed the insert of any second set. The clustered key also serves the loads by set that
+-- IX_EconomicScenarios_Set did. Rows from before scenario sets have no set, and no read sees them.
+IF NOT EXISTS (SELECT * FROM sys.key_constraints WHERE name = N'PK_EconomicScenarios' AND parent_object_id = OBJECT_ID(N'EconomicScenarios'))
+BEGIN
+    DECLARE @drop_key NVARCHAR(400) = (
+        SELECT N'ALTER TABLE EconomicScenarios DROP CONSTRAINT ' + QUOTENAME(name) FROM sys.key_constraints
+        WHERE type = 'PK' AND parent_object_id = OBJECT_ID(N'EconomicScenarios')
+    );
+    IF @drop_key IS NOT NULL
+        EXEC sp_executesql @drop_key;
+    IF EXISTS (SELECT * FROM sys.indexes WHERE name = N'IX_EconomicScenarios_Set' AND object_id = OBJECT_ID(N'EconomicScenarios'))
+        DROP INDEX IX_EconomicScenarios_Set ON EconomicScenarios;
+    DELETE FROM EconomicScenarios WHERE ScenarioSetID IS NULL;
+    ALTER TABLE EconomicScenarios ALTER COLUMN ScenarioSetID INT NOT NULL;
+    ALTER TABLE EconomicScenarios ADD CONSTRAINT PK_EconomicScenarios PRIMARY KEY (ScenarioSetID, ScenarioID, Month);
+END
+GO
@@ -0,0 +1,145 @@
+import numpy as np
+
+# =================================================================
+#  MERGEABLE PARTIAL AGGREGATES
+# =================================================================
+# Each RunCalculationEngine batch covers a policy range and a scenario range
+# and returns a plain dict (activity outputs must be JSON serialisable).
+# Partials from different policy ranges add up scenario by scenario;
+# partials from different scenario ranges fill different slots of the
+# per-scenario vector. Merging is order-independent, so it is safe to run
+# inside the orchestrator on replay.
+#
+# A partial only ever holds one running sum per scenario, never a value per
+# policy and scenario, so the stochastic tail statistics below are computed
+# from the merged per-scenario vector with a partial (top-k) selection.
+#
+# Compressed runs (see compression.py) also carry the number of model points
+# and a [seriatim, compressed] reserve pair from the batch's validation
+# sample; both add up across batches like the counts above. Jobs with
+# sensitivities (see sensitivities.py) carry one more per-scenario vector
+# per sensitivity, merged like scenario_reserves.
+
+# VM-22 stochastic reserve: CTE(70) is the mean of the worst 30% of scenario results
+CTE_LEVEL = 0.70
+PERCENTILES = (50, 90, 95, 99)
+
+
+def partial_aggregate(scenario_start: int, scenario_reserves, policy_count: int, account_value: float,
+                      model_points: int = None, validation=None, sensitivities: dict = None) -> dict:
+    """Packs one batch's results into a mergeable partial aggregate."""
+    partial = {
+        "scenario_start": int(scenario_start),
+        "scenario_reserves": [float(v) for v in scenario_reserves],
+        "policy_count": int(policy_count),
+        "account_value": float(account_value),
+        "batches": 1,
+    }
+    if model_points is not None:
+        partial["model_points"] = int(model_points)
+        partial["validation"] = [float(v) for v in (validation or [0.0, 0.0])]
+    if sensitivities:
+        partial["sensitivities"] = {name: [float(v) for v in values] for name, values in sensitivities.items()}
+    return partial
+
+
+def empty_aggregate(n_scenarios: int) -> dict:
+    return {
+        "scenario_start": 0,
+        "scenario_reserves": [0.0] * n_scenarios,
+        "policy_count": 0,
+        "account_value": 0.0,
+        "batches": 0,
+    }
+
+
+def merge_partials(partials, n_scenarios: int) -> dict:
+    """Merges partial aggregates into one covering scenarios [0, n_scenarios)."""
+    scenario_reserves = np.zeros(n_scenarios)
+    sensitivities = {}
+    merged = empty_aggregate(0)
+    for partial in partials:
+        start = partial["scenario_start"]
+        values = partial["scenario_reserves"]
+        scenario_reserves[start:start + len(values)] += values
+        for name, sensitivity_values in partial.get("sensitivities", {}).items():
+            sensitivities.setdefault(name, np.zeros(n_scenarios))[start:start + len(sensitivity_values)] += sensitivity_values
+        # Every policy range is run once per scenario range; only count its policies once
+        if start == 0:
+            merged["policy_count"] += partial["policy_count"]
+            merged["account_value"] += partial["account_value"]
+            if "model_points" in partial:
+                merged["model_points"] = merged.get("model_points", 0) + partial["model_points"]
+        if "validation" in partial:
+            seriatim, compressed = merged.get("validation", [0.0, 0.0])
+            merged["validation"] = [seriatim + partial["validation"][0], compressed + partial["validation"][1]]
+        merged["batches"] += partial["batches"]
+    merged["scenario_reserves"] = scenario_reserves.tolist()
+    if sensitivities:
+        merged["sensitivities"] = {name: values.tolist() for name, values in sensitivities.items()}
+    return merged
+
+
+def mean_reserve(aggregate: dict) -> float:
+    """Reserve averaged over scenarios (the single scenario's value for deterministic runs)."""
+    values = aggregate["scenario_reserves"]
+    return float(np.mean(values)) if values else 0.0
+
+
+def tail_size(n_scenarios: int, level: float = CTE_LEVEL) -> int:
+    """Number of scenarios in the CTE tail: the worst ceil((1 - level) * n), at least one."""
+    return max(1, int(np.ceil(round((1.0 - level) * n_scenarios, 9))))
+
+
+def top_scenarios(aggregate: dict, k: int) -> list:
+    """The k largest-reserve scenarios as [scenario index, reserve] pairs, worst first."""
+    values = np.asarray(aggregate["scenario_reserves"])
+    k = min(k, len(values))
+    if k == 0:
+        return []
+    # argpartition selects the tail in O(S); only the k selected values are sorted
+    top = np.argpartition(values, len(values) - k)[len(values) - k:]
+    top = top[np.argsort(-values[top], kind="stable")]
+    return [[int(i), float(values[i])] for i in top]
+
+
+def cte(aggregate: dict, level: float = CTE_LEVEL) -> float:
+    """Conditional tail expectation: the mean reserve over the worst (1 - level) of scenarios."""
+    values = aggregate["scenario_reserves"]
+    if not values:
+        return 0.0
+    tail = top_scenarios(aggregate, tail_size(len(values), level))
+    return float(np.mean([reserve for _, reserve in tail]))
+
+
+def result_rows(aggregate: dict) -> dict:
+    """
+    The Results rows ({Result_Type: Result_Value}) derived from a job's merged aggregate.
+
+    Stochastic runs (more than one scenario) add CTE_70 and the Percentile_* rows; compressed
+    runs add the policies per model point and the validation sample's relative error in bps,
+    and each sensitivity adds its mean reserve as Sensitivity_{name}.
+    """
+    rows = {"Aggregated_Reserve": mean_reserve(aggregate)}
+    values = aggregate["scenario_reserves"]
+    if len(values) > 1:
+        rows[f"CTE_{round(CTE_LEVEL * 100)}"] = cte(aggregate)
+        for q, value in zip(PERCENTILES, np.percentile(values, PERCENTILES)):
+            rows[f"Percentile_{q}"] = float(value)
+    if aggregate.get("model_points"):
+        rows["Compression_Ratio"] = aggregate["policy_count"] / aggregate["model_points"]
+        seriatim, compressed = aggregate.get("validation", [0.0, 0.0])
+        if seriatim:
+            rows["Compression_Error_Bps"] = (compressed - seriatim) / abs(seriatim) * 10_000
+    for name, values in aggregate.get("sensitivities", {}).items():
+        rows[f"Sensitivity_{name}"] = float(np.mean(values)) if values else 0.0
+    return rows
+
+
+def split_range(total: int, max_size: int) -> list:
+    """Splits [0, total) into the fewest near-equal [start, stop) ranges of at most max_size."""
+    if total <= 0:
+        return []
+    n_parts = -(-total // max_size)
+    bounds = np.linspace(0, total, n_parts + 1).round().astype(int)
+    return [[int(a), int(b)] for a, b in zip(bounds[:-1], bounds[1:])]
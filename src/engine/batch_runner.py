@@ -0,0 +1,247 @@
+"""
+Command-line batch mode for the calculation pipeline.
+
+Runs the same steps as CalculationOrchestrator (create job, plan batches, run every
+batch, save results) outside the Functions host, fanning the batches out over a
+local process pool. The scenario set's discount factors are loaded once and shared
+with the worker processes through shared memory; results go through the same
+activities, so they land in the same tables and result store as a durable run.
+
+    python batch_runner.py --user USER_ID --scenario-set 12 --stochastic --workers 16
+    python batch_runner.py --user USER_ID --scenario-set 12 --stochastic --compress
+    python batch_runner.py --user USER_ID --scenario-set 12 --dry-run
+    python batch_runner.py --user USER_ID --scenario-set 12 --profile engine.prof
+    python batch_runner.py --user USER_ID --resume 345
+    python batch_runner.py --user USER_ID --scenario-set 12 --stochastic --sensitivity rate:+0.01 --sensitivity lapse:0.05:lapse5
+
+--dry-run only plans and prints the batches (nothing is written). --profile runs the
+batches serially in this process under cProfile, writes the stats to the given file
+and prints the hottest functions. --resume reruns a failed job under its saved batch
+plan and its own products, scenario set and options (flags that contradict them are
+rejected); batches it checkpointed before failing are not run again. --sensitivity (repeatable,
+KIND:SHIFT[:NAME]) values a shifted assumption alongside the base run (see sensitivities.py).
+"""
+import argparse
+import cProfile
+import io
+import json
+import logging
+import multiprocessing
+import os
+import pstats
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+import aggregation
+import curves
+import db
+import durable_blueprints
+import sensitivities
+import user_versions
+
+# Worker-process state: the attached shared-memory block must outlive the views into it
+_shared_block = None
+
+
+def activity(name: str):
+    """The plain Python function behind a blueprint activity."""
+    return getattr(durable_blueprints, name)._function.get_user_function()
+
+
+def share_scenarios(scenario_set_id: int):
+    """Copies a scenario set's discount factors into a new shared-memory block; returns (block, descriptor)."""
+    discount = curves.discount_factors(scenario_set_id)
+    block = shared_memory.SharedMemory(create=True, size=max(discount.nbytes, 1))
+    np.ndarray(discount.shape, dtype=discount.dtype, buffer=block.buf)[:] = discount
+    descriptor = {"scenario_set_id": int(scenario_set_id), "name": block.name, "shape": discount.shape, "dtype": discount.dtype.str}
+    return block, descriptor
+
+
+def attach_scenarios(descriptor: dict):
+    """Process pool initializer: seeds this worker's curve tables with a read-only view of the shared discount factors."""
+    global _shared_block
+    logging.basicConfig(level=logging.WARNING)
+    _shared_block = shared_memory.SharedMemory(name=descriptor["name"])
+    discount = np.ndarray(tuple(descriptor["shape"]), dtype=np.dtype(descriptor["dtype"]), buffer=_shared_block.buf)
+    discount.flags.writeable = False
+    curves.put(descriptor["scenario_set_id"], discount)
+
+
+def run_batch(engine_input: dict) -> dict:
+    return activity("RunCalculationEngine")(engine_input)
+
+
+def engine_inputs(job_id, user_id: str, scenario_set_id: int, run_stochastic: bool, plan: dict, compression: bool = False,
+                  sensitivity_list: list = None) -> list:
+    """The RunCalculationEngine inputs for every planned batch, as the orchestrator builds them."""
+    return [{
+        "job_id": job_id,
+        "product_code": batch["product_code"],
+        "user_id": user_id,
+        "policy_range": batch["policy_range"],
+        "scenario_range": batch["scenario_range"],
+        "n_scenarios": plan["n_scenarios"],
+        "scenarioId": scenario_set_id,
+        "runStochastic": run_stochastic,
+        "compression": compression,
+        "sensitivities": sensitivity_list or [],
+    } for batch in plan["batches"]]
+
+
+def load_job(job_id: int, user_id: str):
+    """The user's job row as SELECT_JOB_FOR_RESUME reads it, or None."""
+    with db.connect() as con:
+        return con.execute(db.SELECT_JOB_FOR_RESUME, {"jid": job_id, "uid": user_id}).mappings().fetchone()
+
+
+def resume_conflicts(args, job) -> list:
+    """The command-line options that contradict the job being resumed, which reruns with its own."""
+    conflicts = []
+    if args.scenario_set is not None and args.scenario_set != job["ScenarioSetID"]:
+        conflicts.append(f"--scenario-set {args.scenario_set} (the job ran against {job['ScenarioSetID']})")
+    if args.stochastic and not job["RunStochastic"]:
+        conflicts.append("--stochastic (the job is deterministic)")
+    if args.compress and not job["Compression"]:
+        conflicts.append("--compress (the job is seriatim)")
+    if args.sensitivity and args.sensitivity != json.loads(job["Sensitivities"] or "[]"):
+        conflicts.append("--sensitivity (the job has its own sensitivities)")
+    if args.products and set(product_list(args.products)) != set(json.loads(job["Product_Code"])):
+        conflicts.append(f"--products (the job covers {', '.join(json.loads(job['Product_Code']))})")
+    return conflicts
+
+
+def resume_job(job_id: int, user_id: str) -> bool:
+    """Sets a failed job of the user back to Pending; False if it isn't a failed job."""
+    with db.connect() as con:
+        if not con.execute(db.RESUME_JOB, {"jobid": job_id}).rowcount:
+            return False
+        user_versions.bump(con, user_id, user_versions.JOBS)
+        con.commit()
+    return True
+
+
+def product_list(value: str) -> list:
+    return [code.strip() for code in value.split(",") if code.strip()]
+
+
+def sensitivity_arg(value: str) -> dict:
+    """Parses a --sensitivity KIND:SHIFT[:NAME] argument."""
+    kind, _, rest = value.partition(":")
+    shift, _, name = rest.partition(":")
+    try:
+        return sensitivities.parse([{"kind": kind, "shift": shift, "name": name or None}])[0]
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def run_pool(inputs: list, scenario_set_id: int, workers: int) -> list:
+    block, descriptor = share_scenarios(scenario_set_id)
+    try:
+        # spawn: workers must not inherit the parent's pooled ODBC connections
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=attach_scenarios, initargs=(descriptor,)) as pool:
+            return list(pool.map(run_batch, inputs))
+    finally:
+        block.close()
+        block.unlink()
+
+
+def run_profiled(inputs: list, profile_path: str) -> list:
+    profiler = cProfile.Profile()
+    results = profiler.runcall(lambda: [run_batch(engine_input) for engine_input in inputs])
+    profiler.dump_stats(profile_path)
+    report = io.StringIO()
+    pstats.Stats(profiler, stream=report).sort_stats("cumulative").print_stats(25)
+    print(report.getvalue())
+    return results
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--user", required=True, help="UserID whose policies are valued")
+    parser.add_argument("--scenario-set", type=int, help="ScenarioSetID to run against (a resumed job's by default)")
+    parser.add_argument("--products", help="comma-separated product codes (default: all of the user's products)")
+    parser.add_argument("--stochastic", action="store_true", help="run every scenario instead of the first (deterministic) path")
+    parser.add_argument("--compress", action="store_true", help="project model points instead of seriatim policies (see compression.py)")
+    parser.add_argument("--sensitivity", type=sensitivity_arg, action="append", default=[], metavar="KIND:SHIFT[:NAME]",
+                        help=f"also value a shifted assumption, KIND one of {', '.join(sensitivities.KINDS)} (repeatable)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="worker processes (default: one per core)")
+    parser.add_argument("--resume", type=int, metavar="JOB_ID", help="rerun a failed job, skipping the batches it completed")
+    parser.add_argument("--dry-run", action="store_true", help="plan and print the batches without running or writing anything")
+    parser.add_argument("--profile", metavar="PATH", help="run batches serially under cProfile and write the stats to PATH")
+    args = parser.parse_args(argv)
+    if args.resume is not None and args.dry_run:
+        parser.error("--resume and --dry-run can't be combined")
+    if args.resume is None and args.scenario_set is None:
+        parser.error("--scenario-set is required unless resuming a job")
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    job_id = args.resume
+    if job_id is not None:
+        job = load_job(job_id, args.user)
+        if job is None:
+            logging.error(f"Job {job_id} is not a job of user {args.user}.")
+            return 1
+        conflicts = resume_conflicts(args, job)
+        if conflicts:
+            parser.error(f"job {job_id} is resumed with its own settings; conflicting: {'; '.join(conflicts)}")
+        if not resume_job(job_id, args.user):
+            logging.error(f"Job {job_id} is {job['Job_Status']}; only failed jobs can be resumed.")
+            return 1
+        # A resumed job reruns exactly as it was created
+        product_codes = json.loads(job["Product_Code"])
+        scenario_set_id, run_stochastic, compress = job["ScenarioSetID"], bool(job["RunStochastic"]), bool(job["Compression"])
+        sensitivity_list = json.loads(job["Sensitivities"] or "[]")
+    else:
+        if args.products:
+            product_codes = product_list(args.products)
+        else:
+            with db.connect() as con:
+                product_codes = [row[0] for row in con.execute(db.COUNT_POLICIES_BY_PRODUCT, {"uid": args.user})]
+        scenario_set_id, run_stochastic, compress, sensitivity_list = args.scenario_set, args.stochastic, args.compress, args.sensitivity
+        if not args.dry_run:
+            job_id = activity("CreateCalculationJob")({
+                "product_codes": product_codes, "user_id": args.user,
+                "scenarioId": scenario_set_id, "runStochastic": run_stochastic, "compression": compress,
+                "sensitivities": sensitivity_list,
+            })
+    plan = activity("PlanCalculationBatches")({
+        "job_id": job_id, "product_codes": product_codes, "user_id": args.user,
+        "scenarioId": scenario_set_id, "runStochastic": run_stochastic, "compression": compress,
+        "sensitivities": sensitivity_list,
+    })
+    inputs = engine_inputs(job_id, args.user, scenario_set_id, run_stochastic, plan, compress, sensitivity_list)
+
+    if args.dry_run:
+        print(f"{len(inputs)} batch(es) over {plan['n_scenarios']} scenario(s); cached products: {sorted(plan['cached']) or 'none'}")
+        for engine_input in inputs:
+            print(f"  {engine_input['product_code']:20} policies {engine_input['policy_range']} scenarios {engine_input['scenario_range']}")
+        return 0
+
+    start = time.perf_counter()
+    try:
+        if args.profile:
+            results = run_profiled(inputs, args.profile)
+        else:
+            results = run_pool(inputs, scenario_set_id, max(1, args.workers))
+        result_data = durable_blueprints.final_results(job_id, plan, results)
+        activity("SaveFinalResults")(result_data)
+    except Exception:
+        logging.exception(f"Batch run for job {job_id} failed.")
+        activity("UpdateJobStatusToFailed")(job_id)
+        return 1
+
+    total = result_data["total"]
+    logging.info(
+        f"Job {job_id}: {len(inputs)} batches, {total['policy_count']} policies, "
+        f"reserve {aggregation.mean_reserve(total):,.2f} in {time.perf_counter() - start:,.1f}s."
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,83 @@
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+import policy_terms
+import projection
+
+# =================================================================
+#  MODEL-POINT COMPRESSION
+# =================================================================
+# Optional per job. Seriatim policies of a batch (one product) that share an issue-age band,
+# gender, duration, crediting rate and GLWB characteristics are collapsed
+# into one model point carrying the group's summed account value and
+# withdrawal. Within a group the kernel is linear except for the floor at a
+# zero account value, so grouping also by GLWB moneyness (AV / benefit base)
+# keeps policies that run out of money at similar times together.
+#
+# Every compressed batch also projects a fixed sample of its policies both
+# seriatim and compressed; the summed results give the job's measured
+# compression error.
+
+# Extra policy columns the grouping reads, on top of projection.POLICY_COLUMNS.
+# Riders come from the snapshot's parsed Rider_Mask; Rider_Codes covers sets read from SQL
+COLUMNS = ["Issue_Age", "Gender", "Issue_Date", "Valuation_Date", "Rider_Mask", "Rider_Codes"]
+AGE_BAND_YEARS = 5
+MONEYNESS_BAND = 0.1
+VALIDATION_SAMPLE = 1_000
+
+
+def model_point_keys(policies_df: pd.DataFrame) -> pd.DataFrame:
+    """The grouping key of every policy, one column per characteristic."""
+    def numeric(name):
+        return pd.to_numeric(policies_df[name], errors="coerce") if name in policies_df else pd.Series(np.nan, index=policies_df.index)
+
+    def text(name):
+        return policies_df[name].astype("string").fillna("") if name in policies_df else pd.Series("", index=policies_df.index)
+
+    issue_date = pd.to_datetime(policies_df.get("Issue_Date"), errors="coerce")
+    valuation_date = pd.to_datetime(policies_df.get("Valuation_Date"), errors="coerce")
+    benefit_base = numeric("GLWB_Benefit_Base")
+    return pd.DataFrame({
+        "age_band": (numeric("Issue_Age") // AGE_BAND_YEARS).fillna(-1).astype(int),
+        "gender": text("Gender"),
+        "duration": ((valuation_date - issue_date).dt.days // 365).fillna(-1).astype(int),
+        "crediting_rate": numeric("Guaranteed_Crediting_Rate").fillna(0.0).round(4),
+        "riders": policy_terms.rider_masks(policies_df),
+        "withdrawal_rate": numeric("GLWB_Withdrawal_Rate").fillna(0.0).round(4),
+        "moneyness": (numeric("Account_Value") / benefit_base.where(benefit_base > 0) // MONEYNESS_BAND).fillna(-1).astype(int),
+    }, index=policies_df.index)
+
+
+def compress(policies_df: pd.DataFrame):
+    """
+    Collapses policies into model points. Returns (kernel arrays, model point count);
+    the arrays have the same keys as projection.policy_arrays, one entry per model point.
+    """
+    arrays = projection.policy_arrays(policies_df)
+    keys = model_point_keys(policies_df)
+    codes = keys.groupby(list(keys.columns), sort=False).ngroup().to_numpy()
+    n_points = int(codes.max()) + 1 if len(codes) else 0
+    crediting_rate = np.zeros(n_points)
+    crediting_rate[codes] = arrays["crediting_rate"]
+    return {
+        "account_value": np.bincount(codes, weights=arrays["account_value"], minlength=n_points),
+        "crediting_rate": crediting_rate,
+        "withdrawal_amount": np.bincount(codes, weights=arrays["withdrawal_amount"], minlength=n_points),
+    }, n_points
+
+
+def validation_sample(policies_df: pd.DataFrame, seed: str) -> pd.DataFrame:
+    """A fixed sample of the batch (the same for every scenario range of a policy range)."""
+    if len(policies_df) <= VALIDATION_SAMPLE:
+        return policies_df
+    rng = np.random.default_rng(int.from_bytes(hashlib.sha1(seed.encode()).digest()[:8], "little"))
+    return policies_df.iloc[np.sort(rng.choice(len(policies_df), VALIDATION_SAMPLE, replace=False))]
+
+
+def validate(sample_df: pd.DataFrame, discount: np.ndarray) -> list:
+    """[seriatim, compressed] reserve of the sample, each summed over the scenarios in `discount`."""
+    seriatim = projection.project_reserves(projection.policy_arrays(sample_df), discount).sum()
+    compressed = projection.project_reserves(compress(sample_df)[0], discount).sum()
+    return [float(seriatim), float(compressed)]
@@ -0,0 +1,81 @@
+import io
+import logging
+import os
+
+import numpy as np
+
+import projection
+import snapshots
+from scenario_cache import load_scenarios, require_ready, scenario_cache
+
+# =================================================================
+#  PRECOMPUTED CURVE TABLES PER SCENARIO SET
+# =================================================================
+# Turning a scenario set's tenor rates into discount factors is the same
+# work for every batch of every job, so it is done once per ScenarioSetID,
+# right after ingest, and stored next to the set's snapshot:
+#
+#   snapshots/curves/{ScenarioSetID}/{CURVE_METHOD}/discount.npy   (scenario, month) cumulative discount factors
+#
+# The method is part of the path, so changing how curves are built (bump
+# CURVE_METHOD) makes every set rebuild on first use and nothing else
+# ever recomputes them. Workers download each table once, memory-map it and
+# keep it in the scenario cache's LRU (see scenario_cache.py).
+
+# Bump whenever the discounting below changes
+CURVE_METHOD = "linear-v1"
+# Scenarios discounted at a time while building, bounding the float64 temporaries
+BUILD_CHUNK_SCENARIOS = 256
+
+
+def curve_prefix(scenario_set_id) -> str:
+    return f"curves/{int(scenario_set_id)}/{CURVE_METHOD}"
+
+
+def _cache_key(scenario_set_id) -> tuple:
+    return ("discount", int(scenario_set_id))
+
+
+def build(scenario_set_id) -> np.ndarray:
+    """
+    Builds and uploads a set's discount factor table from its rates, a chunk of scenarios at a time; returns it.
+    Raises ValueError, uploading nothing, for a set that isn't Ready or has no scenarios.
+    """
+    # Checked here too: the rates may come from a cache filled before the set's status changed
+    require_ready(scenario_set_id)
+    _, scenario_rates = scenario_cache.get(scenario_set_id, load_scenarios)
+    if not scenario_rates.size:
+        raise ValueError(f"Scenario set {scenario_set_id} has no scenarios to build curve tables from")
+    discount = np.empty(scenario_rates.shape[:2])
+    for start in range(0, len(discount), BUILD_CHUNK_SCENARIOS):
+        stop = start + BUILD_CHUNK_SCENARIOS
+        discount[start:stop] = projection.discount_factors(projection.tenor_rates(scenario_rates[start:stop]))
+    buffer = io.BytesIO()
+    np.save(buffer, discount)
+    snapshots.upload_file(f"{curve_prefix(scenario_set_id)}/discount.npy", buffer.getvalue())
+    logging.info(f"Built {CURVE_METHOD} curve tables for ScenarioSetID {scenario_set_id}: {discount.shape[0]} scenarios x {discount.shape[1]} months.")
+    return discount
+
+
+def _load(scenario_set_id) -> np.ndarray:
+    path = snapshots.local_file(f"{curve_prefix(scenario_set_id)}/discount.npy")
+    if path is not None:
+        discount = np.load(path, mmap_mode="r")
+        if discount.size:
+            return discount
+        # Written for a set read before it was Ready; the local copy goes so the rebuilt table is downloaded
+        logging.warning(f"Empty {CURVE_METHOD} curve table for ScenarioSetID {scenario_set_id}; rebuilding it.")
+        os.remove(path)
+        return build(scenario_set_id)
+    logging.info(f"No {CURVE_METHOD} curve tables for ScenarioSetID {scenario_set_id}; building them.")
+    return build(scenario_set_id)
+
+
+def discount_factors(scenario_set_id) -> np.ndarray:
+    """The (scenario, month) discount factors of a set, memory-mapped from its curve table (built if missing)."""
+    return scenario_cache.get_derived(_cache_key(scenario_set_id), lambda: _load(scenario_set_id))
+
+
+def put(scenario_set_id, discount: np.ndarray):
+    """Seeds this process with a set's discount factors (e.g. a shared-memory view in a batch worker)."""
+    scenario_cache.put_derived(_cache_key(scenario_set_id), discount)
@@ -0,0 +1,292 @@
+import logging
+import os
+import threading
+import time
+import urllib
+from contextlib import contextmanager
+
+from sqlalchemy import bindparam, create_engine, event, text
+
+# =================================================================
+#  SHARED DATA ACCESS LAYER
+# =================================================================
+# One engine per worker process, shared by the HTTP functions and the
+# durable activities, so invocations reuse pooled ODBC connections instead
+# of paying for a new pool and TLS handshake every time.
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+class DbMetrics:
+    """Running totals for pool checkout wait and statement latency in this process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.checkouts = 0
+            self.checkout_seconds = 0.0
+            self.max_checkout_seconds = 0.0
+            self.queries = 0
+            self.query_seconds = 0.0
+            self.max_query_seconds = 0.0
+
+    def record_checkout(self, seconds: float):
+        with self._lock:
+            self.checkouts += 1
+            self.checkout_seconds += seconds
+            self.max_checkout_seconds = max(self.max_checkout_seconds, seconds)
+
+    def record_query(self, seconds: float):
+        with self._lock:
+            self.queries += 1
+            self.query_seconds += seconds
+            self.max_query_seconds = max(self.max_query_seconds, seconds)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "checkouts": self.checkouts,
+                "avg_checkout_ms": 1000 * self.checkout_seconds / self.checkouts if self.checkouts else 0.0,
+                "max_checkout_ms": 1000 * self.max_checkout_seconds,
+                "queries": self.queries,
+                "avg_query_ms": 1000 * self.query_seconds / self.queries if self.queries else 0.0,
+                "max_query_ms": 1000 * self.max_query_seconds,
+            }
+
+
+metrics = DbMetrics()
+SLOW_QUERY_SECONDS = float(os.environ.get("DbSlowQueryMs", 2000)) / 1000
+
+
+def _instrument(engine):
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start"].pop()
+        metrics.record_query(elapsed)
+        if elapsed > SLOW_QUERY_SECONDS:
+            logging.warning(f"Slow query ({elapsed * 1000:.0f} ms): {statement[:200]}")
+
+
+def get_sql_engine():
+    """Returns the process-lifetime SQL engine, creating it on first use."""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                sql_conn_str = os.environ.get("SqlConnectionString")
+                params = urllib.parse.quote_plus(sql_conn_str)
+                engine = create_engine(
+                    f"mssql+pyodbc:///?odbc_connect={params}",
+                    pool_size=int(os.environ.get("DbPoolSize", 5)),
+                    max_overflow=int(os.environ.get("DbPoolMaxOverflow", 10)),
+                    pool_timeout=30,
+                    # Azure SQL drops idle connections after ~30 minutes
+                    pool_recycle=1800,
+                    pool_pre_ping=True,
+                    fast_executemany=True,
+                )
+                _instrument(engine)
+                _engine = engine
+    return _engine
+
+
+@contextmanager
+def connect():
+    """Checks a connection out of the shared pool, recording how long the checkout took."""
+    start = time.perf_counter()
+    with get_sql_engine().connect() as con:
+        metrics.record_checkout(time.perf_counter() - start)
+        yield con
+
+
+# =================================================================
+#  FIXED STATEMENTS
+# =================================================================
+# Built once at import so SQLAlchemy's compiled-statement cache is hit on
+# every call. Statements whose shape depends on the request (dynamic SET
+# clauses, IN lists) are still built at the call site.
+
+# --- Users ---
+USER_EXISTS = text("SELECT COUNT(1) FROM Users WHERE UserID = :uid")
+INSERT_USER = text("INSERT INTO Users (UserID, IdentityProvider, Email, DisplayName) VALUES (:uid, :idp, :email, :name)")
+# Listing versions behind the ETags (see user_versions.py)
+SELECT_USER_VERSIONS = text("SELECT Scope, Version FROM UserVersions WHERE UserID = :uid")
+BUMP_USER_VERSION = text(
+    "MERGE UserVersions WITH (HOLDLOCK) AS t USING (SELECT :uid AS UserID, :scope AS Scope) AS s "
+    "ON t.UserID = s.UserID AND t.Scope = s.Scope "
+    "WHEN MATCHED THEN UPDATE SET Version = t.Version + 1 "
+    "WHEN NOT MATCHED THEN INSERT (UserID, Scope, Version) VALUES (s.UserID, s.Scope, 1);"
+)
+
+# --- Policy and scenario sets ---
+# Set listings read the per-set summaries filled at ingest (see set_summaries.py)
+LIST_POLICY_SETS = text(
+    "SELECT s.PolicySetID as id, s.SetName as name, s.RecordCount, s.RowsRejected, COUNT(p.Product_Code) AS ProductCount, "
+    "COALESCE(SUM(p.AccountValueTotal), 0) AS AccountValueTotal, s.UploadTimestamp as createdAt "
+    "FROM PolicySets s LEFT JOIN PolicySetProducts p ON p.PolicySetID = s.PolicySetID AND p.PolicyCount > 0 WHERE s.UserID = :uid "
+    "GROUP BY s.PolicySetID, s.SetName, s.RecordCount, s.RowsRejected, s.UploadTimestamp ORDER BY s.UploadTimestamp DESC"
+)
+INSERT_POLICY_SET = text("INSERT INTO PolicySets (UserID, SetName, OriginalFileName, RecordCount, IngestStatus) OUTPUT INSERTED.PolicySetID VALUES (:uid, :sname, :fname, 0, 'Loading')")
+UPDATE_POLICY_SET_PROGRESS = text("UPDATE PolicySets SET RowsLoaded = :rows WHERE PolicySetID = :sid")
+COMPLETE_POLICY_SET = text("UPDATE PolicySets SET RecordCount = :rcount, RowsLoaded = :rcount, RowsRejected = :rejected, ContentHash = :hash, IngestStatus = 'Ready' WHERE PolicySetID = :sid")
+# The sets the engine reads (see SELECT_POLICY_SET_VERSIONS); loading and failed sets have no hash
+SELECT_POLICY_SET_HASHES = text("SELECT PolicySetID, ContentHash FROM PolicySets WHERE UserID = :uid AND IngestStatus = 'Ready'")
+# An edit clears the content hash and moves the set past its snapshot (see snapshots.py); the
+# timestamps let snapshot rebuilds wait for a burst of edits to settle
+MARK_POLICY_SET_EDITED = text(
+    "UPDATE PolicySets SET ContentHash = NULL, EditVersion = EditVersion + 1, LastEditTimestamp = GETDATE(), "
+    "PendingEditSince = COALESCE(PendingEditSince, GETDATE()) WHERE PolicySetID = :sid"
+)
+SELECT_POLICY_SET_EDIT_VERSION = text("SELECT EditVersion FROM PolicySets WHERE PolicySetID = :sid AND IngestStatus = 'Ready'")
+SELECT_POLICY_SET_ROWS = text(
+    "SELECT Policy_ID, Product_Code, Valuation_Date, Issue_Date, Issue_Age, Gender, Policy_Status_Code, Account_Value, "
+    "Surrender_Charge_Schedule, Guaranteed_Crediting_Rate, Index_Strategy_Code, Sub_Account_Allocation, Rider_Codes, "
+    "GLWB_Benefit_Base, GLWB_Withdrawal_Rate FROM Policies WHERE PolicySetID = :sid ORDER BY Policy_ID"
+)
+# A rebuilt snapshot's hash only lands if no further edit bumped the set meanwhile
+COMPLETE_POLICY_SET_REBUILD = text("UPDATE PolicySets SET ContentHash = :hash, PendingEditSince = NULL WHERE PolicySetID = :sid AND EditVersion = :version")
+# Edited sets whose last edit is :quiet seconds old, or whose oldest unrebuilt edit is :maxwait seconds old
+SELECT_POLICY_SETS_DUE_FOR_REBUILD = text(
+    "SELECT PolicySetID FROM PolicySets WHERE IngestStatus = 'Ready' AND PendingEditSince IS NOT NULL "
+    "AND (DATEDIFF(second, LastEditTimestamp, GETDATE()) >= :quiet OR DATEDIFF(second, PendingEditSince, GETDATE()) >= :maxwait)"
+)
+FAIL_POLICY_SET = text("UPDATE PolicySets SET IngestStatus = 'Failed' WHERE PolicySetID = :sid")
+# Loads commit chunk by chunk, so a failed load removes the rows it got in
+DELETE_POLICY_SET_ROWS = text("DELETE FROM Policies WHERE PolicySetID = :sid")
+# Sets still loading or that failed can't be run against, so they aren't offered
+LIST_SCENARIO_SETS = text("SELECT ScenarioSetID as id, SetName as name, Granularity, ScenarioCount, MonthCount, CreatedTimestamp as createdAt FROM ScenarioSets WHERE UserID = :uid AND IngestStatus = 'Ready' ORDER BY CreatedTimestamp DESC")
+INSERT_SCENARIO_SET = text("INSERT INTO ScenarioSets (UserID, SetName, OriginalFileName, Granularity, IngestStatus) OUTPUT INSERTED.ScenarioSetID VALUES (:uid, :sname, :fname, :gran, 'Loading')")
+UPDATE_SCENARIO_SET_PROGRESS = text("UPDATE ScenarioSets SET RowsLoaded = :rows WHERE ScenarioSetID = :sid")
+COMPLETE_SCENARIO_SET = text("UPDATE ScenarioSets SET RecordCount = :rcount, RowsLoaded = :rcount, RowsRejected = :rejected, ScenarioCount = :scenarios, MonthCount = :months, ContentHash = :hash, IngestStatus = 'Ready' WHERE ScenarioSetID = :sid")
+SELECT_SCENARIO_SET_HASH = text("SELECT ContentHash FROM ScenarioSets WHERE ScenarioSetID = :sid")
+SELECT_SCENARIO_SET_STATUS = text("SELECT IngestStatus FROM ScenarioSets WHERE ScenarioSetID = :sid")
+FAIL_SCENARIO_SET = text("UPDATE ScenarioSets SET IngestStatus = 'Failed' WHERE ScenarioSetID = :sid")
+DELETE_SCENARIO_SET_ROWS = text("DELETE FROM EconomicScenarios WHERE ScenarioSetID = :sid")
+INSERT_POLICY_SET_PRODUCT = text("INSERT INTO PolicySetProducts (PolicySetID, Product_Code, PolicyCount, AccountValueTotal) VALUES (:sid, :pcode, :count, :av)")
+ADJUST_POLICY_SET_PRODUCT = text(
+    "UPDATE PolicySetProducts SET PolicyCount = PolicyCount + :count, AccountValueTotal = AccountValueTotal + :av "
+    "WHERE PolicySetID = :sid AND Product_Code = :pcode"
+)
+
+# --- Policies ---
+# A set's rows are committed chunk by chunk while it loads; readers only see sets whose IngestStatus is 'Ready'
+READY_POLICY_SETS = "PolicySetID IN (SELECT PolicySetID FROM PolicySets WHERE UserID = :uid AND IngestStatus = 'Ready')"
+# Batch key ranges compare Policy_IDs by code point, as the snapshot filters do (see snapshots.py),
+# not under the column's case-insensitive collation
+BINARY_POLICY_ID = "Policy_ID COLLATE Latin1_General_BIN2"
+POLICY_RANGE = f"{BINARY_POLICY_ID} >= :lo AND (:hi IS NULL OR {BINARY_POLICY_ID} < :hi)"
+SELECT_POLICY_SET_VERSIONS = text("SELECT PolicySetID, EditVersion FROM PolicySets WHERE UserID = :uid AND IngestStatus = 'Ready'")
+# One batch of a set without a current snapshot; only the columns the projection kernel reads (projection.POLICY_COLUMNS)
+SELECT_POLICIES_FOR_BATCH = text(
+    "SELECT Policy_ID, Account_Value, Guaranteed_Crediting_Rate, GLWB_Benefit_Base, GLWB_Withdrawal_Rate FROM Policies "
+    f"WHERE Product_Code = :pcode AND UserID = :uid AND PolicySetID = :sid AND {POLICY_RANGE}"
+)
+# Kernel columns plus the model-point grouping characteristics (see compression.py)
+SELECT_POLICIES_FOR_COMPRESSION = text(
+    "SELECT Policy_ID, Account_Value, Guaranteed_Crediting_Rate, GLWB_Benefit_Base, GLWB_Withdrawal_Rate, Issue_Age, Gender, Issue_Date, Valuation_Date, Rider_Codes FROM Policies "
+    f"WHERE Product_Code = :pcode AND UserID = :uid AND PolicySetID = :sid AND {POLICY_RANGE}"
+)
+COUNT_POLICIES_BY_PRODUCT = text(
+    "SELECT p.Product_Code, SUM(p.PolicyCount) AS PolicyCount FROM PolicySetProducts p JOIN PolicySets s ON s.PolicySetID = p.PolicySetID "
+    "WHERE s.UserID = :uid GROUP BY p.Product_Code HAVING SUM(p.PolicyCount) > 0"
+)
+# First Policy_ID of every `size`-row slice of a product, in binary key order
+SELECT_POLICY_BATCH_STARTS = text(
+    f"SELECT Policy_ID FROM (SELECT Policy_ID, ROW_NUMBER() OVER (ORDER BY {BINARY_POLICY_ID}) AS rn FROM Policies "
+    f"WHERE Product_Code = :pcode AND UserID = :uid AND {READY_POLICY_SETS}) ranked WHERE (rn - 1) % :size = 0 ORDER BY rn"
+)
+# Policy_ID is the table's primary key across all users and sets (see validation.stored_policy_ids)
+SELECT_EXISTING_POLICY_IDS = text("SELECT Policy_ID FROM Policies WHERE Policy_ID IN :pids").bindparams(bindparam("pids", expanding=True))
+# The time of a policy edit, as ISO 8601 on the database clock that sets Requested_Timestamp
+SELECT_EDIT_TIMESTAMP = text("SELECT CONVERT(VARCHAR(23), GETDATE(), 126)")
+SELECT_POLICY_SET_FOR_POLICY = text("SELECT PolicySetID FROM Policies WHERE Policy_ID = :pid AND UserID = :uid")
+DELETE_POLICY = text("DELETE FROM Policies WHERE Policy_ID = :pid AND UserID = :uid")
+
+# --- Economic scenarios ---
+SELECT_SCENARIO_RATES = text(
+    "SELECT ScenarioID, Month, Rate_0_25_yr, Rate_0_5_yr, Rate_1_yr, Rate_2_yr, Rate_3_yr, "
+    "Rate_5_yr, Rate_7_yr, Rate_10_yr, Rate_20_yr, Rate_30_yr FROM EconomicScenarios WHERE ScenarioSetID = :sid "
+    "AND EXISTS (SELECT 1 FROM ScenarioSets WHERE ScenarioSetID = :sid AND IngestStatus = 'Ready')"
+)
+COUNT_SCENARIOS = text("SELECT ScenarioCount FROM ScenarioSets WHERE ScenarioSetID = :sid")
+
+# --- Calculation jobs and results ---
+INSERT_JOB = text("INSERT INTO CalculationJobs (Product_Code, Job_Status, UserID, ScenarioSetID, RunStochastic, Compression, Sensitivities) OUTPUT INSERTED.JobID VALUES (:pcode, 'Pending', :uid, :sid, :stochastic, :compression, :sensitivities)")
+LIST_JOBS = text("SELECT JobID as jobId, Job_Status as status, Requested_Timestamp as requestedTimestamp FROM CalculationJobs WHERE UserID = :uid ORDER BY JobID DESC")
+SELECT_JOB_FOR_USER = text("SELECT Product_Code FROM CalculationJobs WHERE JobID = :jid AND UserID = :uid")
+SELECT_JOB_USER = text("SELECT UserID FROM CalculationJobs WHERE JobID = :jid")
+# Only the first batch of a job changes the row (and the user's job list version)
+SET_JOB_RUNNING = text("UPDATE CalculationJobs SET Job_Status = 'Running' WHERE JobID = :jobid AND Job_Status = 'Pending'")
+SET_JOB_COMPLETE = text("UPDATE CalculationJobs SET Job_Status = 'Complete', Completed_Timestamp = GETDATE() WHERE JobID = :jobid")
+SET_JOB_FAILED = text("UPDATE CalculationJobs SET Job_Status = 'Failed' WHERE JobID = :jobid")
+SELECT_JOB_FOR_RESUME = text("SELECT Product_Code, ScenarioSetID, RunStochastic, Compression, Sensitivities, Job_Status FROM CalculationJobs WHERE JobID = :jid AND UserID = :uid")
+RESUME_JOB = text("UPDATE CalculationJobs SET Job_Status = 'Pending' WHERE JobID = :jobid AND Job_Status = 'Failed'")
+INSERT_RESULT = text("INSERT INTO Results (JobID, Result_Type, Result_Value) VALUES (:jobid, :rtype, :resval)")
+SELECT_JOB_RESULTS = text("SELECT Result_Type, Result_Value FROM Results WHERE JobID = :jid")
+INSERT_JOB_PRODUCT_RESULT = text("INSERT INTO JobProductResults (JobID, Product_Code, Reserve, CacheHit, Aggregate) VALUES (:jobid, :pcode, :resval, :hit, :aggregate)")
+
+# --- Batch plans and checkpoints (a retried batch or resumed job skips completed batches) ---
+SELECT_JOB_PLAN = text("SELECT BatchPlan FROM CalculationJobs WHERE JobID = :jobid")
+SAVE_JOB_PLAN = text("UPDATE CalculationJobs SET BatchPlan = :plan WHERE JobID = :jobid")
+SELECT_BATCH_CHECKPOINT = text("SELECT Aggregate FROM JobBatchCheckpoints WHERE JobID = :jobid AND Batch = :batch")
+INSERT_BATCH_CHECKPOINT = text(
+    "IF NOT EXISTS (SELECT 1 FROM JobBatchCheckpoints WHERE JobID = :jobid AND Batch = :batch) "
+    "INSERT INTO JobBatchCheckpoints (JobID, Batch, Aggregate) VALUES (:jobid, :batch, :aggregate)"
+)
+
+# --- Delta recalculation ---
+SELECT_POLICY_ENGINE_ROW = text(
+    "SELECT Policy_ID, Product_Code, Account_Value, Guaranteed_Crediting_Rate, GLWB_Benefit_Base, GLWB_Withdrawal_Rate, Load_Timestamp "
+    "FROM Policies WHERE Policy_ID = :pid AND UserID = :uid"
+)
+# Latest completed job that included the product, started after the policy was loaded and before it was edited
+# (a later job already valued the edit); locked for the delta update
+SELECT_LATEST_JOB_PRODUCT_FOR_UPDATE = text(
+    "SELECT TOP 1 j.JobID, j.ScenarioSetID, j.Sensitivities, r.Aggregate FROM CalculationJobs j WITH (UPDLOCK) "
+    "JOIN JobProductResults r WITH (UPDLOCK) ON r.JobID = j.JobID "
+    "WHERE j.UserID = :uid AND j.Job_Status = 'Complete' AND r.Product_Code = :pcode "
+    "AND j.Requested_Timestamp >= :loaded AND j.Requested_Timestamp < :edited "
+    "ORDER BY j.JobID DESC"
+)
+SELECT_JOB_PRODUCT_AGGREGATES = text("SELECT Product_Code, Aggregate FROM JobProductResults WHERE JobID = :jobid")
+UPDATE_JOB_PRODUCT_RESULT = text("UPDATE JobProductResults SET Reserve = :resval, Aggregate = :aggregate WHERE JobID = :jobid AND Product_Code = :pcode")
+DELETE_JOB_RESULTS = text("DELETE FROM Results WHERE JobID = :jobid")
+# An edit's ID is recorded with its delta, so a redelivered queue message isn't applied twice
+SELECT_POLICY_DELTA_APPLIED = text("SELECT COUNT(*) FROM PolicyDeltas WHERE EditID = :editid")
+INSERT_POLICY_DELTA = text("INSERT INTO PolicyDeltas (JobID, Policy_ID, Product_Code, Delta_Reserve, EditID) VALUES (:jobid, :pid, :pcode, :delta, :editid)")
+
+# --- Result store (see result_store.py) ---
+UPSERT_JOB_RESULT_FILE = text(
+    "MERGE JobResultFiles AS t USING (SELECT :jobid AS JobID, :path AS Path) AS s "
+    "ON t.JobID = s.JobID AND t.Path = s.Path "
+    "WHEN MATCHED THEN UPDATE SET Row_Count = :rows, Byte_Count = :bytes "
+    "WHEN NOT MATCHED THEN INSERT (JobID, Kind, Path, Row_Count, Byte_Count) VALUES (:jobid, :kind, :path, :rows, :bytes);"
+)
+SELECT_JOB_RESULT_FILES = text("SELECT Path FROM JobResultFiles WHERE JobID = :jobid AND Kind = :kind ORDER BY Path")
+SELECT_JOB_PRODUCT_BREAKDOWN = text(
+    "SELECT Product_Code, Reserve, CacheHit FROM JobProductResults WHERE JobID = :jid ORDER BY Reserve DESC"
+)
+
+# --- Job telemetry (see telemetry.py) ---
+INSERT_JOB_METRIC = text(
+    "INSERT INTO JobMetrics (JobID, Activity, Batch, Phase, Started, Duration_Ms, Row_Count, Byte_Count, Peak_RSS_MB) "
+    "VALUES (:jobid, :activity, :batch, :phase, :started, :duration, :rows, :bytes, :rss)"
+)
+SELECT_JOB_METRICS = text(
+    "SELECT Activity, Batch, Phase, Started, Duration_Ms, Row_Count, Byte_Count, Peak_RSS_MB FROM JobMetrics WHERE JobID = :jid ORDER BY Started"
+)
+
+# --- Result cache ---
+SELECT_CACHED_RESULT = text("SELECT Aggregate FROM ResultCache WHERE CacheKey = :key")
+INSERT_CACHED_RESULT = text(
+    "IF NOT EXISTS (SELECT 1 FROM ResultCache WHERE CacheKey = :key) "
+    "INSERT INTO ResultCache (CacheKey, Product_Code, EngineVersion, Aggregate) VALUES (:key, :pcode, :version, :aggregate)"
+)
@@ -0,0 +1,125 @@
+import json
+import logging
+import uuid
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+import aggregation
+import curves
+import db
+import projection
+import result_store
+import sensitivities
+
+# =================================================================
+#  INCREMENTAL DELTA RECALCULATION
+# =================================================================
+# The reserve is linear in the policies, so a job's per-scenario product
+# aggregate can be corrected for an edit by projecting only the touched
+# policy: subtract its contribution as it was before the edit and add it
+# back as it is now. Edits are queued by the HTTP API and applied to the
+# user's latest completed job for the product requested before the edit (a
+# later job already read the edited policy); the job's Results rows are
+# then rewritten from the corrected aggregates. Every sensitivity is linear in
+# the policies too, so a job's sensitivity reserves are corrected the same way.
+#
+# Queue messages can be delivered more than once. Each edit carries an ID that
+# is recorded in PolicyDeltas in the transaction that applies it, and an edit
+# whose ID is already there is skipped. The policy's drill-down reserve in the
+# result store is corrected by a delta part written under that ID as well.
+
+
+def engine_row(con, policy_id: str, user_id: str):
+    """The engine columns of one policy as a JSON-serialisable dict, or None if it doesn't exist."""
+    row = con.execute(db.SELECT_POLICY_ENGINE_ROW, {"pid": policy_id, "uid": user_id}).mappings().fetchone()
+    if row is None:
+        return None
+    values = dict(row)
+    for key in projection.POLICY_COLUMNS[1:]:
+        values[key] = float(values[key]) if values[key] is not None else None
+    values["Load_Timestamp"] = values["Load_Timestamp"].isoformat() if values["Load_Timestamp"] else None
+    return values
+
+
+def _contribution(row, discount: np.ndarray) -> np.ndarray:
+    """Per-scenario reserve of a single policy row (zeros for a missing row)."""
+    if row is None:
+        return np.zeros(discount.shape[0])
+    arrays = projection.policy_arrays(pd.DataFrame([row]))
+    return projection.policy_reserves(arrays, discount)[0]
+
+
+def _sensitivity_contributions(row, discount: np.ndarray, specs: list) -> dict:
+    """Per-scenario reserve of a single policy row under each sensitivity, by name."""
+    if row is None:
+        return {spec["name"]: np.zeros(discount.shape[0]) for spec in specs}
+    return sensitivities.project(projection.policy_arrays(pd.DataFrame([row])), discount, specs)[2]
+
+
+def apply_policy_delta(user_id: str, old_row: dict, new_row, edit_id: str = None, edited: str = None):
+    """
+    Applies one policy edit to the latest completed job that included the policy's product
+    and was requested before the edit.
+
+    `old_row` is the policy's engine row before the edit, `new_row` after it (None for a delete).
+    `edit_id` identifies the edit; one that was already applied is skipped. `edited` is the
+    edit's ISO 8601 time on the database clock (db.SELECT_EDIT_TIMESTAMP).
+    Returns the job ID that was adjusted, or None if no job covers the policy or the edit was applied.
+    """
+    product_code = old_row["Product_Code"]
+    with db.connect() as con:
+        job = con.execute(db.SELECT_LATEST_JOB_PRODUCT_FOR_UPDATE, {
+            "uid": user_id, "pcode": product_code,
+            "loaded": datetime.fromisoformat(old_row["Load_Timestamp"]) if old_row["Load_Timestamp"] else datetime.min,
+            "edited": datetime.fromisoformat(edited) if edited else datetime.max,
+        }).fetchone()
+        if job is None or job.Aggregate is None:
+            logging.info(f"No completed job covers policy {old_row['Policy_ID']}; nothing to adjust.")
+            return None
+        # Checked under the job's update lock, so concurrent redeliveries of an edit are serialized here
+        if edit_id is not None and con.execute(db.SELECT_POLICY_DELTA_APPLIED, {"editid": edit_id}).scalar():
+            logging.info(f"Edit {edit_id} of policy {old_row['Policy_ID']} was already applied; skipping.")
+            return None
+
+        aggregate = json.loads(job.Aggregate)
+        n_scenarios = len(aggregate["scenario_reserves"])
+        discount = np.asarray(curves.discount_factors(job.ScenarioSetID)[:n_scenarios])
+
+        delta = _contribution(new_row, discount) - _contribution(old_row, discount)
+        aggregate["scenario_reserves"] = (np.asarray(aggregate["scenario_reserves"]) + delta).tolist()
+        specs = sensitivities.parse(json.loads(job.Sensitivities or "[]"))
+        if specs and "sensitivities" in aggregate:
+            new = _sensitivity_contributions(new_row, discount, specs)
+            old = _sensitivity_contributions(old_row, discount, specs)
+            for name, values in aggregate["sensitivities"].items():
+                aggregate["sensitivities"][name] = (np.asarray(values) + new[name] - old[name]).tolist()
+        if new_row is None:
+            aggregate["policy_count"] -= 1
+        account_value_delta = ((new_row or {}).get("Account_Value") or 0.0) - (old_row.get("Account_Value") or 0.0)
+        aggregate["account_value"] += account_value_delta
+
+        con.execute(db.UPDATE_JOB_PRODUCT_RESULT, {
+            "jobid": job.JobID, "pcode": product_code,
+            "resval": aggregation.mean_reserve(aggregate), "aggregate": json.dumps(aggregate)
+        })
+        con.execute(db.INSERT_POLICY_DELTA, {
+            "jobid": job.JobID, "pid": old_row["Policy_ID"], "pcode": product_code, "delta": float(delta.mean()), "editid": edit_id
+        })
+        result_store.write_policy_delta(
+            con, job.JobID, edit_id or uuid.uuid4().hex, product_code, old_row["Policy_ID"], account_value_delta, float(delta.mean())
+        )
+
+        # Rebuild the job-level Results rows from all of the job's product aggregates
+        products = {pc: json.loads(a) for pc, a in con.execute(db.SELECT_JOB_PRODUCT_AGGREGATES, {"jobid": job.JobID}) if a}
+        total = aggregation.merge_partials(products.values(), n_scenarios)
+        con.execute(db.DELETE_JOB_RESULTS, {"jobid": job.JobID})
+        for result_type, value in aggregation.result_rows(total).items():
+            con.execute(db.INSERT_RESULT, {"jobid": job.JobID, "rtype": result_type, "resval": value})
+        result_store.write_scenario_results(con, job.JobID, products)
+        con.commit()
+
+    logging.info(f"Applied delta of {delta.mean():,.2f} for policy {old_row['Policy_ID']} to job {job.JobID}.")
+    return job.JobID
+
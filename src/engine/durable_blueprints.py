@@ -1,21 +1,172 @@
+import itertools
 import logging
 import os
 import json
-import urllib
+from concurrent.futures import ThreadPoolExecutor
 
 import azure.durable_functions as df
+import azure.functions as func
 import pandas as pd
 import numpy as np
-from sqlalchemy import create_engine, text
+
+import aggregation
+import compression
+import curves
+import db
+import ingest
+import policy_terms
+import projection
+import result_cache
+import result_store
+import sensitivities
+import snapshots
+import telemetry
+import user_versions
+from scenario_cache import load_scenarios, scenario_cache
 
 # --- 1. Create the Durable Functions Blueprint ---
 bp = df.Blueprint()
 
+# Policies per pipelined engine chunk (0 loads each batch whole); chunks read ahead of the one being projected
+ENGINE_CHUNK_ROWS = int(os.environ.get("EngineChunkRows", 5_000))
+PIPELINE_DEPTH = 2
+# "reference" runs the pure-Python kernel (projection.project_reserves_reference) to check the vectorised one
+ENGINE_KERNEL = os.environ.get("EngineKernel", "vectorised")
+# Engine batches that fail (timeout, transient ODBC error) are retried; completed batches are checkpointed
+ENGINE_RETRY = df.RetryOptions(
+    first_retry_interval_in_milliseconds=int(os.environ.get("EngineRetryIntervalMs", 5_000)),
+    max_number_of_attempts=int(os.environ.get("EngineRetryAttempts", 3)),
+)
+
 # Helper function specific to this blueprint
-def get_sql_engine():
-    sql_conn_str = os.environ.get("SqlConnectionString")
-    params = urllib.parse.quote_plus(sql_conn_str)
-    return create_engine(f"mssql+pyodbc:///?odbc_connect={params}")
+def load_policies(con, product_code: str, user_id: str, policy_range, compress: bool = False) -> pd.DataFrame:
+    """
+    Loads one batch of a product's policies from the Parquet snapshots, reading sets without
+    a current snapshot from SQL. Compressed runs also load the model-point grouping columns.
+    """
+    set_versions = dict(con.execute(db.SELECT_POLICY_SET_VERSIONS, {"uid": user_id}).all())
+    columns = projection.POLICY_COLUMNS + (compression.COLUMNS if compress else [])
+    policies_df, stale_set_ids = snapshots.read_policies(set_versions, product_code, columns, policy_range)
+    if not stale_set_ids:
+        return policies_df
+    lo, hi = policy_range
+    statement = db.SELECT_POLICIES_FOR_COMPRESSION if compress else db.SELECT_POLICIES_FOR_BATCH
+    frames = [policies_df] if len(policies_df) else []
+    for set_id in stale_set_ids:
+        sql_df = pd.read_sql(statement, con, params={"pcode": product_code, "uid": user_id, "sid": set_id, "lo": lo, "hi": hi})
+        if compress:
+            # Snapshot rows carry the parsed Rider_Mask; keep the column complete when both are mixed
+            sql_df["Rider_Mask"] = policy_terms.rider_masks(sql_df)
+        frames.append(sql_df)
+    return pd.concat(frames, ignore_index=True)
+
+def load_checkpoint(con, job_id, batch: str):
+    """The partial aggregate a batch of the job already saved, or None."""
+    aggregate = con.execute(db.SELECT_BATCH_CHECKPOINT, {"jobid": job_id, "batch": batch}).scalar()
+    return json.loads(aggregate) if aggregate else None
+
+def save_checkpoint(con, job_id, batch: str, partial: dict):
+    """Saves a batch's partial aggregate in the transaction that commits its results (the caller commits)."""
+    if job_id is not None:
+        con.execute(db.INSERT_BATCH_CHECKPOINT, {"jobid": job_id, "batch": batch, "aggregate": json.dumps(partial)})
+
+def iter_policy_chunks(product_code: str, user_id: str, policy_range, chunk_rows: int):
+    """
+    Streams one batch of a product's policies in chunks of about `chunk_rows` from the snapshots,
+    then those of the sets without a current snapshot from SQL.
+    """
+    with db.connect() as con:
+        set_versions = dict(con.execute(db.SELECT_POLICY_SET_VERSIONS, {"uid": user_id}).all())
+        chunks, stale_set_ids = snapshots.iter_policies(set_versions, product_code, projection.POLICY_COLUMNS, policy_range, chunk_rows)
+        yield from chunks
+        lo, hi = policy_range
+        for set_id in stale_set_ids:
+            yield from pd.read_sql(db.SELECT_POLICIES_FOR_BATCH, con, params={"pcode": product_code, "uid": user_id, "sid": set_id, "lo": lo, "hi": hi}, chunksize=chunk_rows)
+
+def run_pipelined(engine_input: dict, spans: telemetry.JobTelemetry) -> dict:
+    """
+    Runs one engine batch as a pipeline: the scenario set's discount factors load on one thread
+    while policy chunks are read on another, at most PIPELINE_DEPTH chunks ahead of the chunk
+    being projected. Each chunk's per-policy results are written as their own result part,
+    so memory is bounded by the chunk size rather than the batch.
+    """
+    job_id = engine_input["job_id"]
+    product_code = engine_input["product_code"]
+    policy_range = engine_input.get("policy_range") or ["", None]
+    scenario_start, scenario_stop = engine_input.get("scenario_range") or [0, 1]
+    specs = sensitivities.parse(engine_input.get("sensitivities"))
+
+    def load_discount():
+        with spans.span("load_scenarios") as span:
+            discount = np.asarray(curves.discount_factors(engine_input.get("scenarioId"))[scenario_start:scenario_stop])
+            span["rows"], span["bytes"] = len(discount), int(discount.nbytes)
+        return discount
+
+    scenario_reserves = np.zeros(scenario_stop - scenario_start)
+    sensitivity_reserves = {spec["name"]: np.zeros(scenario_stop - scenario_start) for spec in specs}
+    n_policies, account_value = 0, 0.0
+    with ThreadPoolExecutor(max_workers=1) as pool, db.connect() as con:
+        discount_future = pool.submit(load_discount)
+        chunks = ingest.prefetch(iter_policy_chunks(product_code, engine_input["user_id"], policy_range, ENGINE_CHUNK_ROWS), PIPELINE_DEPTH)
+        for part in itertools.count():
+            # Time spent waiting here is I/O the pipeline failed to hide
+            with spans.span("load_policies") as span:
+                policies_df = next(chunks, None)
+                if policies_df is not None:
+                    span["rows"], span["bytes"] = len(policies_df), telemetry.frame_bytes(policies_df)
+            if policies_df is None:
+                break
+            discount = discount_future.result()
+            if len(discount) == 0:
+                break
+
+            arrays = projection.policy_arrays(policies_df)
+            with spans.span("compute"):
+                chunk_reserves, policy_sums, chunk_sensitivities = sensitivities.project(arrays, discount, specs)
+            scenario_reserves += chunk_reserves
+            for name, values in chunk_sensitivities.items():
+                sensitivity_reserves[name] += values
+            n_policies += len(policies_df)
+            account_value += arrays["account_value"].sum()
+
+            # Each policy's share of its mean reserve over all of the job's scenarios, for the drill-down store
+            with spans.span("write_results") as span:
+                result_store.write_policy_results(
+                    con, job_id, product_code, policy_range, scenario_start, policies_df,
+                    policy_sums / max(engine_input.get("n_scenarios") or 1, 1), part=part
+                )
+                span["rows"] = len(policies_df)
+        discount_future.result()
+        partial = aggregation.partial_aggregate(
+            scenario_start, scenario_reserves, n_policies, account_value, sensitivities=sensitivity_reserves
+        )
+        save_checkpoint(con, job_id, spans.batch, partial)
+        spans.flush(con)
+        con.commit()
+
+    if n_policies == 0:
+        logging.warning(f"Job {job_id}: no policies or scenarios found for product {product_code} batch {policy_range}.")
+    logging.info(f"DB stats: {db.metrics.snapshot()}")
+    logging.info(f"Job {job_id}: projected {n_policies} policies in a pipeline over scenarios {scenario_start}-{scenario_stop} for product {product_code}.")
+    return partial
+
+def final_results(job_id: int, plan: dict, results: list) -> dict:
+    """
+    Merges the batch partials (in plan order) per product, adds the products served from
+    the result cache and builds the SaveFinalResults input. Pure, so it is safe on replay.
+    """
+    product_partials = {}
+    for batch, partial in zip(plan["batches"], results):
+        product_partials.setdefault(batch["product_code"], []).append(partial)
+    computed = {pc: aggregation.merge_partials(partials, plan["n_scenarios"]) for pc, partials in product_partials.items()}
+    products = {**computed, **plan["cached"]}
+    return {
+        "job_id": job_id,
+        "total": aggregation.merge_partials(products.values(), plan["n_scenarios"]),
+        "products": {pc: {"aggregate": agg, "cache_hit": pc in plan["cached"]} for pc, agg in products.items()},
+        "cache_keys": plan["cache_keys"],
+        "computed": computed
+    }
 
 # =================================================================
 #  DURABLE ORCHESTRATION WORKFLOW
@@ -29,34 +180,59 @@ def CalculationOrchestrator(context: df.DurableOrchestrationContext):
     user_id = job_request.get("user_id")
     
     try:
-        # Step 1: Create the main Job log entry
-        job_details = {
-            "product_codes": job_request.get("productCodes"),
-            "user_id": user_id
-        }
-        job_id = yield context.call_activity("CreateCalculationJob", job_details)
+        # Step 1: Create the main Job log entry, unless resuming a failed job (see HttpResumeCalculationJob)
+        job_id = job_request.get("resumeJobId")
+        if job_id is None:
+            job_details = {
+                "product_codes": job_request.get("productCodes"),
+                "user_id": user_id,
+                "scenarioId": job_request.get("scenarioId"),
+                "runStochastic": job_request.get("runStochastic"),
+                "compression": job_request.get("compression"),
+                "sensitivities": job_request.get("sensitivities")
+            }
+            job_id = yield context.call_activity("CreateCalculationJob", job_details)
 
-        # Step 2: Fan-Out/Fan-In pattern to run calculations for multiple products in parallel
+        # Step 2: Split every product into balanced policy (and, for stochastic runs, scenario) batches;
+        # a resumed job gets the plan it was first given
+        plan = yield context.call_activity("PlanCalculationBatches", {
+            "job_id": job_id,
+            "product_codes": job_request.get("productCodes", []),
+            "user_id": user_id,
+            "scenarioId": job_request.get("scenarioId"),
+            "runStochastic": job_request.get("runStochastic"),
+            "compression": job_request.get("compression"),
+            "sensitivities": job_request.get("sensitivities")
+        })
+
+        # Step 3: Fan-Out/Fan-In pattern to run all batches in parallel
         calculation_tasks = []
-        for product_code in job_request.get("productCodes", []):
+        for batch in plan["batches"]:
             engine_input = {
                 "job_id": job_id,
-                "product_code": product_code,
+                "product_code": batch["product_code"],
                 "user_id": user_id,
+                "policy_range": batch["policy_range"],
+                "scenario_range": batch["scenario_range"],
+                "n_scenarios": plan["n_scenarios"],
                 # Pass through other options from the UI
                 "scenarioId": job_request.get("scenarioId"),
-                "runStochastic": job_request.get("runStochastic")
+                "runStochastic": job_request.get("runStochastic"),
+                "compression": job_request.get("compression"),
+                "sensitivities": job_request.get("sensitivities")
             }
-            calculation_tasks.append(context.call_activity("RunCalculationEngine", engine_input))
+            calculation_tasks.append(context.call_activity_with_retry("RunCalculationEngine", ENGINE_RETRY, engine_input))
         
-        # Wait for all parallel calculations to complete
+        # Wait for all parallel calculations to complete; batches checkpointed by an earlier attempt return at once
         results = yield context.task_all(calculation_tasks)
         
-        # Step 3: Aggregate results and finalize the job
-        total_reserve = sum(results)
-        yield context.call_activity("SaveFinalResults", {"job_id": job_id, "total_reserve": total_reserve})
+        # Step 4: Merge the partial aggregates per product, add the products served from the result cache,
+        # and finalize the job
+        result_data = final_results(job_id, plan, results)
+        logging.info(f"Job {job_id}: merged {result_data['total']['batches']} batches covering {result_data['total']['policy_count']} policies ({len(plan['cached'])} product(s) from cache).")
+        yield context.call_activity("SaveFinalResults", result_data)
 
-        return {"status": "Success", "total_reserve": total_reserve}
+        return {"status": "Success", "total_reserve": aggregation.mean_reserve(result_data["total"])}
         
     except Exception as e:
         # If anything fails, mark the main job as failed
@@ -69,56 +245,253 @@ def CalculationOrchestrator(context: df.DurableOrchestrationContext):
 @bp.activity_trigger(input_name="job_details")
 def CreateCalculationJob(job_details: dict) -> int:
     """Activity: Creates the initial job log in SQL, now linked to a user."""
-    engine = get_sql_engine()
     product_codes_str = json.dumps(job_details.get("product_codes"))
+    # A bad sensitivity list fails the job here, before any batch is planned
+    specs = sensitivities.parse(job_details.get("sensitivities"))
     user_id = job_details.get("user_id")
 
-    with engine.connect() as con:
-        query = text("INSERT INTO CalculationJobs (Product_Code, Job_Status, UserID) OUTPUT INSERTED.JobID VALUES (:pcode, 'Pending', :uid)")
-        job_id = con.execute(query, {"pcode": product_codes_str, "uid": user_id}).scalar()
+    spans = telemetry.JobTelemetry(None, "CreateCalculationJob")
+    with db.connect() as con:
+        with spans.span("insert_job"):
+            job_id = con.execute(db.INSERT_JOB, {
+                "pcode": product_codes_str, "uid": user_id,
+                "sid": job_details.get("scenarioId"), "stochastic": bool(job_details.get("runStochastic")),
+                "compression": bool(job_details.get("compression")),
+                "sensitivities": json.dumps(specs) if specs else None
+            }).scalar()
+            user_versions.bump(con, user_id, user_versions.JOBS)
+        spans.job_id = job_id
+        spans.flush(con)
         con.commit()
     return job_id
 
+@bp.activity_trigger(input_name="plan_input")
+def PlanCalculationBatches(plan_input: dict) -> dict:
+    """
+    Activity: Splits each product into policy-range batches, each projected over every scenario of the run.
+    Products whose result is already in the result cache get no batches and are returned under 'cached'.
+    The plan is saved on the job, and a job that already has one (a retry or a resumed job) gets it back
+    unchanged, so its batches match the checkpoints of the earlier attempt.
+    """
+    user_id = plan_input["user_id"]
+    job_id = plan_input.get("job_id")
+    if job_id is not None:
+        with db.connect() as con:
+            saved_plan = con.execute(db.SELECT_JOB_PLAN, {"jobid": job_id}).scalar()
+        if saved_plan:
+            logging.info(f"Job {job_id}: reusing its saved batch plan.")
+            return json.loads(saved_plan)
+    spans = telemetry.JobTelemetry(job_id, "PlanCalculationBatches")
+    policies_per_batch = int(os.environ.get("PoliciesPerBatch", 25_000))
+
+    with db.connect() as con, spans.span("plan"):
+        counts = dict(con.execute(db.COUNT_POLICIES_BY_PRODUCT, {"uid": user_id}).fetchall())
+        n_scenarios = 1
+        if plan_input.get("runStochastic"):
+            n_scenarios = con.execute(db.COUNT_SCENARIOS, {"sid": plan_input.get("scenarioId")}).scalar() or 0
+
+        policy_hashes = dict(con.execute(db.SELECT_POLICY_SET_HASHES, {"uid": user_id}).fetchall())
+        scenario_hash = con.execute(db.SELECT_SCENARIO_SET_HASH, {"sid": plan_input.get("scenarioId")}).scalar()
+        cache_keys = {
+            product_code: result_cache.cache_key(
+                policy_hashes, scenario_hash, product_code, plan_input.get("runStochastic"), plan_input.get("compression"),
+                sensitivities.parse(plan_input.get("sensitivities"))
+            )
+            for product_code in plan_input["product_codes"]
+        }
+        cached = result_cache.lookup(con, cache_keys)
+
+        # Batches never split the scenarios: a policy's cash flows don't depend on the scenario, so every
+        # extra scenario range would read and project the same policies again only to discount them differently
+        batches = []
+        for product_code in plan_input["product_codes"]:
+            if product_code in cached or not n_scenarios:
+                continue
+            n_policies = counts.get(product_code, 0)
+            n_batches = len(aggregation.split_range(n_policies, policies_per_batch))
+            if not n_batches:
+                continue
+            # Balanced slices are cut at every `size`-th Policy_ID so each batch is a contiguous key range
+            size = -(-n_policies // n_batches)
+            starts = [row[0] for row in con.execute(db.SELECT_POLICY_BATCH_STARTS, {"pcode": product_code, "uid": user_id, "size": size})]
+            for lo, hi in zip(starts, starts[1:] + [None]):
+                batches.append({"product_code": product_code, "policy_range": [lo, hi], "scenario_range": [0, n_scenarios]})
+
+    plan = {"batches": batches, "n_scenarios": n_scenarios, "cached": cached, "cache_keys": cache_keys}
+    with db.connect() as con:
+        if job_id is not None:
+            con.execute(db.SAVE_JOB_PLAN, {"jobid": job_id, "plan": json.dumps(plan)})
+        spans.flush(con)
+        con.commit()
+    logging.info(f"Planned {len(batches)} batches over {n_scenarios} scenario(s) for products {plan_input['product_codes']}.")
+    return plan
+
 @bp.activity_trigger(input_name="engine_input")
-def RunCalculationEngine(engine_input: dict) -> float:
-    """Activity: The main calculation logic for a SINGLE product code."""
+def RunCalculationEngine(engine_input: dict) -> dict:
+    """Activity: The main calculation logic for one batch (policy range x scenario range) of a product code."""
     job_id = engine_input['job_id']; 
     product_code = engine_input['product_code']; 
     user_id = engine_input['user_id']
-    engine = get_sql_engine()
+    policy_range = engine_input.get("policy_range") or ["", None]
+    scenario_start, scenario_stop = engine_input.get("scenario_range") or [0, 1]
+    compress = bool(engine_input.get("compression"))
+    specs = sensitivities.parse(engine_input.get("sensitivities"))
     
-    with engine.connect() as con:
+    spans = telemetry.JobTelemetry(job_id, "RunCalculationEngine", telemetry.batch_label(product_code, policy_range, [scenario_start, scenario_stop]))
+    with db.connect() as con:
         # This update could be part of a more detailed job tracking table
-        con.execute(text("UPDATE CalculationJobs SET Job_Status = 'Running' WHERE JobID = :jobid"), {"jobid": job_id})
-        
-        policy_query = text("SELECT * FROM Policies WHERE Product_Code = :pcode AND UserID = :uid")
-        policies_df = pd.read_sql(policy_query, con, params={"pcode": product_code, "uid": user_id})
-        
-        scenario_query = text("SELECT * FROM EconomicScenarios WHERE ScenarioSetID = :sid")
-        scenarios_df = pd.read_sql(scenario_query, con, params={"sid": engine_input.get("scenarioId")})
+        if con.execute(db.SET_JOB_RUNNING, {"jobid": job_id}).rowcount:
+            user_versions.bump_for_job(con, job_id)
+        con.commit()
+        # A batch completed by an earlier attempt (an activity retry or a resumed job) is not run again
+        partial = load_checkpoint(con, job_id, spans.batch)
+    if partial is not None:
+        logging.info(f"Job {job_id}: batch {spans.batch} already checkpointed, skipping.")
+        return partial
 
-        # ... The full, high-performance vectorized calculation logic goes here ...
-        # ... This would calculate the reserve just for this product_code ...
-        final_reserve_for_product = 123.45 # Placeholder for the complex calculation
-        
-    return final_reserve_for_product
+    # Model points need the whole batch to group, and the reference kernel is kept as simple as possible
+    if ENGINE_CHUNK_ROWS > 0 and not compress and ENGINE_KERNEL != "reference":
+        return run_pipelined(engine_input, spans)
+
+    with db.connect() as con:
+        with spans.span("load_policies") as span:
+            policies_df = load_policies(con, product_code, user_id, policy_range, compress)
+            span["rows"], span["bytes"] = len(policies_df), telemetry.frame_bytes(policies_df)
+
+    with spans.span("load_scenarios") as span:
+        # Discount factors are precomputed once per scenario set (see curves.py).
+        # Deterministic runs are planned with scenario range [0, 1): the first scenario in the set is the prescribed path
+        discount = curves.discount_factors(engine_input.get("scenarioId"))[scenario_start:scenario_stop]
+        span["rows"], span["bytes"] = len(discount), int(discount.nbytes)
+    logging.info(f"DB stats: {db.metrics.snapshot()}")
+
+    if policies_df.empty or len(discount) == 0:
+        logging.warning(f"Job {job_id}: no policies or scenarios found for product {product_code} batch {policy_range}.")
+        empty = np.zeros(scenario_stop - scenario_start)
+        partial = aggregation.partial_aggregate(
+            scenario_start, empty, 0, 0.0, sensitivities={spec["name"]: empty for spec in specs}
+        )
+        with db.connect() as con:
+            save_checkpoint(con, job_id, spans.batch, partial)
+            spans.flush(con)
+            con.commit()
+        return partial
+
+    arrays = projection.policy_arrays(policies_df)
+    policy_sums = None
+    model_points = validation = None
+    if compress:
+        # Model points replace the seriatim policies in the projection; a fixed sample of the
+        # batch is projected both ways to measure the error this introduces
+        with spans.span("compress") as span:
+            point_arrays, model_points = compression.compress(policies_df)
+            sample_df = compression.validation_sample(policies_df, f"{product_code}|{policy_range}")
+            validation = compression.validate(sample_df, np.asarray(discount))
+            span["rows"] = model_points
+
+    with spans.span("compute"):
+        if compress:
+            scenario_reserves, _, sensitivity_reserves = sensitivities.project(point_arrays, np.asarray(discount), specs)
+        elif ENGINE_KERNEL == "reference":
+            # The reference kernel discounts from the raw rates, independently of the curve tables;
+            # sensitivities still come from the vectorised kernel
+            _, scenario_rates = scenario_cache.get(engine_input.get("scenarioId"), load_scenarios)
+            rates = projection.tenor_rates(scenario_rates[scenario_start:scenario_stop])
+            policies = [dict(zip(arrays, values)) for values in zip(*arrays.values())]
+            scenario_reserves = np.array(projection.project_reserves_reference(policies, rates.tolist()))
+            sensitivity_reserves = sensitivities.project(arrays, np.asarray(discount), specs)[2] if specs else {}
+        else:
+            scenario_reserves, policy_sums, sensitivity_reserves = sensitivities.project(arrays, np.asarray(discount), specs)
+
+    partial = aggregation.partial_aggregate(
+        scenario_start, scenario_reserves, len(policies_df), arrays["account_value"].sum(), model_points, validation,
+        sensitivity_reserves
+    )
+    with db.connect() as con:
+        if policy_sums is not None:
+            # Each policy's share of its mean reserve over all of the job's scenarios, for the drill-down store
+            with spans.span("write_results") as span:
+                result_store.write_policy_results(
+                    con, job_id, product_code, policy_range, scenario_start, policies_df,
+                    policy_sums / max(engine_input.get("n_scenarios") or 1, 1)
+                )
+                span["rows"] = len(policies_df)
+        save_checkpoint(con, job_id, spans.batch, partial)
+        spans.flush(con)
+        con.commit()
+
+    logging.info(f"Job {job_id}: projected {len(policies_df)} policies over scenarios {scenario_start}-{scenario_stop} for product {product_code}.")
+    return partial
 
 @bp.activity_trigger(input_name="result_data")
 def SaveFinalResults(result_data: dict):
-    """Activity: Saves the final aggregated result and marks the job as Complete."""
-    job_id = result_data['job_id']; total_reserve = result_data['total_reserve']
-    engine = get_sql_engine()
-    with engine.connect() as con:
-        con.execute(text("INSERT INTO Results (JobID, Result_Type, Result_Value) VALUES (:jobid, 'Aggregated_Reserve', :resval)"), {"jobid": job_id, "resval": total_reserve})
-        con.execute(text("UPDATE CalculationJobs SET Job_Status = 'Complete', Completed_Timestamp = GETDATE() WHERE JobID = :jobid"), {"jobid": job_id})
+    """Activity: Saves the final aggregated result, the per-product results and new cache entries, and marks the job as Complete."""
+    job_id = result_data['job_id']
+    spans = telemetry.JobTelemetry(job_id, "SaveFinalResults")
+    with db.connect() as con:
+        with spans.span("write_results"):
+            for result_type, value in aggregation.result_rows(result_data["total"]).items():
+                con.execute(db.INSERT_RESULT, {"jobid": job_id, "rtype": result_type, "resval": value})
+            # Product aggregates are kept so later policy edits can be applied as deltas (see delta.py)
+            for product_code, product in result_data.get("products", {}).items():
+                con.execute(db.INSERT_JOB_PRODUCT_RESULT, {
+                    "jobid": job_id, "pcode": product_code, "resval": aggregation.mean_reserve(product["aggregate"]),
+                    "hit": product["cache_hit"], "aggregate": json.dumps(product["aggregate"])
+                })
+            result_store.write_scenario_results(
+                con, job_id, {pc: product["aggregate"] for pc, product in result_data.get("products", {}).items()}
+            )
+            result_cache.store(con, result_data.get("cache_keys", {}), result_data.get("computed", {}))
+            con.execute(db.SET_JOB_COMPLETE, {"jobid": job_id})
+            user_versions.bump_for_job(con, job_id)
+        spans.flush(con)
         con.commit()
     logging.info(f"Successfully saved final results for job ID: {job_id}")
 
 @bp.activity_trigger(input_name="job_id")
 def UpdateJobStatusToFailed(job_id: int):
     """Activity: Marks a job as Failed in the database."""
-    engine = get_sql_engine()
-    with engine.connect() as con:
-        con.execute(text("UPDATE CalculationJobs SET Job_Status = 'Failed' WHERE JobID = :jobid"), {"jobid": job_id})
+    with db.connect() as con:
+        con.execute(db.SET_JOB_FAILED, {"jobid": job_id})
+        user_versions.bump_for_job(con, job_id)
         con.commit()
-    logging.error(f"Marked job ID: {job_id} as Failed.")
\ No newline at end of file
+    logging.error(f"Marked job ID: {job_id} as Failed.")
+# =================================================================
+#  RESUMING FAILED JOBS
+# =================================================================
+
+@bp.function_name(name="HttpResumeCalculationJob")
+@bp.route(route="jobs/{jobId}/resume", methods=["POST"])
+@bp.durable_client_input(client_name="client")
+async def http_resume_calculation_job(req: func.HttpRequest, client) -> func.HttpResponse:
+    """
+    Restarts a Failed job under its original JobID and batch plan. Batches it checkpointed before
+    failing are not run again; the rest read the policies as they are now.
+    """
+    user_id = req.headers.get("x-ms-client-principal-id")
+    if not user_id: return func.HttpResponse("Unauthorized.", status_code=401)
+    try:
+        job_id = int(req.route_params.get("jobId"))
+    except (TypeError, ValueError):
+        return func.HttpResponse("jobId must be an integer.", status_code=400)
+
+    with db.connect() as con:
+        job = con.execute(db.SELECT_JOB_FOR_RESUME, {"jid": job_id, "uid": user_id}).mappings().fetchone()
+        if job is None:
+            return func.HttpResponse("Job not found or you do not have permission to resume it.", status_code=404)
+        if not con.execute(db.RESUME_JOB, {"jobid": job_id}).rowcount:
+            return func.HttpResponse(f"Job {job_id} is {job['Job_Status']}; only failed jobs can be resumed.", status_code=409)
+        user_versions.bump(con, user_id, user_versions.JOBS)
+        con.commit()
+
+    instance_id = await client.start_new("CalculationOrchestrator", None, {
+        "resumeJobId": job_id,
+        "user_id": user_id,
+        "productCodes": json.loads(job["Product_Code"]),
+        "scenarioId": job["ScenarioSetID"],
+        "runStochastic": bool(job["RunStochastic"]),
+        "compression": bool(job["Compression"]),
+        "sensitivities": json.loads(job["Sensitivities"] or "[]"),
+    })
+    logging.info(f"Resuming job {job_id} as orchestration {instance_id}.")
+    return client.create_check_status_response(req, instance_id)
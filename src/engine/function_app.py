@@ -1,16 +1,32 @@
 import logging
 import os
 import json
-import urllib
-import io
+import threading
+import time
+import uuid
+from collections import OrderedDict
 from datetime import datetime, timedelta
 
 import azure.functions as func
 import azure.durable_functions as df
 import pandas as pd
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
 from azure.storage.blob import BlobServiceClient, generate_blob_sas, BlobSasPermissions
 
+import curves
+import db
+import delta
+import ingest
+import pagination
+import policy_terms
+import result_cache
+import result_store
+import set_summaries
+import snapshots
+import telemetry
+import user_versions
+import validation
+
 # --- 1. Main App and Blueprint Registration ---
 # Create the main app object
 app = func.FunctionApp(http_auth_level=func.AuthLevel.ANONYMOUS)
@@ -29,16 +45,69 @@ def get_user_id(req: func.HttpRequest) -> str:
     logging.info(f"Extracting user ID from request headers: {headers}")
     return req.headers.get("x-ms-client-principal-id")
 
-def get_sql_engine():
-    """Creates a reusable, secure SQL engine connection."""
-    sql_conn_str = os.environ.get("SqlConnectionString")
-    params = urllib.parse.quote_plus(sql_conn_str)
-    return create_engine(f"mssql+pyodbc:///?odbc_connect={params}")
+def invalidate_policy_set(con, policy_id: str, user_id: str):
+    """
+    Marks the set holding a policy as edited: clears its content hash (so cached results
+    are no longer reused) and bumps its EditVersion (so the engine reads the set from SQL
+    until its snapshot is rebuilt). Returns the PolicySetID, or None if the policy doesn't exist for this user.
+    """
+    policy_set_id = con.execute(db.SELECT_POLICY_SET_FOR_POLICY, {"pid": policy_id, "uid": user_id}).scalar()
+    if policy_set_id is not None:
+        con.execute(db.MARK_POLICY_SET_EDITED, {"sid": policy_set_id})
+    return policy_set_id
+
+# Edited sets are rebuilt once their edits have been quiet this long, or at the latest this long after the first unrebuilt edit
+SNAPSHOT_REBUILD_QUIET_SECONDS = int(os.environ.get("SnapshotRebuildQuietSeconds", 60))
+SNAPSHOT_REBUILD_MAX_WAIT_SECONDS = int(os.environ.get("SnapshotRebuildMaxWaitSeconds", 900))
+
+def rebuild_policy_snapshot(policy_set_id):
+    """
+    Rewrites an edited policy set's Parquet snapshot from SQL as the generation of its current
+    EditVersion and restores its content hash. If another edit lands meanwhile the snapshot
+    stays behind (a later timer run catches up) and the engine keeps reading the set from SQL.
+    """
+    with db.connect() as con:
+        version = con.execute(db.SELECT_POLICY_SET_EDIT_VERSION, {"sid": policy_set_id}).scalar()
+        previous = snapshots.policy_snapshot_version(policy_set_id)
+        if version is None or previous == version:
+            return
+        snapshot = snapshots.policy_snapshot_writer(policy_set_id, {**ingest.POLICY_COLUMNS, **policy_terms.COLUMNS}, version)
+        hasher = result_cache.policy_hasher()
+        for chunk in pd.read_sql(db.SELECT_POLICY_SET_ROWS, con, params={"sid": policy_set_id}, chunksize=ingest.CHUNK_ROWS):
+            # Rows in SQL passed validation at ingest, so their terms parse; hashed as ingest hashed its clean chunks
+            converted = ingest.convert_types(chunk, ingest.POLICY_COLUMNS)
+            terms, _ = policy_terms.parse(converted)
+            rows = pd.concat([converted, terms], axis=1)
+            snapshot.write(rows)
+            hasher.update(rows)
+        if con.execute(db.COMPLETE_POLICY_SET_REBUILD, {"sid": policy_set_id, "version": version, "hash": hasher.hexdigest()}).rowcount:
+            snapshot.commit()
+            con.commit()
+            # The generation just replaced may still be mid-read by a running batch
+            snapshots.prune_policy_snapshot(policy_set_id, {previous or 0, version})
+
+# Users known to exist, so polling endpoints skip the Users lookup: UserID -> expiry on time.monotonic()
+# Entries expire in insertion order, so expired ones are dropped from the front and the oldest go past the size cap
+PROVISIONED_USER_CACHE_SECONDS = float(os.environ.get("ProvisionedUserCacheSeconds", 600))
+PROVISIONED_USER_CACHE_SIZE = int(os.environ.get("ProvisionedUserCacheSize", 10_000))
+_provisioned_users = OrderedDict()
+_provisioned_users_lock = threading.Lock()
+
+def _remember_provisioned(user_id: str):
+    now = time.monotonic()
+    with _provisioned_users_lock:
+        _provisioned_users[user_id] = now + PROVISIONED_USER_CACHE_SECONDS
+        _provisioned_users.move_to_end(user_id)
+        while _provisioned_users and (
+            len(_provisioned_users) > PROVISIONED_USER_CACHE_SIZE or next(iter(_provisioned_users.values())) <= now
+        ):
+            _provisioned_users.popitem(last=False)
 
 def provision_user_if_not_exists(user_id: str, req: func.HttpRequest, con):
     """Checks for a user and creates them on their first API call (JIT Provisioning)."""
-    user_check_query = text("SELECT COUNT(1) FROM Users WHERE UserID = :uid")
-    user_exists = con.execute(user_check_query, {"uid": user_id}).scalar()
+    if _provisioned_users.get(user_id, 0) > time.monotonic():
+        return
+    user_exists = con.execute(db.USER_EXISTS, {"uid": user_id}).scalar()
     
     if not user_exists:
         logging.info(f"New user detected. Provisioning user ID: {user_id}")
@@ -46,9 +115,15 @@ def provision_user_if_not_exists(user_id: str, req: func.HttpRequest, con):
         display_name = req.headers.get("x-ms-client-principal-name") # Simple default
         idp = req.headers.get("x-ms-client-principal-provider")
         
-        provision_query = text("INSERT INTO Users (UserID, IdentityProvider, Email, DisplayName) VALUES (:uid, :idp, :email, :name)")
-        con.execute(provision_query, {"uid": user_id, "idp": idp, "email": user_email, "name": display_name})
+        con.execute(db.INSERT_USER, {"uid": user_id, "idp": idp, "email": user_email, "name": display_name})
         con.commit()
+    _remember_provisioned(user_id)
+
+def not_modified(req: func.HttpRequest, tag: str):
+    """A 304 response if the request's If-None-Match still matches the listing's ETag, else None."""
+    if user_versions.matches(req.headers.get("If-None-Match"), tag):
+        return func.HttpResponse(status_code=304, headers=user_versions.headers(tag))
+    return None
 
 # =================================================================
 #  SECTION 1: DATA MANAGEMENT API
@@ -62,11 +137,13 @@ def http_list_policy_sets(req: func.HttpRequest) -> func.HttpResponse:
     if not user_id: return func.HttpResponse("Unauthorized.", status_code=401)
     
     try:
-        engine = get_sql_engine()
-        with engine.connect() as con:
-            query = text("SELECT PolicySetID as id, SetName as name,RecordCount, UploadTimestamp as createdAt FROM PolicySets WHERE UserID = :uid ORDER BY UploadTimestamp DESC")
-            df = pd.read_sql(query, con, params={"uid": user_id})
-        return func.HttpResponse(df.to_json(orient='records', date_format='iso'), mimetype="application/json")
+        # The version is read before the listing, so a change racing this request only makes the ETag older
+        tag = user_versions.etag(user_id, user_versions.POLICY_SETS)
+        cached = not_modified(req, tag)
+        if cached: return cached
+        with db.connect() as con:
+            df = pd.read_sql(db.LIST_POLICY_SETS, con, params={"uid": user_id})
+        return func.HttpResponse(df.to_json(orient='records', date_format='iso'), mimetype="application/json", headers=user_versions.headers(tag))
     except Exception as e:
         logging.error(f"Error fetching policy sets for user {user_id}: {e}", exc_info=True)
         return func.HttpResponse(f"Error fetching policy sets: {e}", status_code=500)
@@ -104,16 +181,36 @@ def http_get_upload_url_for_policies(req: func.HttpRequest) -> func.HttpResponse
 @app.function_name(name="HttpGetPolicies")
 @app.route(route="policies", methods=["GET"])
 def http_get_policies(req: func.HttpRequest) -> func.HttpResponse:
+    """
+    Returns one keyset-paginated page of a policy set.
+
+    Optional query parameters: fields (comma-separated projection), sort (Policy_ID or
+    Product_Code, '-' prefix for descending), Product_Code (filter), limit, cursor and
+    format (json, ndjson or arrow). The cursor for the next page is returned in the
+    X-Next-Cursor header and is absent on the last page.
+    """
     user_id = get_user_id(req); set_id = req.params.get('setId')
     if not user_id: return func.HttpResponse("Unauthorized.", status_code=401)
     if not set_id: return func.HttpResponse("setId query parameter is required.", status_code=400)
+
+    fmt = req.params.get('format') or "json"
+    if fmt not in pagination.FORMATS:
+        return func.HttpResponse(f"format must be one of: {', '.join(pagination.FORMATS)}", status_code=400)
+    try:
+        query, params, sort_column, limit = pagination.build_page_query(user_id, set_id, req.params)
+    except ValueError as e:
+        return func.HttpResponse(f"Invalid query: {e}", status_code=400)
     
     try:
-        engine = get_sql_engine()
-        with engine.connect() as con:
-            query = text("SELECT Policy_ID as id, * FROM Policies WHERE UserID = :uid AND PolicySetID = :sid")
-            df = pd.read_sql(query, con, params={"uid": user_id, "sid": set_id})
-        return func.HttpResponse(df.to_json(orient='records'), mimetype="application/json")
+        with db.connect() as con:
+            page = pd.read_sql(query, con, params=params)
+
+        # One extra row is fetched to tell whether another page follows
+        headers = {"Access-Control-Expose-Headers": "X-Next-Cursor"}
+        if len(page) > limit:
+            page = page.iloc[:limit]
+            headers["X-Next-Cursor"] = pagination.next_cursor(page, sort_column)
+        return func.HttpResponse(pagination.serialize_page(page, fmt), mimetype=pagination.FORMATS[fmt], headers=headers)
     except Exception as e:
         return func.HttpResponse(f"Error fetching policies: {e}", status_code=500)
 
@@ -127,12 +224,13 @@ def http_list_scenario_sets(req: func.HttpRequest) -> func.HttpResponse:
     if not user_id: return func.HttpResponse("Unauthorized.", status_code=401)
     
     try:
-        engine = get_sql_engine()
-        with engine.connect() as con:
-            query = text("SELECT ScenarioSetID as id, SetName as name, Granularity, CreatedTimestamp as createdAt FROM ScenarioSets WHERE UserID = :uid ORDER BY CreatedTimestamp DESC")
-            sets_df = pd.read_sql(query, con, params={"uid": user_id})
+        tag = user_versions.etag(user_id, user_versions.SCENARIO_SETS)
+        cached = not_modified(req, tag)
+        if cached: return cached
+        with db.connect() as con:
+            sets_df = pd.read_sql(db.LIST_SCENARIO_SETS, con, params={"uid": user_id})
         
-        return func.HttpResponse(sets_df.to_json(orient='records', date_format='iso'), mimetype="application/json")
+        return func.HttpResponse(sets_df.to_json(orient='records', date_format='iso'), mimetype="application/json", headers=user_versions.headers(tag))
     except Exception as e:
         logging.error(f"Error fetching scenario sets for user {user_id}: {e}", exc_info=True)
         return func.HttpResponse(f"Error fetching scenario sets: {e}", status_code=500)
@@ -174,7 +272,8 @@ def http_get_upload_url_for_scenarios(req: func.HttpRequest) -> func.HttpRespons
 
 @app.function_name(name="HttpUpdatePolicy")
 @app.route(route="policies/update", auth_level=func.AuthLevel.FUNCTION, methods=["POST"])
-def http_update_policy(req: func.HttpRequest) -> func.HttpResponse:
+@app.queue_output(arg_name="delta_queue", queue_name="delta-recalculations", connection="AzureWebJobsStorage")
+def http_update_policy(req: func.HttpRequest, delta_queue: func.Out[str]) -> func.HttpResponse:
     """Updates one or more fields for a single policy record."""
     user_id = get_user_id(req)
     if not user_id: return func.HttpResponse("Unauthorized", status_code=401)
@@ -203,16 +302,26 @@ def http_update_policy(req: func.HttpRequest) -> func.HttpResponse:
             
         set_clause = ", ".join(update_fields)
         
-        engine = get_sql_engine()
-        with engine.connect() as con:
+        with db.connect() as con:
             # Note the WHERE clause includes UserID for security
             query = text(f"UPDATE Policies SET {set_clause} WHERE Policy_ID = :pid AND UserID = :uid")
+            policy_set_id = invalidate_policy_set(con, policy_id, user_id)
+            edited = con.execute(db.SELECT_EDIT_TIMESTAMP).scalar()
+            old_row = delta.engine_row(con, policy_id, user_id)
             result = con.execute(query, params)
+            new_row = delta.engine_row(con, policy_id, user_id)
+            set_summaries.apply_policy_edit(con, policy_set_id, old_row, new_row)
+            user_versions.bump(con, user_id, user_versions.POLICY_SETS)
             con.commit()
             
             if result.rowcount == 0:
                 return func.HttpResponse("Policy not found or you do not have permission.", status_code=404)
 
+        # Patch the latest job's results in the background instead of rerunning it
+        delta_queue.set(json.dumps({
+            "edit_id": uuid.uuid4().hex, "edited": edited, "user_id": user_id, "old_row": old_row, "new_row": new_row
+        }))
+
         return func.HttpResponse(f"Policy {policy_id} updated successfully.", status_code=200)
     except Exception as e:
         return func.HttpResponse(f"Error updating policy: {e}", status_code=500)
@@ -220,7 +329,8 @@ def http_update_policy(req: func.HttpRequest) -> func.HttpResponse:
 
 @app.function_name(name="HttpDeletePolicy")
 @app.route(route="policies/{policyId}", auth_level=func.AuthLevel.FUNCTION, methods=["DELETE"])
-def http_delete_policy(req: func.HttpRequest) -> func.HttpResponse:
+@app.queue_output(arg_name="delta_queue", queue_name="delta-recalculations", connection="AzureWebJobsStorage")
+def http_delete_policy(req: func.HttpRequest, delta_queue: func.Out[str]) -> func.HttpResponse:
     """Deletes a single policy record."""
     user_id = get_user_id(req)
     if not user_id: return func.HttpResponse("Unauthorized", status_code=401)
@@ -228,20 +338,52 @@ def http_delete_policy(req: func.HttpRequest) -> func.HttpResponse:
     policy_id = req.route_params.get('policyId')
     
     try:
-        engine = get_sql_engine()
-        with engine.connect() as con:
+        with db.connect() as con:
             # The WHERE clause ensures a user can only delete their own policies
-            query = text("DELETE FROM Policies WHERE Policy_ID = :pid AND UserID = :uid")
-            result = con.execute(query, {"pid": policy_id, "uid": user_id})
+            policy_set_id = invalidate_policy_set(con, policy_id, user_id)
+            edited = con.execute(db.SELECT_EDIT_TIMESTAMP).scalar()
+            old_row = delta.engine_row(con, policy_id, user_id)
+            result = con.execute(db.DELETE_POLICY, {"pid": policy_id, "uid": user_id})
+            set_summaries.apply_policy_edit(con, policy_set_id, old_row, None)
+            user_versions.bump(con, user_id, user_versions.POLICY_SETS)
             con.commit()
 
             if result.rowcount == 0:
                 return func.HttpResponse("Policy not found or you do not have permission.", status_code=404)
-                
+
+        delta_queue.set(json.dumps({
+            "edit_id": uuid.uuid4().hex, "edited": edited, "user_id": user_id, "old_row": old_row, "new_row": None
+        }))
         return func.HttpResponse(f"Policy {policy_id} deleted successfully.", status_code=204) # 204 No Content is best for DELETE
     except Exception as e:
         return func.HttpResponse(f"Error deleting policy: {e}", status_code=500)
 
+@app.function_name(name="QueueDeltaRecalculation")
+@app.queue_trigger(arg_name="msg", queue_name="delta-recalculations", connection="AzureWebJobsStorage")
+def queue_delta_recalculation(msg: func.QueueMessage):
+    """Applies a queued policy edit to the user's latest completed job for the policy's product requested before the edit."""
+    edit = msg.get_json()
+    delta.apply_policy_delta(edit["user_id"], edit["old_row"], edit["new_row"], edit.get("edit_id"), edit.get("edited"))
+
+@app.function_name(name="TimerRebuildPolicySnapshots")
+@app.timer_trigger(schedule="0 */1 * * * *", arg_name="timer", run_on_startup=False)
+def timer_rebuild_policy_snapshots(timer: func.TimerRequest):
+    """
+    Rebuilds the snapshots of edited policy sets once their edits have settled, so a burst of
+    single-policy edits costs one rewrite of the set rather than one per edit. Until then the
+    engine reads those sets from SQL.
+    """
+    with db.connect() as con:
+        due = [row[0] for row in con.execute(db.SELECT_POLICY_SETS_DUE_FOR_REBUILD, {
+            "quiet": SNAPSHOT_REBUILD_QUIET_SECONDS, "maxwait": SNAPSHOT_REBUILD_MAX_WAIT_SECONDS
+        })]
+    for policy_set_id in due:
+        try:
+            rebuild_policy_snapshot(policy_set_id)
+        except Exception as e:
+            # Still due, so the next run retries it
+            logging.error(f"Error rebuilding the snapshot of PolicySetID {policy_set_id}: {e}", exc_info=True)
+
 # =================================================================
 #  SECTION 2: CALCULATION LAB & JOB HISTORY API
 # =================================================================
@@ -257,11 +399,14 @@ def http_get_product_codes_for_sets(req: func.HttpRequest) -> func.HttpResponse:
     
     try:
         set_ids = [int(s_id) for s_id in set_ids_str.split(',')]
-        engine = get_sql_engine()
-        with engine.connect() as con:
+        with db.connect() as con:
             placeholders = ','.join([f':id{i}' for i in range(len(set_ids))])
             params = {'uid': user_id, **{f'id{i}': s_id for i, s_id in enumerate(set_ids)}}
-            query = text(f"SELECT DISTINCT Product_Code FROM Policies WHERE UserID = :uid AND PolicySetID IN ({placeholders})")
+            # Read from the per-set summary filled at ingest (see set_summaries.py), not from Policies
+            query = text(
+                "SELECT DISTINCT p.Product_Code FROM PolicySetProducts p JOIN PolicySets s ON s.PolicySetID = p.PolicySetID "
+                f"WHERE s.UserID = :uid AND p.PolicySetID IN ({placeholders}) AND p.PolicyCount > 0 ORDER BY p.Product_Code"
+            )
             df = pd.read_sql(query, con, params=params)
         return func.HttpResponse(json.dumps(df['Product_Code'].tolist()), mimetype="application/json")
     except Exception as e:
@@ -275,12 +420,14 @@ def http_get_jobs(req: func.HttpRequest) -> func.HttpResponse:
     if not user_id: return func.HttpResponse("Unauthorized.", status_code=401)
     
     try:
-        engine = get_sql_engine()
-        with engine.connect() as con:
+        # A matching ETag came from an earlier response to this user, so they are already provisioned
+        tag = user_versions.etag(user_id, user_versions.JOBS)
+        cached = not_modified(req, tag)
+        if cached: return cached
+        with db.connect() as con:
             provision_user_if_not_exists(user_id, req, con)
-            query = text("SELECT JobID as jobId, Job_Status as status, Requested_Timestamp as requestedTimestamp FROM CalculationJobs WHERE UserID = :uid ORDER BY JobID DESC")
-            df = pd.read_sql(query, con, params={"uid": user_id})
-        return func.HttpResponse(df.to_json(orient='records', date_format='iso'), mimetype="application/json")
+            df = pd.read_sql(db.LIST_JOBS, con, params={"uid": user_id})
+        return func.HttpResponse(df.to_json(orient='records', date_format='iso'), mimetype="application/json", headers=user_versions.headers(tag))
     except Exception as e:
         logging.error(f"Error fetching job history for user {user_id}: {e}", exc_info=True)
         return func.HttpResponse(f"Error fetching job history: {e}", status_code=500)
@@ -292,6 +439,9 @@ def http_get_job_results(req: func.HttpRequest) -> func.HttpResponse:
     """
     This function retrieves the final calculated results and generates
     an AI narrative for a specific, completed job.
+
+    Drill-downs from the job's result store are opt-in via ?include=contributors,scenarios
+    (with optional ?top=N and ?product=CODE); the product breakdown is always returned.
     """
     user_id = get_user_id(req)
     if not user_id: return func.HttpResponse("Unauthorized.", status_code=401)
@@ -299,22 +449,34 @@ def http_get_job_results(req: func.HttpRequest) -> func.HttpResponse:
     job_id = req.route_params.get('jobId')
     if not job_id: return func.HttpResponse("jobId is required.", status_code=400)
 
+    include = {part.strip() for part in (req.params.get('include') or "").split(',') if part.strip()}
+    product_code = req.params.get('product')
+    try:
+        top_n = int(req.params.get('top') or result_store.DEFAULT_TOP_N)
+    except ValueError:
+        return func.HttpResponse("top must be an integer.", status_code=400)
+
     try:
-        engine = get_sql_engine()
-        with engine.connect() as con:
+        with db.connect() as con:
             # --- Security Check: Verify this job belongs to the logged-in user ---
-            job_check_query = text("SELECT Product_Code FROM CalculationJobs WHERE JobID = :jid AND UserID = :uid")
-            job_info = con.execute(job_check_query, {"jid": job_id, "uid": user_id}).fetchone()
+            job_info = con.execute(db.SELECT_JOB_FOR_USER, {"jid": job_id, "uid": user_id}).fetchone()
             
             if not job_info:
                 return func.HttpResponse("Job not found or you do not have permission to view it.", status_code=404)
             
             # --- Fetch the numerical results from the Results table ---
-            results_query = text("SELECT Result_Type, Result_Value FROM Results WHERE JobID = :jid")
-            results_df = pd.read_sql(results_query, con, params={"jid": job_id})
+            results_df = pd.read_sql(db.SELECT_JOB_RESULTS, con, params={"jid": job_id})
             
             # Convert the results dataframe into a simple dictionary
-            numerical_results = dict(zip(results_df.Result_Type, results_df.Result_Value))
+            numerical_results = dict(zip(results_df.Result_Type, results_df.Result_Value.astype(float)))
+
+            # --- Drill-downs: the product breakdown comes from SQL, the rest from the columnar result store ---
+            breakdown_df = pd.read_sql(db.SELECT_JOB_PRODUCT_BREAKDOWN, con, params={"jid": job_id})
+            drill_downs = {"products": json.loads(breakdown_df.to_json(orient='records'))}
+            if "contributors" in include:
+                drill_downs["topContributors"] = result_store.top_contributors(con, job_id, top_n, product_code)
+            if "scenarios" in include:
+                drill_downs["scenarioDistribution"] = result_store.scenario_distribution(con, job_id, product_code)
 
         # --- AI Narrative Generation (Placeholder for the real call) ---
         # In a real implementation, you would send the 'numerical_results' object
@@ -324,11 +486,14 @@ def http_get_job_results(req: func.HttpRequest) -> func.HttpResponse:
             f"The primary calculation, Deterministic_Reserve_Monthly, resulted in a value of ${numerical_results.get('Aggregated_Reserve', 0):,.2f}. "
             "Further analysis of stochastic scenarios and assumption attribution is recommended."
         )
+        if 'CTE_70' in numerical_results:
+            ai_narrative += f" The stochastic reserve, CTE(70) over all scenarios, is ${numerical_results['CTE_70']:,.2f}."
 
         # --- Assemble the final report payload ---
         final_report = {
             "aiNarrative": ai_narrative,
-            "numericalResults": numerical_results
+            "numericalResults": numerical_results,
+            **drill_downs
         }
         
         return func.HttpResponse(json.dumps(final_report), mimetype="application/json")
@@ -338,6 +503,32 @@ def http_get_job_results(req: func.HttpRequest) -> func.HttpResponse:
         return func.HttpResponse(f"Error fetching results: {e}", status_code=500)
 
 
+@app.function_name(name="HttpGetJobMetrics")
+@app.route(route="jobs/{jobId}/metrics", methods=["GET"])
+def http_get_job_metrics(req: func.HttpRequest) -> func.HttpResponse:
+    """Returns a job's timing spans per activity, batch and phase, with a critical-path summary."""
+    user_id = get_user_id(req)
+    if not user_id: return func.HttpResponse("Unauthorized.", status_code=401)
+
+    job_id = req.route_params.get('jobId')
+    if not job_id: return func.HttpResponse("jobId is required.", status_code=400)
+
+    try:
+        with db.connect() as con:
+            if not con.execute(db.SELECT_JOB_FOR_USER, {"jid": job_id, "uid": user_id}).fetchone():
+                return func.HttpResponse("Job not found or you do not have permission to view it.", status_code=404)
+            metrics_df = pd.read_sql(db.SELECT_JOB_METRICS, con, params={"jid": job_id})
+
+        payload = {
+            "summary": telemetry.critical_path(metrics_df),
+            "spans": json.loads(metrics_df.to_json(orient='records', date_format='iso')),
+        }
+        return func.HttpResponse(json.dumps(payload), mimetype="application/json")
+    except Exception as e:
+        logging.error(f"Error fetching metrics for job {job_id}: {e}", exc_info=True)
+        return func.HttpResponse(f"Error fetching metrics: {e}", status_code=500)
+
+
 @app.function_name(name="HttpGetJobEmbedToken")
 @app.route(route="jobs/{jobId}/embed-token", methods=["GET"])
 def http_get_job_embed_token(req: func.HttpRequest) -> func.HttpResponse:
@@ -378,40 +569,56 @@ def blob_ingest_policies(blob: func.InputStream):
         logging.error("FATAL: SqlConnectionString setting is missing.")
         return # Cannot proceed
 
+    policy_set_id = None
     try:
-        # --- Data Validation & Processing ---
-        csv_data = blob.read()
-        df = pd.read_csv(io.BytesIO(csv_data))
-
-        # TODO: Implement your data compliance/validation logic here.
-        # For now, we assume the file is good.
-        # In a real app, you would split good/bad rows and save bad rows to a 'quarantine' container.
-
         # --- Database Operations ---
-        engine = get_sql_engine()
-        with engine.connect() as con:
-            # 1. Create a new PolicySet record for this upload
-            set_insert_query = text("INSERT INTO PolicySets (UserID, SetName, OriginalFileName, RecordCount) OUTPUT INSERTED.PolicySetID VALUES (:uid, :sname, :fname, :rcount)")
-            policy_set_id = con.execute(set_insert_query, {
+        with db.connect() as con:
+            # 1. Create a new PolicySet record for this upload; RecordCount is filled in once the load finishes
+            policy_set_id = con.execute(db.INSERT_POLICY_SET, {
                 "uid": user_id,
                 "sname": f"Set from {original_file_name}",
-                "fname": original_file_name,
-                "rcount": len(df)
+                "fname": original_file_name
             }).scalar()
+            user_versions.bump(con, user_id, user_versions.POLICY_SETS)
             con.commit()
 
-            
-            df['UserID'] = user_id
-            df['PolicySetID'] = policy_set_id
-            
-            # 3. Load the validated data into the master Policies table
-            # We use 'append' because we are adding a new set, not replacing all policies.
-            df.to_sql('Policies', con=engine, if_exists='append', index=False, chunksize=1000)
+            # 2. Validate and stream the file into the master Policies table, committing chunk by chunk
+            #    (readers skip the set until it is Ready),
+            #    quarantining rows that fail validation (see validation.py),
+            #    writing the engine's Parquet snapshot alongside (with the parsed contract fields, see policy_terms.py)
+            #    the content hash used by the result cache and the set's per-product summary
+            snapshot = snapshots.policy_snapshot_writer(policy_set_id, {**ingest.POLICY_COLUMNS, **policy_terms.COLUMNS})
+            hasher = result_cache.policy_hasher()
+            summary = set_summaries.PolicySetSummary()
+            quarantine = validation.QuarantineWriter(user_id, "policies", policy_set_id)
+            record_count = ingest.stream_csv_into_table(
+                con, ingest.open_blob_stream(blob), "Policies", ingest.POLICY_COLUMNS,
+                constants={"UserID": user_id, "PolicySetID": policy_set_id},
+                progress=(db.UPDATE_POLICY_SET_PROGRESS, {"sid": policy_set_id}),
+                sinks=(snapshot.write, hasher.update, summary.update),
+                validator=validation.ChunkValidator(validation.POLICY_RULES, terms=True, existing_keys=validation.stored_policy_ids),
+                quarantine=quarantine
+            )
+            snapshot.commit()
+
+            summary.write(con, policy_set_id)
+
+            con.execute(db.COMPLETE_POLICY_SET, {
+                "sid": policy_set_id, "rcount": record_count, "rejected": quarantine.rows, "hash": hasher.hexdigest()
+            })
+            user_versions.bump(con, user_id, user_versions.POLICY_SETS)
+            con.commit()
         
-        logging.info(f"Successfully ingested PolicySetID {policy_set_id} for user {user_id}.")
+        logging.info(f"Successfully ingested PolicySetID {policy_set_id} ({record_count} rows, {quarantine.rows} quarantined) for user {user_id}.")
 
     except Exception as e:
         logging.error(f"Error processing blob {blob.name}: {e}", exc_info=True)
+        if policy_set_id is not None:
+            with db.connect() as con:
+                con.execute(db.FAIL_POLICY_SET, {"sid": policy_set_id})
+                con.execute(db.DELETE_POLICY_SET_ROWS, {"sid": policy_set_id})
+                user_versions.bump(con, user_id, user_versions.POLICY_SETS)
+                con.commit()
         
 
 
@@ -430,29 +637,63 @@ def blob_ingest_scenarios(blob: func.InputStream):
     if not sql_connection_string:
         logging.error("FATAL: SqlConnectionString setting is missing.")
         return # Cannot proceed
-    # --- Data Validation & Processing ---
-    csv_data = blob.read()
-    df = pd.read_csv(io.BytesIO(csv_data))
-
-    # TODO: Implement your data compliance/validation logic here.
-    # For now, we assume the file is good.
-    # In a real app, you would split good/bad rows and save bad rows to a 'quarantine' container.
-
-    # --- Database Operations ---
-    engine = get_sql_engine()
-    with engine.connect() as con:
-        # 1. Create a new ScenarioSet record for this upload
-        set_insert_query = text("INSERT INTO ScenarioSets (UserID, SetName, OriginalFileName, Granularity) OUTPUT INSERTED.ScenarioSetID VALUES (:uid, :sname, :fname, :gran)")
-        scenario_set_id = con.execute(set_insert_query, {
-            "uid": user_id,
-            "sname": f"Set from {original_file_name}",
-            "fname": original_file_name,
-            "gran": "Monthly"  # Assuming monthly granularity for now
-        }).scalar()
-        con.commit()
 
-        df['UserID'] = user_id
-        df['ScenarioSetID'] = scenario_set_id
-        
-        # 3. Load the validated data into the master EconomicScenarios table
-        df.to_sql('EconomicScenarios', con=engine, if_exists='append', index=False, chunksize=1000) 
\ No newline at end of file
+    scenario_set_id = None
+    try:
+        # --- Database Operations ---
+        with db.connect() as con:
+            # 1. Create a new ScenarioSet record for this upload
+            scenario_set_id = con.execute(db.INSERT_SCENARIO_SET, {
+                "uid": user_id,
+                "sname": f"Set from {original_file_name}",
+                "fname": original_file_name,
+                "gran": "Monthly"  # Assuming monthly granularity for now
+            }).scalar()
+            user_versions.bump(con, user_id, user_versions.SCENARIO_SETS)
+            con.commit()
+
+            # 2. Validate and stream the file into the master EconomicScenarios table, committing chunk by chunk
+            #    (readers skip the set until it is Ready),
+            #    quarantining rows that fail validation (see validation.py),
+            #    writing the engine's Parquet snapshot alongside
+            #    the content hash used by the result cache and the set's scenario/month counts
+            snapshot = snapshots.scenario_snapshot_writer(scenario_set_id, ingest.SCENARIO_COLUMNS)
+            hasher = result_cache.scenario_hasher()
+            summary = set_summaries.ScenarioSetSummary()
+            quarantine = validation.QuarantineWriter(user_id, "scenarios", scenario_set_id)
+            record_count = ingest.stream_csv_into_table(
+                con, ingest.open_blob_stream(blob), "EconomicScenarios", ingest.SCENARIO_COLUMNS,
+                constants={"UserID": user_id, "ScenarioSetID": scenario_set_id},
+                progress=(db.UPDATE_SCENARIO_SET_PROGRESS, {"sid": scenario_set_id}),
+                sinks=(snapshot.write, hasher.update, summary.update),
+                validator=validation.ChunkValidator(validation.SCENARIO_RULES),
+                quarantine=quarantine
+            )
+            # A scenario missing any month (e.g. one quarantined) fails the set rather than shifting later months
+            summary.check()
+            snapshot.commit()
+
+            con.execute(db.COMPLETE_SCENARIO_SET, {
+                "sid": scenario_set_id, "rcount": record_count, "rejected": quarantine.rows,
+                "scenarios": summary.scenario_count, "months": summary.month_count, "hash": hasher.hexdigest()
+            })
+            user_versions.bump(con, user_id, user_versions.SCENARIO_SETS)
+            con.commit()
+
+        # 3. Precompute the set's discount factors for the engine;
+        #    if this fails the engine builds them on first use instead
+        try:
+            curves.build(scenario_set_id)
+        except Exception as e:
+            logging.warning(f"Could not build curve tables for ScenarioSetID {scenario_set_id}: {e}")
+
+        logging.info(f"Successfully ingested ScenarioSetID {scenario_set_id} ({record_count} rows, {quarantine.rows} quarantined) for user {user_id}.")
+
+    except Exception as e:
+        logging.error(f"Error processing blob {blob.name}: {e}", exc_info=True)
+        if scenario_set_id is not None:
+            with db.connect() as con:
+                con.execute(db.FAIL_SCENARIO_SET, {"sid": scenario_set_id})
+                con.execute(db.DELETE_SCENARIO_SET_ROWS, {"sid": scenario_set_id})
+                user_versions.bump(con, user_id, user_versions.SCENARIO_SETS)
+                con.commit()
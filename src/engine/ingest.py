@@ -0,0 +1,189 @@
+import io
+import logging
+import os
+import queue
+import threading
+
+import pandas as pd
+from azure.storage.blob import BlobClient
+
+# =================================================================
+#  STREAMING BULK INGESTION
+# =================================================================
+# Uploaded CSVs are parsed (and validated, see validation.py) in fixed-size
+# chunks on a background thread while the previous chunk is bulk-inserted,
+# so memory is bounded by a few chunks no matter how large the file is.
+# Each chunk is committed on its own, so the load never holds more than one
+# chunk's locks and the set's RowsLoaded progress is visible as it goes.
+# Readers skip a set until its IngestStatus is 'Ready'.
+
+CHUNK_ROWS = int(os.environ.get("IngestChunkRows", 50_000))
+PREFETCH_CHUNKS = 2
+
+# Target column -> type for each table; CSV columns not listed here are dropped.
+POLICY_COLUMNS = {
+    "Policy_ID": "str", "Product_Code": "str", "Valuation_Date": "date", "Issue_Date": "date",
+    "Issue_Age": "int", "Gender": "str", "Policy_Status_Code": "int", "Account_Value": "float",
+    "Surrender_Charge_Schedule": "str", "Guaranteed_Crediting_Rate": "float",
+    "Index_Strategy_Code": "str", "Sub_Account_Allocation": "str", "Rider_Codes": "str",
+    "GLWB_Benefit_Base": "float", "GLWB_Withdrawal_Rate": "float",
+}
+SCENARIO_COLUMNS = {
+    "ScenarioID": "int", "Month": "int",
+    "Rate_0_25_yr": "float", "Rate_0_5_yr": "float", "Rate_1_yr": "float", "Rate_2_yr": "float",
+    "Rate_3_yr": "float", "Rate_5_yr": "float", "Rate_7_yr": "float", "Rate_10_yr": "float",
+    "Rate_20_yr": "float", "Rate_30_yr": "float",
+}
+# DECIMAL scale of each float column in schema.sql, which SQL rounds stored values to
+POLICY_SCALES = {"Account_Value": 2, "Guaranteed_Crediting_Rate": 4, "GLWB_Benefit_Base": 2, "GLWB_Withdrawal_Rate": 4}
+SCENARIO_SCALES = {name: 8 for name, kind in SCENARIO_COLUMNS.items() if kind == "float"}
+
+
+class _ChunkStream(io.RawIOBase):
+    """Read-only file object over an iterator of byte chunks (e.g. a blob download)."""
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._buffer = memoryview(b"")
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self._buffer:
+            try:
+                self._buffer = memoryview(next(self._chunks))
+            except StopIteration:
+                return 0
+        n = min(len(b), len(self._buffer))
+        b[:n] = self._buffer[:n]
+        self._buffer = self._buffer[n:]
+        return n
+
+
+def open_blob_stream(blob):
+    """
+    Opens a triggering blob for chunked reading.
+
+    The blob is re-opened through the storage SDK and downloaded chunk by chunk;
+    if no storage connection is configured the trigger's InputStream is used as is.
+    """
+    storage_conn_str = os.environ.get("AzureWebJobsStorage")
+    if not storage_conn_str:
+        return blob
+    container_name, blob_name = blob.name.split('/', 1)
+    client = BlobClient.from_connection_string(storage_conn_str, container_name=container_name, blob_name=blob_name)
+    return io.BufferedReader(_ChunkStream(client.download_blob().chunks()), buffer_size=1024 * 1024)
+
+
+def convert_types(chunk: pd.DataFrame, columns: dict) -> pd.DataFrame:
+    """Projects a parsed chunk onto the table's columns and converts each column in one vectorized pass."""
+    converted = {}
+    for name, kind in columns.items():
+        if name not in chunk:
+            continue
+        values = chunk[name]
+        if kind == "int":
+            converted[name] = pd.to_numeric(values, errors="coerce").astype("Int64")
+        elif kind == "float":
+            converted[name] = pd.to_numeric(values, errors="coerce")
+        elif kind == "date":
+            converted[name] = pd.to_datetime(values, errors="coerce").dt.date
+        else:
+            converted[name] = values.astype("string")
+    return pd.DataFrame(converted)
+
+
+def iter_chunks(stream, columns: dict, chunk_rows: int = CHUNK_ROWS, validator=None):
+    """
+    Yields (clean, rejected) pairs of at most `chunk_rows` rows from a CSV stream: the
+    type-converted rows that passed `validator` (a validation.ChunkValidator) and the
+    rejected rows as uploaded. Without a validator every row is clean and rejected is None.
+    """
+    # Everything is read as text first so conversion happens once, in convert_types
+    for chunk in pd.read_csv(stream, chunksize=chunk_rows, dtype=str, keep_default_na=True):
+        converted = convert_types(chunk, columns)
+        if validator is None:
+            yield converted, None
+        else:
+            yield validator.split(chunk, converted)
+
+
+def prefetch(iterable, depth: int = PREFETCH_CHUNKS):
+    """Runs `iterable` on a background thread, keeping at most `depth` items buffered ahead of the consumer."""
+    buffer = queue.Queue(maxsize=depth)
+    done = object()
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                buffer.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put(item):
+                    return
+            put(done)
+        except BaseException as e:
+            put(e)
+
+    worker = threading.Thread(target=produce, daemon=True)
+    worker.start()
+    try:
+        while True:
+            item = buffer.get()
+            if item is done:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
+
+
+def bulk_insert(con, table: str, df: pd.DataFrame):
+    """Inserts a DataFrame with a single executemany (fast_executemany on the shared engine)."""
+    if df.empty:
+        return
+    columns = list(df.columns)
+    placeholders = ", ".join("?" for _ in columns)
+    insert_sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})"
+    rows = list(df.astype(object).where(df.notna(), None).itertuples(index=False, name=None))
+    con.exec_driver_sql(insert_sql, rows)
+
+
+def stream_csv_into_table(con, stream, table: str, columns: dict, constants: dict, progress=None, sinks=(),
+                          validator=None, quarantine=None) -> int:
+    """
+    Streams a CSV into `table`, committing chunk by chunk, and returns the number of rows loaded.
+
+    `constants` are added as columns to every row (e.g. UserID and the set ID).
+    `progress` is an optional (statement, params) pair executed with a `rows` parameter
+    after each chunk so the set row shows how far the load has got.
+    Each callable in `sinks` is called with every clean chunk before it is inserted
+    (e.g. to write a snapshot or update a content hash); only `columns` are inserted.
+    With a `validator`, rejected rows are passed to `quarantine` (a validation.QuarantineWriter).
+    """
+    rows_loaded = 0
+    for chunk, rejected in prefetch(iter_chunks(stream, columns, validator=validator)):
+        if rejected is not None and quarantine is not None:
+            quarantine.write(rejected)
+        for sink in sinks:
+            sink(chunk)
+        rows = chunk[[name for name in columns if name in chunk]].copy()
+        for name, value in constants.items():
+            rows[name] = value
+        bulk_insert(con, table, rows)
+        rows_loaded += len(rows)
+        if progress is not None:
+            statement, params = progress
+            con.execute(statement, {**params, "rows": rows_loaded})
+        con.commit()
+        logging.info(f"Loaded {rows_loaded} rows into {table}.")
+    return rows_loaded
@@ -0,0 +1,122 @@
+import base64
+import io
+import json
+
+import pandas as pd
+import pyarrow as pa
+from sqlalchemy import text
+
+from ingest import POLICY_COLUMNS
+
+# =================================================================
+#  KEYSET PAGINATION FOR THE POLICY GRID
+# =================================================================
+# Pages are fetched with TOP (n) ... WHERE (sort key, Policy_ID) > cursor,
+# so every page costs the same index seek no matter how deep the client has
+# scrolled, and a request never holds more than one page in memory.
+
+DEFAULT_PAGE_SIZE = 1000
+MAX_PAGE_SIZE = 10_000
+
+# Only columns backed by an index (see schema.sql) can be sorted or filtered on
+SORT_COLUMNS = ("Policy_ID", "Product_Code")
+FILTER_COLUMNS = ("Product_Code",)
+
+FORMATS = {
+    "json": "application/json",
+    "ndjson": "application/x-ndjson",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+
+
+def encode_cursor(values) -> str:
+    return base64.urlsafe_b64encode(json.dumps(values, default=str).encode()).decode()
+
+
+def decode_cursor(cursor: str, length: int) -> list:
+    """The key values of a cursor from next_cursor; raises ValueError unless it holds `length` of them."""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except ValueError:
+        raise ValueError("cursor is not a cursor returned by this endpoint")
+    if not isinstance(values, list) or len(values) != length or not all(
+        isinstance(value, (str, int, float)) and not isinstance(value, bool) for value in values
+    ):
+        raise ValueError("cursor does not match the requested sort")
+    return values
+
+
+def parse_fields(fields: str) -> list:
+    """Validates a comma-separated `fields=` projection against the Policies columns."""
+    if not fields:
+        return list(POLICY_COLUMNS)
+    requested = [f.strip() for f in fields.split(',') if f.strip()]
+    unknown = [f for f in requested if f not in POLICY_COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown field(s): {', '.join(unknown)}")
+    return requested
+
+
+def build_page_query(user_id: str, set_id: str, params) -> tuple:
+    """
+    Builds the (statement, bind params, sort column, page size) for one page of a policy set.
+
+    `params` are the request's query parameters: fields, sort ('Product_Code' or
+    '-Product_Code'), cursor, limit and one optional equality filter per FILTER_COLUMNS.
+    Raises ValueError for anything invalid.
+    """
+    fields = parse_fields(params.get('fields'))
+    sort = params.get('sort') or "Policy_ID"
+    descending = sort.startswith('-')
+    sort_column = sort.lstrip('-')
+    if sort_column not in SORT_COLUMNS:
+        raise ValueError(f"Cannot sort on {sort_column}; sortable columns are {', '.join(SORT_COLUMNS)}")
+    limit = min(int(params.get('limit') or DEFAULT_PAGE_SIZE), MAX_PAGE_SIZE)
+    if limit <= 0:
+        raise ValueError("limit must be positive")
+
+    # A set still loading has no rows to show yet
+    where = ["UserID = :uid", "PolicySetID = :sid", "EXISTS (SELECT 1 FROM PolicySets s WHERE s.PolicySetID = :sid AND s.IngestStatus = 'Ready')"]
+    bind = {"uid": user_id, "sid": set_id, "limit": limit + 1}
+    for column in FILTER_COLUMNS:
+        if params.get(column):
+            where.append(f"{column} = :f_{column.lower()}")
+            bind[f"f_{column.lower()}"] = params.get(column)
+
+    op, direction = ("<", "DESC") if descending else (">", "ASC")
+    if params.get('cursor'):
+        cursor = decode_cursor(params.get('cursor'), 1 if sort_column == "Policy_ID" else 2)
+        if sort_column == "Policy_ID":
+            where.append(f"Policy_ID {op} :c_pid")
+            bind["c_pid"] = cursor[0]
+        else:
+            where.append(f"({sort_column} {op} :c_sort OR ({sort_column} = :c_sort AND Policy_ID {op} :c_pid))")
+            bind["c_sort"], bind["c_pid"] = cursor
+
+    order_by = f"Policy_ID {direction}" if sort_column == "Policy_ID" else f"{sort_column} {direction}, Policy_ID {direction}"
+    # The sort column is always returned so the next cursor can be built from the last row
+    columns = ["Policy_ID as id"] + fields
+    if sort_column != "Policy_ID" and sort_column not in fields:
+        columns.append(sort_column)
+    query = text(f"SELECT TOP (:limit) {', '.join(columns)} FROM Policies WHERE {' AND '.join(where)} ORDER BY {order_by}")
+    return query, bind, sort_column, limit
+
+
+def next_cursor(page: pd.DataFrame, sort_column: str):
+    """Cursor pointing just past the last row of a full page."""
+    last = page.iloc[-1]
+    if sort_column == "Policy_ID":
+        return encode_cursor([last["id"]])
+    return encode_cursor([last[sort_column], last["id"]])
+
+
+def serialize_page(page: pd.DataFrame, fmt: str) -> bytes:
+    if fmt == "ndjson":
+        return page.to_json(orient='records', lines=True, date_format='iso').encode()
+    if fmt == "arrow":
+        table = pa.Table.from_pandas(page, preserve_index=False)
+        sink = io.BytesIO()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return sink.getvalue()
+    return page.to_json(orient='records', date_format='iso').encode()
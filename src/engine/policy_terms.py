@@ -0,0 +1,159 @@
+import numpy as np
+import pandas as pd
+
+# =================================================================
+#  PRE-PARSED POLICY TERMS
+# =================================================================
+# Policies carries three free-text contract fields. They are parsed once, at
+# ingest, into fixed-width numeric columns that are written to the policy
+# snapshot next to the raw text (SQL keeps only the text):
+#
+#   Surrender_Charge_Schedule  "0.07,0.06,0.05"      -> Surrender_Charge_Yr_1..Yr_{SURRENDER_YEARS}
+#   Sub_Account_Allocation     "FIXED:0.4;SP500:0.6" -> Allocation_{account} for every SUB_ACCOUNTS entry
+#   Rider_Codes                "GLWB;DB"             -> Rider_Mask, one RIDER_BITS bit per rider
+#
+# A row whose value doesn't fit these forms is quarantined at ingest (see
+# validation.py), so a job never meets a policy it cannot read. term_arrays()
+# hands the engine contiguous arrays, parsing the text only for rows without
+# parsed columns (sets read from SQL). The rider mask feeds model-point
+# grouping (compression.py); the kernel doesn't model surrender charges or
+# fund allocation yet, so those arrays are there for the benefit logic that will.
+
+SURRENDER_YEARS = 20
+SUB_ACCOUNTS = ("FIXED", "SP500", "NASDAQ100", "RUSSELL2000", "MSCI_EAFE", "BOND", "MONEY_MARKET")
+RIDER_BITS = {"GLWB": 1, "GMWB": 2, "GMDB": 4, "DB": 8, "EDB": 16, "GMAB": 32, "GMIB": 64, "LTC": 128, "WAIVER": 256}
+# Allocation weights must add up to 1 within this tolerance
+ALLOCATION_TOLERANCE = 1e-4
+
+SURRENDER_COLUMNS = [f"Surrender_Charge_Yr_{year}" for year in range(1, SURRENDER_YEARS + 1)]
+ALLOCATION_COLUMNS = [f"Allocation_{account}" for account in SUB_ACCOUNTS]
+# Parsed column -> type, in the same form as ingest.POLICY_COLUMNS
+COLUMNS = {
+    **{name: "float" for name in SURRENDER_COLUMNS},
+    **{name: "float" for name in ALLOCATION_COLUMNS},
+    "Rider_Mask": "int",
+}
+# The text columns they are parsed from
+TEXT_COLUMNS = ["Surrender_Charge_Schedule", "Sub_Account_Allocation", "Rider_Codes"]
+
+
+def _text(chunk: pd.DataFrame, name: str) -> pd.Series:
+    if name not in chunk:
+        return pd.Series("", index=chunk.index, dtype="string")
+    return chunk[name].astype("string").fillna("").str.strip()
+
+
+def _tokens(text: pd.Series, pattern: str) -> pd.Series:
+    """One row per non-blank text and separated token, indexed by the text's row position."""
+    text = text.reset_index(drop=True)
+    tokens = text[text != ""].str.split(pattern, regex=True).explode()
+    return tokens.astype("string").str.strip()
+
+
+def _surrender_charges(text: pd.Series, reasons: pd.Series) -> np.ndarray:
+    tokens = _tokens(text, ",")
+    year = tokens.groupby(level=0).cumcount().to_numpy()
+    charge = pd.to_numeric(tokens, errors="coerce").to_numpy(dtype=np.float64)
+    rows = tokens.index.to_numpy()
+
+    bad = np.isnan(charge) | (charge < 0) | (charge >= 1)
+    reasons.iloc[np.unique(rows[bad])] = "Surrender_Charge_Schedule: charges must be numbers in [0, 1)"
+    too_long = year >= SURRENDER_YEARS
+    reasons.iloc[np.unique(rows[too_long])] = f"Surrender_Charge_Schedule: more than {SURRENDER_YEARS} policy years"
+
+    # Years past the schedule carry no charge
+    matrix = np.zeros((len(text), SURRENDER_YEARS))
+    keep = ~(bad | too_long)
+    matrix[rows[keep], year[keep]] = charge[keep]
+    return matrix
+
+
+def _allocations(text: pd.Series, reasons: pd.Series) -> np.ndarray:
+    tokens = _tokens(text, ";")
+    pairs = tokens.str.split(":", n=1, expand=True).reindex(columns=[0, 1]).astype("string")
+    account = pairs[0].str.strip().str.upper().to_numpy(dtype=object)
+    weight = pd.to_numeric(pairs[1].str.strip(), errors="coerce").to_numpy(dtype=np.float64)
+    rows = tokens.index.to_numpy()
+    column = pd.Index(SUB_ACCOUNTS).get_indexer(account)
+
+    matrix = np.zeros((len(text), len(SUB_ACCOUNTS)))
+    bad = (column < 0) | np.isnan(weight) | (weight < 0)
+    keep = ~bad
+    np.add.at(matrix, (rows[keep], column[keep]), weight[keep])
+    duplicated = pd.Series(rows * len(SUB_ACCOUNTS) + column).duplicated().to_numpy() & keep
+
+    has_allocation = (text.reset_index(drop=True) != "").to_numpy()
+    off_total = has_allocation & (np.abs(matrix.sum(axis=1) - 1.0) > ALLOCATION_TOLERANCE)
+    reasons.iloc[np.flatnonzero(off_total)] = "Sub_Account_Allocation: weights must add up to 1"
+    reasons.iloc[np.unique(rows[duplicated])] = "Sub_Account_Allocation: sub-account listed twice"
+    reasons.iloc[np.unique(rows[bad])] = (
+        f"Sub_Account_Allocation: expected ACCOUNT:weight pairs with ACCOUNT one of {', '.join(SUB_ACCOUNTS)}"
+    )
+    return matrix
+
+
+def _rider_masks(text: pd.Series, reasons: pd.Series) -> np.ndarray:
+    tokens = _tokens(text, "[;,]")
+    tokens = tokens[tokens != ""].str.upper()
+    bits = tokens.map(RIDER_BITS)
+    unknown = bits.isna()
+    reasons.iloc[np.unique(tokens.index[unknown])] = f"Rider_Codes: riders must be among {', '.join(RIDER_BITS)}"
+
+    known = bits[~unknown].astype(np.int64)
+    # Repeating a rider sets its bit once
+    known = known[~pd.Series(known.index.to_numpy() * (max(RIDER_BITS.values()) * 2) + known.to_numpy()).duplicated().to_numpy()]
+    masks = np.zeros(len(text), dtype=np.int64)
+    np.add.at(masks, known.index.to_numpy(), known.to_numpy())
+    return masks
+
+
+def _parse_distinct(text: pd.Series, parser, reasons: pd.Series) -> np.ndarray:
+    """Runs `parser` once per distinct value (contract terms repeat across a product) and spreads its result and reasons over the rows."""
+    codes, uniques = pd.factorize(text)
+    unique_reasons = pd.Series(pd.NA, index=range(len(uniques)), dtype="string")
+    parsed = parser(pd.Series(uniques, dtype="string"), unique_reasons)
+    row_reasons = unique_reasons.to_numpy()[codes]
+    bad = ~pd.isna(row_reasons)
+    reasons[bad] = row_reasons[bad]
+    return parsed[codes]
+
+
+def parse(chunk: pd.DataFrame):
+    """
+    Checks and parses a chunk's contract fields. Returns (terms, reasons): the COLUMNS frame (same
+    index as `chunk`) and a Series holding, for each row that cannot be parsed, why (NA otherwise).
+    """
+    reasons = pd.Series(pd.NA, index=chunk.index, dtype="string")
+    surrender = _parse_distinct(_text(chunk, "Surrender_Charge_Schedule"), _surrender_charges, reasons)
+    allocation = _parse_distinct(_text(chunk, "Sub_Account_Allocation"), _allocations, reasons)
+    riders = _parse_distinct(_text(chunk, "Rider_Codes"), _rider_masks, reasons)
+    terms = pd.concat([
+        pd.DataFrame(surrender, columns=SURRENDER_COLUMNS, index=chunk.index),
+        pd.DataFrame(allocation, columns=ALLOCATION_COLUMNS, index=chunk.index),
+        pd.DataFrame({"Rider_Mask": riders}, index=chunk.index),
+    ], axis=1)
+    return terms, reasons
+
+
+def rider_masks(policies_df: pd.DataFrame) -> np.ndarray:
+    """The batch's Rider_Mask column, parsed from Rider_Codes for sets without parsed snapshot columns."""
+    if "Rider_Mask" in policies_df:
+        return np.ascontiguousarray(policies_df["Rider_Mask"].to_numpy(dtype=np.int64))
+    return _parse_distinct(_text(policies_df, "Rider_Codes"), _rider_masks, pd.Series(pd.NA, index=policies_df.index, dtype="string"))
+
+
+def term_arrays(policies_df: pd.DataFrame) -> dict:
+    """
+    The parsed terms of a batch as contiguous arrays: surrender_charges (policy, year),
+    allocation (policy, SUB_ACCOUNTS) and rider_mask (policy,). Reads the snapshot's parsed
+    columns and parses the TEXT_COLUMNS of rows without them (e.g. rows read from SQL).
+    """
+    terms = policies_df.reindex(columns=list(COLUMNS)).astype("float64")
+    unparsed = terms.isna().any(axis=1).to_numpy()
+    if unparsed.any():
+        terms.loc[unparsed] = parse(policies_df[unparsed])[0].to_numpy(dtype=np.float64)
+    return {
+        "surrender_charges": np.ascontiguousarray(terms[SURRENDER_COLUMNS].to_numpy(dtype=np.float64)),
+        "allocation": np.ascontiguousarray(terms[ALLOCATION_COLUMNS].to_numpy(dtype=np.float64)),
+        "rider_mask": np.ascontiguousarray(terms["Rider_Mask"].to_numpy(dtype=np.int64)),
+    }
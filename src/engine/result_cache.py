@@ -0,0 +1,114 @@
+import hashlib
+import json
+
+import numpy as np
+import pandas as pd
+
+import db
+import ingest
+import policy_terms
+
+# =================================================================
+#  CONTENT-ADDRESSED RESULT CACHE
+# =================================================================
+# Every PolicySet and ScenarioSet gets a content hash at ingest. A product's
+# merged aggregate is cached under a key built from the hashes of the inputs
+# the engine would read, the product code, the run options and the engine
+# version, so a rerun on identical inputs skips RunCalculationEngine.
+# Editing a policy clears its set's hash, which makes that set uncacheable
+# until its snapshot is rebuilt from SQL. The rebuild hashes the set the same
+# way ingest does (policy_hasher), so an unchanged set gets its old hash back.
+
+# Bump whenever the projection changes in a way that changes results.
+ENGINE_VERSION = "1"
+# Each row is hashed under both keys (16 characters each), so the row sums make a 128-bit hash
+HASH_KEYS = ("0123456789123456", "vm22-content-key")
+
+
+def _stored(values: pd.Series, scale: int) -> pd.Series:
+    """Floats as a DECIMAL column of the given scale stores them (rounded half away from zero; no -0.0)."""
+    factor = 10.0 ** scale
+    return np.sign(values) * np.floor(np.abs(values) * factor + 0.5) / factor + 0.0
+
+
+class ContentHasher:
+    """
+    Streaming hash of one set's rows as SQL stores them, the same for any row order or chunking:
+    each chunk is projected onto `columns` (name -> ingest type, in that order), floats are rounded
+    to their DECIMAL `scales`, and every row's 64-bit hashes (one per HASH_KEYS) are summed mod 2**64.
+    """
+
+    def __init__(self, columns: dict, scales: dict = None):
+        self.columns = list(columns)
+        self.scales = scales or {}
+        self._sums = np.zeros(len(HASH_KEYS), dtype=np.uint64)
+        self._rows = 0
+
+    def update(self, chunk: pd.DataFrame):
+        rows = chunk.reindex(columns=self.columns)
+        for name, scale in self.scales.items():
+            rows[name] = _stored(rows[name].astype("float64"), scale)
+        self._sums += np.array([
+            pd.util.hash_pandas_object(rows, index=False, hash_key=key).to_numpy().sum(dtype=np.uint64) for key in HASH_KEYS
+        ], dtype=np.uint64)
+        self._rows += len(rows)
+
+    def hexdigest(self) -> str:
+        material = {"columns": self.columns, "rows": self._rows, "sums": [int(value) for value in self._sums]}
+        return hashlib.sha256(json.dumps(material).encode()).hexdigest()
+
+
+def policy_hasher() -> ContentHasher:
+    """Hasher of a policy set, over the columns its snapshot holds: ingest at load and snapshot rebuilds must agree."""
+    return ContentHasher({**ingest.POLICY_COLUMNS, **policy_terms.COLUMNS}, ingest.POLICY_SCALES)
+
+
+def scenario_hasher() -> ContentHasher:
+    return ContentHasher(ingest.SCENARIO_COLUMNS, ingest.SCENARIO_SCALES)
+
+
+def cache_key(policy_hashes: dict, scenario_hash: str, product_code: str, run_stochastic: bool, compression: bool = False,
+              sensitivities: list = None):
+    """
+    Key for one product-level result, or None if any input is uncacheable.
+
+    `policy_hashes` maps every PolicySetID the engine reads for this user to its ContentHash.
+    """
+    if not scenario_hash or not policy_hashes or not all(policy_hashes.values()):
+        return None
+    key_material = {
+        "policy_hashes": [policy_hashes[set_id] for set_id in sorted(policy_hashes)],
+        "scenario_hash": scenario_hash,
+        "product_code": product_code,
+        "run_stochastic": bool(run_stochastic),
+        "engine_version": ENGINE_VERSION,
+    }
+    if compression:
+        # Only compressed runs carry the flag, so existing seriatim keys stay valid
+        key_material["compression"] = True
+    if sensitivities:
+        key_material["sensitivities"] = [[s["name"], s["kind"], s["shift"]] for s in sensitivities]
+    return hashlib.sha256(json.dumps(key_material, sort_keys=True).encode()).hexdigest()
+
+
+def lookup(con, keys: dict) -> dict:
+    """Returns {product_code: cached aggregate} for the products in `keys` ({product_code: key or None}) that hit."""
+    hits = {}
+    for product_code, key in keys.items():
+        if key is None:
+            continue
+        cached = con.execute(db.SELECT_CACHED_RESULT, {"key": key}).scalar()
+        if cached is not None:
+            hits[product_code] = json.loads(cached)
+    return hits
+
+
+def store(con, keys: dict, aggregates: dict):
+    """Caches freshly computed product aggregates under their keys."""
+    for product_code, aggregate in aggregates.items():
+        key = keys.get(product_code)
+        if key is None:
+            continue
+        con.execute(db.INSERT_CACHED_RESULT, {
+            "key": key, "pcode": product_code, "version": ENGINE_VERSION, "aggregate": json.dumps(aggregate)
+        })
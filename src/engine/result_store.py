@@ -0,0 +1,143 @@
+import hashlib
+import io
+import json
+import os
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from azure.core.exceptions import ResourceExistsError
+from azure.storage.blob import BlobServiceClient
+
+import db
+
+# =================================================================
+#  PER-JOB COLUMNAR RESULT STORE
+# =================================================================
+# The Results table keeps one row per Result_Type; the detail behind it is
+# written to blob storage as compressed Parquet, one file per engine batch
+# plus one per-scenario file for the whole job:
+#
+#   results/{JobID}/policies/{batch key}.parquet   Policy_ID, Product_Code, Account_Value, Scenario_Start, Reserve
+#   results/{JobID}/policies/delta-{EditID}.parquet  the same columns, for one policy edit (see delta.py)
+#   results/{JobID}/scenarios.parquet              Product_Code, Scenario_Index, Reserve
+#
+# A policy file's Reserve is the batch's share of the policy's mean reserve
+# (its reserve summed over the batch's scenarios, divided by the job's
+# scenario count), so a policy's reserve is the sum over the scenario ranges
+# it was projected in; pipelined batches write one file per policy chunk.
+# Every file is listed in the JobResultFiles table, which is all a reader
+# needs to find the parts. File names are derived from the batch (and chunk),
+# so a retried activity overwrites its own parts instead of adding more.
+# An edit applied to a completed job adds a one-row part holding the change in
+# the policy's reserve and account value, so its sum stays the policy's reserve.
+
+RESULTS_CONTAINER = "results"
+
+POLICY_SCHEMA = pa.schema([
+    ("Policy_ID", pa.string()),
+    ("Product_Code", pa.string()),
+    ("Account_Value", pa.float64()),
+    ("Scenario_Start", pa.int64()),
+    ("Reserve", pa.float64()),
+])
+SCENARIO_SCHEMA = pa.schema([
+    ("Product_Code", pa.string()),
+    ("Scenario_Index", pa.int64()),
+    ("Reserve", pa.float64()),
+])
+
+DEFAULT_TOP_N = 20
+
+
+def _container():
+    storage_conn_str = os.environ["AzureWebJobsStorage"]
+    return BlobServiceClient.from_connection_string(storage_conn_str).get_container_client(RESULTS_CONTAINER)
+
+
+def _upload(con, job_id: int, kind: str, blob_name: str, table: pa.Table):
+    buffer = io.BytesIO()
+    pq.write_table(table, buffer, compression="zstd")
+    data = buffer.getvalue()
+    container = _container()
+    try:
+        container.create_container()
+    except ResourceExistsError:
+        pass
+    container.upload_blob(blob_name, data, overwrite=True)
+    con.execute(db.UPSERT_JOB_RESULT_FILE, {
+        "jobid": job_id, "kind": kind, "path": blob_name, "rows": table.num_rows, "bytes": len(data)
+    })
+
+
+def write_policy_results(con, job_id: int, product_code: str, policy_range, scenario_start: int, policies_df: pd.DataFrame, reserves,
+                         part: int = None):
+    """Writes one batch's per-policy reserve contributions (`part` numbers the chunks of a pipelined batch)."""
+    key_material = [product_code, policy_range, scenario_start] + ([part] if part is not None else [])
+    batch_key = hashlib.sha1(json.dumps(key_material).encode()).hexdigest()[:16]
+    table = pa.Table.from_pydict({
+        "Policy_ID": policies_df["Policy_ID"].astype(str).tolist(),
+        "Product_Code": [product_code] * len(policies_df),
+        "Account_Value": pd.to_numeric(policies_df["Account_Value"], errors="coerce").fillna(0.0).tolist(),
+        "Scenario_Start": [int(scenario_start)] * len(policies_df),
+        "Reserve": [float(v) for v in reserves],
+    }, schema=POLICY_SCHEMA)
+    _upload(con, job_id, "policies", f"{int(job_id)}/policies/{batch_key}.parquet", table)
+
+
+def write_policy_delta(con, job_id: int, edit_id: str, product_code: str, policy_id: str, account_value_delta: float,
+                       reserve_delta: float):
+    """Writes the change one policy edit made to a policy's reserve (a delete cancels its reserve out)."""
+    table = pa.Table.from_pydict({
+        "Policy_ID": [str(policy_id)],
+        "Product_Code": [product_code],
+        "Account_Value": [float(account_value_delta)],
+        "Scenario_Start": [0],
+        "Reserve": [float(reserve_delta)],
+    }, schema=POLICY_SCHEMA)
+    _upload(con, job_id, "policies", f"{int(job_id)}/policies/delta-{edit_id}.parquet", table)
+
+
+def write_scenario_results(con, job_id: int, product_aggregates: dict):
+    """Writes every product's per-scenario reserves from its merged aggregate."""
+    product_codes, indexes, reserves = [], [], []
+    for product_code, aggregate in product_aggregates.items():
+        values = aggregate["scenario_reserves"]
+        product_codes += [product_code] * len(values)
+        indexes += range(len(values))
+        reserves += values
+    table = pa.Table.from_pydict(
+        {"Product_Code": product_codes, "Scenario_Index": indexes, "Reserve": reserves}, schema=SCENARIO_SCHEMA
+    )
+    _upload(con, job_id, "scenarios", f"{int(job_id)}/scenarios.parquet", table)
+
+
+def _read(con, job_id: int, kind: str, columns: list, filters=None) -> pd.DataFrame:
+    paths = con.execute(db.SELECT_JOB_RESULT_FILES, {"jobid": job_id, "kind": kind}).scalars().all()
+    container = _container()
+    tables = []
+    for path in paths:
+        data = container.download_blob(path).readall()
+        tables.append(pq.read_table(io.BytesIO(data), columns=columns, filters=filters))
+    if not tables:
+        return pd.DataFrame(columns=columns)
+    return pa.concat_tables(tables).to_pandas()
+
+
+def top_contributors(con, job_id: int, top_n: int = DEFAULT_TOP_N, product_code: str = None) -> list:
+    """The top_n policies by reserve, reading only the ID, product and reserve columns."""
+    filters = [("Product_Code", "=", product_code)] if product_code else None
+    df = _read(con, job_id, "policies", ["Policy_ID", "Product_Code", "Reserve"], filters)
+    if df.empty:
+        return []
+    # A policy appears once per scenario range it was projected over
+    reserves = df.groupby(["Policy_ID", "Product_Code"], as_index=False)["Reserve"].sum()
+    return reserves.nlargest(top_n, "Reserve").to_dict(orient="records")
+
+
+def scenario_distribution(con, job_id: int, product_code: str = None) -> list:
+    """Reserve per scenario for one product, or summed over all products, in scenario order."""
+    filters = [("Product_Code", "=", product_code)] if product_code else None
+    df = _read(con, job_id, "scenarios", ["Scenario_Index", "Reserve"], filters)
+    totals = df.groupby("Scenario_Index", as_index=False)["Reserve"].sum().sort_values("Scenario_Index")
+    return totals.to_dict(orient="records")
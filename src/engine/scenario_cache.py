@@ -0,0 +1,218 @@
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+import db
+import snapshots
+from projection import RATE_COLUMNS
+
+# =================================================================
+#  PROCESS-WIDE SCENARIO TENSOR CACHE
+# =================================================================
+# Scenario sets are immutable once ingested, so a ScenarioSetID always maps to
+# the same (scenario, month, tenor) tensor. Tensors are kept in memory under an
+# LRU byte budget and spilled to local disk as .npy files; a warm worker that
+# evicted a set re-opens it memory-mapped instead of going back to SQL. Arrays
+# derived from a set (its discount factors, see curves.py) share the same budget.
+# The spill directory has its own byte budget, least recently used sets going first.
+# Only sets that are Ready and have rows are cached; anything else raises.
+
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024
+DEFAULT_SPILL_DIR = os.path.join(tempfile.gettempdir(), "vm22-scenario-cache")
+DEFAULT_SPILL_MAX_BYTES = 4 * DEFAULT_MAX_BYTES
+
+
+def tensor_from_frame(scenarios_df: pd.DataFrame):
+    """
+    Builds (scenario_ids, rates[scenario, month, tenor]) as float32 from long-format EconomicScenarios rows.
+    Raises ValueError unless every scenario has the same contiguous months 1..n; no rows give empty arrays.
+    """
+    if scenarios_df.empty:
+        return np.empty(0, dtype=np.int64), np.empty((0, 0, len(RATE_COLUMNS)), dtype=np.float32)
+    ordered = scenarios_df.sort_values(["ScenarioID", "Month"])
+    scenario_ids = ordered["ScenarioID"].unique().astype(np.int64)
+    months = ordered["Month"].to_numpy(dtype=np.int64)
+    n_months = len(months) // max(len(scenario_ids), 1)
+    if len(months) != len(scenario_ids) * n_months or not np.array_equal(months, np.tile(np.arange(1, n_months + 1), len(scenario_ids))):
+        raise ValueError("Scenario set is ragged: every scenario needs the same contiguous months 1..n")
+    rates = ordered[RATE_COLUMNS].apply(pd.to_numeric, errors="coerce").fillna(0.0).to_numpy(dtype=np.float32)
+    return scenario_ids, rates.reshape(len(scenario_ids), -1, len(RATE_COLUMNS))
+
+
+def require_ready(scenario_set_id: int):
+    """Raises ValueError unless the scenario set exists and is Ready (not still loading or failed)."""
+    with db.connect() as con:
+        status = con.execute(db.SELECT_SCENARIO_SET_STATUS, {"sid": scenario_set_id}).scalar()
+    if status != "Ready":
+        raise ValueError(f"Scenario set {scenario_set_id} is not ready to run against (status {status or 'missing'})")
+
+
+def load_scenarios(scenario_set_id: int) -> pd.DataFrame:
+    """
+    Loads the rate columns of a scenario set from its Parquet snapshot, falling back to SQL; the usual cache loader.
+    Raises ValueError for a set that isn't Ready (still loading, failed or missing) or has no rows.
+    """
+    require_ready(scenario_set_id)
+    scenarios_df = snapshots.read_scenarios(scenario_set_id, ["ScenarioID", "Month"] + RATE_COLUMNS)
+    if scenarios_df is None:
+        with db.connect() as con:
+            scenarios_df = pd.read_sql(db.SELECT_SCENARIO_RATES, con, params={"sid": scenario_set_id})
+    if scenarios_df.empty:
+        raise ValueError(f"Scenario set {scenario_set_id} has no scenarios")
+    return scenarios_df
+
+
+class ScenarioCache:
+    """LRU cache of scenario tensors keyed by ScenarioSetID, with a memory-mapped .npy spill."""
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES, spill_dir: str = DEFAULT_SPILL_DIR,
+                 spill_max_bytes: int = DEFAULT_SPILL_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.spill_dir = spill_dir
+        self.spill_max_bytes = spill_max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, scenario_set_id, loader):
+        """
+        Returns (scenario_ids, rates) for a scenario set.
+
+        `loader(scenario_set_id)` is only called on a full miss and must return the
+        EconomicScenarios rows (ScenarioID, Month and the Rate_* columns) as a DataFrame.
+        Raises ValueError if it returns no rows; an empty set is never cached.
+        """
+        key = int(scenario_set_id)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.memory_hits += 1
+                return self._entries[key]
+
+        entry = self._read_spill(key)
+        if entry is not None:
+            with self._lock:
+                self.disk_hits += 1
+        else:
+            entry = tensor_from_frame(loader(key))
+            if not len(entry[0]):
+                raise ValueError(f"Scenario set {key} has no scenarios")
+            self._write_spill(key, entry)
+            with self._lock:
+                self.misses += 1
+
+        with self._lock:
+            self._insert(key, entry)
+        return entry
+
+    def put(self, scenario_set_id, scenario_ids, rates):
+        """Seeds the cache with an already-built tensor (e.g. a shared-memory view in a batch worker process)."""
+        with self._lock:
+            self._insert(int(scenario_set_id), (scenario_ids, rates))
+
+    def get_derived(self, key: tuple, build):
+        """
+        Returns an array derived from a scenario set, keyed e.g. ("discount", ScenarioSetID), kept in the
+        same LRU under the same byte budget as the tensors. `build()` makes it on a miss; it isn't spilled.
+        """
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key][1]
+        array = build()
+        with self._lock:
+            self._insert(key, (None, array))
+        return array
+
+    def put_derived(self, key: tuple, array):
+        """Seeds the cache with a derived array (e.g. a shared-memory view in a batch worker process)."""
+        with self._lock:
+            self._insert(key, (None, array))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+    def _insert(self, key, entry):
+        if key in self._entries:
+            return
+        self._entries[key] = entry
+        self._bytes += entry[1].nbytes
+        while self._bytes > self.max_bytes and len(self._entries) > 1:
+            _, (_, evicted) = self._entries.popitem(last=False)
+            self._bytes -= evicted.nbytes
+            self.evictions += 1
+
+    def _spill_paths(self, key):
+        base = os.path.join(self.spill_dir, f"scenarioset_{key}")
+        return f"{base}_ids.npy", f"{base}_rates.npy"
+
+    def _read_spill(self, key):
+        ids_path, rates_path = self._spill_paths(key)
+        try:
+            scenario_ids, rates = np.load(ids_path), np.load(rates_path, mmap_mode="r")
+            # Marks the set as recently used for the spill budget
+            os.utime(rates_path)
+        except (OSError, ValueError):
+            return None
+        return (scenario_ids, rates) if len(scenario_ids) else None
+
+    def _write_spill(self, key, entry):
+        # Written under a temporary name and renamed so concurrent readers never see a partial file
+        try:
+            os.makedirs(self.spill_dir, exist_ok=True)
+            for path, array in zip(self._spill_paths(key), entry):
+                tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                with open(tmp_path, "wb") as f:
+                    np.save(f, array)
+                os.replace(tmp_path, path)
+            self._prune_spill(key)
+        except OSError as e:
+            logging.warning(f"Could not spill scenario set {key} to {self.spill_dir}: {e}")
+
+    def _prune_spill(self, keep_key):
+        """Deletes the least recently used spilled sets, other than `keep_key`, until the spill fits its budget."""
+        spilled = {}
+        for entry in os.scandir(self.spill_dir):
+            if entry.name.startswith("scenarioset_") and entry.name.endswith(".npy"):
+                key = entry.name[len("scenarioset_"):].split("_")[0]
+                stat = entry.stat()
+                size, used = spilled.get(key, (0, 0.0))
+                spilled[key] = (size + stat.st_size, max(used, stat.st_mtime))
+        total = sum(size for size, _ in spilled.values())
+        for key, (size, _) in sorted(spilled.items(), key=lambda item: item[1][1]):
+            if total <= self.spill_max_bytes:
+                break
+            if key == str(keep_key):
+                continue
+            # Processes that already memory-mapped the files keep their mapping
+            for path in self._spill_paths(key):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            total -= size
+
+
+scenario_cache = ScenarioCache(
+    max_bytes=int(os.environ.get("ScenarioCacheMaxBytes", DEFAULT_MAX_BYTES)),
+    spill_dir=os.environ.get("ScenarioCacheDir", DEFAULT_SPILL_DIR),
+    spill_max_bytes=int(os.environ.get("ScenarioCacheDirMaxBytes", DEFAULT_SPILL_MAX_BYTES)),
+)
@@ -0,0 +1,137 @@
+import re
+
+import numpy as np
+
+import projection
+import validation
+
+# =================================================================
+#  BATCHED SENSITIVITIES
+# =================================================================
+# A job can carry a list of sensitivities, each one shift of the base
+# assumptions, valued in the same pass over the same loaded arrays as the
+# base run:
+#
+#   {"kind": "rate", "shift": 0.01}        parallel shift of the monthly discount rates
+#   {"kind": "lapse", "shift": 0.05}       annual full-surrender rate, the account value paid out
+#   {"kind": "crediting", "shift": -0.005} shift of every policy's crediting rate
+#
+# None of them needs a projection of its own. The kernel pays the withdrawal
+# every month whatever the account value, so a crediting shift only changes
+# the account value paid out at the horizon, which has a closed form per
+# policy (final_account_values). Rate shocks rediscount the base cash flows,
+# and lapses act on the whole block the same way every month, so they only
+# need the base cash flows and the block's monthly account value totals.
+# Each sensitivity's mean reserve is stored as Result_Type "Sensitivity_{name}".
+
+KINDS = ("rate", "lapse", "crediting")
+RESULT_PREFIX = "Sensitivity_"
+# Results.Result_Type is NVARCHAR(50)
+NAME_PATTERN = re.compile(rf"^[A-Za-z0-9_.+-]{{1,{50 - len(RESULT_PREFIX)}}}$")
+# Lowest discount rate a scenario upload accepts; a rate shift must keep every rate above -100%
+MIN_DISCOUNT_RATE = validation.SCENARIO_RULES["ranges"][projection.DISCOUNT_RATE_COLUMN][0]
+
+
+def parse(raw) -> list:
+    """
+    Validates a job's sensitivity list; returns [{"name", "kind", "shift"}] in the given order.
+    Names default to kind and shift (e.g. "rate+0.01"). Raises ValueError for a bad entry.
+    """
+    parsed = []
+    for entry in raw or []:
+        kind = entry.get("kind")
+        if kind not in KINDS:
+            raise ValueError(f"Sensitivity kind must be one of {', '.join(KINDS)}, got {kind!r}")
+        try:
+            shift = float(entry.get("shift"))
+        except (TypeError, ValueError):
+            raise ValueError(f"Sensitivity shift must be a number, got {entry.get('shift')!r}")
+        if not np.isfinite(shift) or (kind == "lapse" and not 0 <= shift < 1) or (kind != "lapse" and shift <= -1):
+            raise ValueError(f"Sensitivity shift {shift} is out of range for {kind}")
+        if kind == "rate" and MIN_DISCOUNT_RATE + shift <= -1:
+            raise ValueError(f"Sensitivity shift {shift} would take a {MIN_DISCOUNT_RATE:g} rate to -100% or below")
+        name = str(entry.get("name") or f"{kind}{shift:+g}")
+        if not NAME_PATTERN.match(name):
+            raise ValueError(f"Sensitivity name {name!r} must be up to {50 - len(RESULT_PREFIX)} letters, digits or _.+-")
+        parsed.append({"name": name, "kind": kind, "shift": shift})
+    names = [sensitivity["name"] for sensitivity in parsed]
+    if len(set(names)) != len(names):
+        raise ValueError("Sensitivity names must be unique")
+    return parsed
+
+
+def shifted_discount(discount: np.ndarray, shift: float) -> np.ndarray:
+    """
+    Discount factors with every monthly rate shifted by `shift`; the rates are recovered from `discount` itself.
+    Raises ValueError where a shifted rate is -100% or below (a set loaded before the rate ranges were checked).
+    """
+    log_growth = -12.0 * np.diff(np.log(discount), axis=1, prepend=0.0)
+    rates = np.expm1(log_growth) + shift
+    if not (rates > -1).all():
+        raise ValueError(f"Rate shift {shift} takes a scenario rate to {rates.min():g}, -100% or below")
+    return projection.discount_factors(rates)
+
+
+def lapse_cash_flows(cash_flows: np.ndarray, account_value_totals: np.ndarray, lapse_rate: float) -> np.ndarray:
+    """
+    A block's total cash flows (months,) with an annual surrender rate: each month the
+    surviving in-force receives the withdrawals, then a share of it surrenders for its account value.
+    """
+    persistency = (1.0 - lapse_rate) ** (1.0 / 12.0)
+    in_force = persistency ** np.arange(len(cash_flows))
+    withdrawals = cash_flows.copy()
+    withdrawals[-1] -= account_value_totals[-1]
+    lapsed = in_force * withdrawals + in_force * (1.0 - persistency) * account_value_totals
+    lapsed[-1] += in_force[-1] * persistency * account_value_totals[-1]
+    return lapsed
+
+
+def final_account_values(arrays: dict, n_months: int, crediting_shift: float) -> np.ndarray:
+    """
+    Each policy's account value at the horizon, as projection.project_cash_flows leaves it, with the
+    crediting rate shifted. Withdrawals are never negative (see validation.py), so the unfloored
+    account value path crosses zero at most once and the floored value at the horizon is max(path, 0).
+    """
+    log_growth = np.log1p(arrays["crediting_rate"] + crediting_shift) / 12.0
+    withdrawal = arrays["withdrawal_amount"] / 12.0
+    # Sum of growth ** k for k < n_months; n_months itself where there is no growth
+    annuity = np.full(len(log_growth), float(n_months))
+    np.divide(np.expm1(n_months * log_growth), np.expm1(log_growth), out=annuity, where=log_growth != 0)
+    return np.maximum(np.exp(n_months * log_growth) * arrays["account_value"] - withdrawal * annuity, 0.0)
+
+
+def project(arrays: dict, discount: np.ndarray, sensitivities: list, chunk_size: int = projection.DEFAULT_CHUNK_SIZE):
+    """
+    Like projection.project_reserves_by_policy, plus every sensitivity's reserves.
+
+    Returns (scenario_reserves (scenarios,), policy_reserve_sums (policies,), {name: scenario reserves}).
+    The per-policy sums are for the base assumptions only.
+    """
+    if not sensitivities:
+        scenario_reserves, policy_sums = projection.project_reserves_by_policy(arrays, discount, chunk_size)
+        return scenario_reserves, policy_sums, {}
+
+    n_policies = len(arrays["account_value"])
+    n_months = discount.shape[1]
+    discount_sum = discount.sum(axis=0)
+    total_cash_flows = np.zeros(n_months)
+    account_value_totals = np.zeros(n_months) if any(s["kind"] == "lapse" for s in sensitivities) else None
+    policy_sums = np.empty(n_policies)
+    for start in range(0, n_policies, chunk_size):
+        chunk = {name: values[start:start + chunk_size] for name, values in arrays.items()}
+        cash_flows = projection.project_cash_flows(chunk, n_months, account_value_totals)
+        total_cash_flows += cash_flows.sum(axis=0)
+        policy_sums[start:start + chunk_size] = cash_flows @ discount_sum
+
+    withdrawal_total = arrays["withdrawal_amount"].sum() / 12.0
+    reserves = {}
+    for sensitivity in sensitivities:
+        if sensitivity["kind"] == "rate":
+            reserves[sensitivity["name"]] = shifted_discount(discount, sensitivity["shift"]) @ total_cash_flows
+        elif sensitivity["kind"] == "lapse":
+            reserves[sensitivity["name"]] = discount @ lapse_cash_flows(total_cash_flows, account_value_totals, sensitivity["shift"])
+        else:
+            shifted = np.full(n_months, withdrawal_total)
+            shifted[-1] += final_account_values(arrays, n_months, sensitivity["shift"]).sum()
+            reserves[sensitivity["name"]] = discount @ shifted
+    return discount @ total_cash_flows, policy_sums, reserves
@@ -0,0 +1,100 @@
+import numpy as np
+import pandas as pd
+
+import db
+
+# =================================================================
+#  PER-SET SUMMARIES
+# =================================================================
+# Filled during ingest, in the same transaction as the rows, so the UI and
+# the batch planner never aggregate over Policies or EconomicScenarios:
+#
+#   PolicySetProducts  one row per (PolicySetID, Product_Code): PolicyCount, AccountValueTotal
+#   ScenarioSets       ScenarioCount, MonthCount
+#
+# A scenario set is only completed if every scenario has the same contiguous
+# months 1..MonthCount (ScenarioSetSummary.check); otherwise the set fails.
+#
+# Policy edits and deletes adjust PolicySetProducts in the transaction that
+# changes the row (apply_policy_edit).
+
+
+class PolicySetSummary:
+    """Ingest sink accumulating policy count and account value total per product."""
+
+    def __init__(self):
+        self._parts = []
+
+    def update(self, chunk: pd.DataFrame):
+        grouped = chunk.groupby("Product_Code", sort=False)["Account_Value"]
+        self._parts.append(pd.DataFrame({"PolicyCount": grouped.size(), "AccountValueTotal": grouped.sum()}))
+
+    def products(self) -> pd.DataFrame:
+        if not self._parts:
+            return pd.DataFrame({"PolicyCount": [], "AccountValueTotal": []})
+        return pd.concat(self._parts).groupby(level=0).sum()
+
+    def write(self, con, policy_set_id):
+        rows = [
+            {"sid": policy_set_id, "pcode": product_code, "count": int(row.PolicyCount), "av": round(float(row.AccountValueTotal), 2)}
+            for product_code, row in self.products().iterrows()
+        ]
+        if rows:
+            con.execute(db.INSERT_POLICY_SET_PRODUCT, rows)
+
+
+class ScenarioSetSummary:
+    """
+    Ingest sink accumulating each scenario's month count and first and last month. check()
+    rejects an empty set and one in which a scenario lacks any of the months 1..MonthCount (e.g. a month quarantined).
+    """
+
+    def __init__(self):
+        self._parts = []
+
+    def update(self, chunk: pd.DataFrame):
+        months = chunk["Month"].astype("int64").groupby(chunk["ScenarioID"].astype("int64").to_numpy(), sort=False)
+        self._parts.append(pd.DataFrame({"count": months.size(), "first": months.min(), "last": months.max()}))
+        if len(self._parts) > 64:
+            self._parts = [self.scenarios()]
+
+    def scenarios(self) -> pd.DataFrame:
+        """count, first and last month per ScenarioID."""
+        if not self._parts:
+            return pd.DataFrame({"count": [], "first": [], "last": []}, dtype="int64")
+        grouped = pd.concat(self._parts).groupby(level=0)
+        return pd.DataFrame({"count": grouped["count"].sum(), "first": grouped["first"].min(), "last": grouped["last"].max()})
+
+    @property
+    def scenario_count(self) -> int:
+        return len(self.scenarios())
+
+    @property
+    def month_count(self) -> int:
+        scenarios = self.scenarios()
+        return int(scenarios["last"].max()) if len(scenarios) else 0
+
+    def check(self):
+        """
+        Raises ValueError unless the set has a scenario and every scenario has each of the
+        months 1..month_count (keys are unique after validation).
+        """
+        scenarios = self.scenarios()
+        if not len(scenarios):
+            raise ValueError("No valid scenario rows were loaded")
+        n_months = self.month_count
+        gaps = scenarios[(scenarios["count"] != n_months) | (scenarios["first"] != 1)]
+        if len(gaps):
+            examples = ", ".join(str(scenario_id) for scenario_id in gaps.index[:5])
+            raise ValueError(
+                f"{len(gaps)} scenario(s) do not have every month 1..{n_months} (e.g. ScenarioID {examples})"
+            )
+
+
+def apply_policy_edit(con, policy_set_id, old_row, new_row):
+    """Moves a policy's count and account value in PolicySetProducts from `old_row` to `new_row` (engine rows, None when absent)."""
+    for row, sign in ((old_row, -1), (new_row, 1)):
+        if row is not None:
+            con.execute(db.ADJUST_POLICY_SET_PRODUCT, {
+                "sid": policy_set_id, "pcode": row["Product_Code"], "count": sign, "av": sign * (row["Account_Value"] or 0.0),
+            })
@@ -0,0 +1,271 @@
+import io
+import logging
+import os
+import tempfile
+import urllib
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from azure.core.exceptions import ResourceExistsError, ResourceNotFoundError
+from azure.storage.blob import BlobServiceClient
+
+# =================================================================
+#  COLUMNAR SNAPSHOTS OF POLICY AND SCENARIO SETS
+# =================================================================
+# At ingest every set is also written to blob storage as compressed Parquet,
+# partitioned by Product_Code (policies) or scenario block (scenarios):
+#
+#   snapshots/policies/{PolicySetID}/Product_Code={code}/part-00000.parquet
+#   snapshots/scenarios/{ScenarioSetID}/block={n}/part-00000.parquet
+#
+# A _SUCCESS marker is written once the load completes, so a half-ingested
+# set is never read. SQL stays the source of truth for the grid UI; the engine
+# downloads only the partitions it needs to local disk and reads them
+# memory-mapped with column projection.
+#
+# Policy edits bump PolicySets.EditVersion in SQL. A policy set's marker holds
+# the EditVersion its snapshot was written at (empty meaning 0), so the engine
+# reads only the sets whose snapshot is behind from SQL. Edited sets are rebuilt
+# from SQL as a new generation, under policies/{PolicySetID}/v{EditVersion}/, and the
+# marker moves to it once written; generation 0 is the one ingest writes.
+
+SNAPSHOT_CONTAINER = "snapshots"
+SUCCESS_MARKER = "_SUCCESS"
+LOCAL_DIR = os.environ.get("SnapshotCacheDir", os.path.join(tempfile.gettempdir(), "vm22-snapshots"))
+SCENARIOS_PER_BLOCK = 100
+ARROW_TYPES = {"str": pa.string(), "int": pa.int64(), "float": pa.float64(), "date": pa.date32()}
+
+
+def _container():
+    storage_conn_str = os.environ["AzureWebJobsStorage"]
+    return BlobServiceClient.from_connection_string(storage_conn_str).get_container_client(SNAPSHOT_CONTAINER)
+
+
+def policy_prefix(policy_set_id) -> str:
+    return f"policies/{int(policy_set_id)}"
+
+
+def _policy_generation(policy_set_id, version: int) -> str:
+    return policy_prefix(policy_set_id) + (f"/v{int(version)}" if version else "")
+
+
+def scenario_prefix(scenario_set_id) -> str:
+    return f"scenarios/{int(scenario_set_id)}"
+
+
+def _partition(column: str, value) -> str:
+    return f"{column}={urllib.parse.quote(str(value), safe='')}"
+
+
+class SnapshotWriter:
+    """
+    Appends ingest chunks to a partitioned Parquet snapshot, one part file per chunk and partition.
+    commit() writes `marker` (by default _SUCCESS under `prefix`) with `marker_data`.
+    """
+
+    def __init__(self, prefix: str, columns: dict, partition_column: str, block_size: int = None,
+                 marker: str = None, marker_data: bytes = b""):
+        self.prefix = prefix
+        self.columns = columns
+        self.partition_column = partition_column
+        self.block_size = block_size
+        self.marker = marker or f"{prefix}/{SUCCESS_MARKER}"
+        self.marker_data = marker_data
+        self._container = _container()
+        self._parts = 0
+        try:
+            self._container.create_container()
+        except ResourceExistsError:
+            pass
+
+    def write(self, chunk: pd.DataFrame):
+        # An explicit schema keeps part files consistent even when a chunk has an all-NULL column
+        schema = pa.schema([(name, ARROW_TYPES[kind]) for name, kind in self.columns.items() if name in chunk])
+        keys = chunk[self.partition_column]
+        label = "block" if self.block_size else self.partition_column
+        if self.block_size:
+            keys = keys // self.block_size
+        for key, group in chunk.groupby(keys, sort=False):
+            buffer = io.BytesIO()
+            pq.write_table(pa.Table.from_pandas(group[schema.names], schema=schema, preserve_index=False), buffer, compression="zstd")
+            blob_name = f"{self.prefix}/{_partition(label, key)}/part-{self._parts:05d}.parquet"
+            self._container.upload_blob(blob_name, buffer.getvalue(), overwrite=True)
+            self._parts += 1
+
+    def commit(self):
+        self._container.upload_blob(self.marker, self.marker_data, overwrite=True)
+
+
+def policy_snapshot_writer(policy_set_id, columns: dict, version: int = 0) -> SnapshotWriter:
+    """Writer for the policy set's snapshot generation at EditVersion `version` (0 at ingest)."""
+    return SnapshotWriter(_policy_generation(policy_set_id, version), columns, "Product_Code",
+                          marker=f"{policy_prefix(policy_set_id)}/{SUCCESS_MARKER}", marker_data=str(int(version)).encode())
+
+
+def policy_snapshot_version(policy_set_id, container=None):
+    """The EditVersion a policy set's committed snapshot holds, or None if it has none."""
+    try:
+        data = (container or _container()).download_blob(f"{policy_prefix(policy_set_id)}/{SUCCESS_MARKER}").readall()
+    except ResourceNotFoundError:
+        return None
+    return int(data or 0)
+
+
+def prune_policy_snapshot(policy_set_id, keep_versions):
+    """Deletes the part files of a policy set's generations other than `keep_versions`."""
+    container = _container()
+    prefix = policy_prefix(policy_set_id)
+    keep = {_policy_generation(policy_set_id, version) for version in keep_versions}
+    for blob in list(container.list_blobs(name_starts_with=f"{prefix}/")):
+        if not blob.name.endswith(".parquet"):
+            continue
+        generation = blob.name[len(prefix) + 1:].split("/", 1)[0]
+        generation_prefix = f"{prefix}/{generation}" if generation.startswith("v") else prefix
+        if generation_prefix not in keep:
+            try:
+                container.delete_blob(blob.name)
+            except ResourceNotFoundError:
+                pass
+
+
+def scenario_snapshot_writer(scenario_set_id, columns: dict) -> SnapshotWriter:
+    return SnapshotWriter(scenario_prefix(scenario_set_id), columns, "ScenarioID", block_size=SCENARIOS_PER_BLOCK)
+
+
+def upload_file(blob_name: str, data: bytes):
+    """Uploads a derived artifact (e.g. a curve table) next to the snapshots."""
+    container = _container()
+    try:
+        container.create_container()
+    except ResourceExistsError:
+        pass
+    container.upload_blob(blob_name, data, overwrite=True)
+
+
+def local_file(blob_name: str):
+    """Local path of a snapshot-container blob, downloaded once; None if the blob doesn't exist."""
+    path = os.path.join(LOCAL_DIR, *blob_name.split("/"))
+    if os.path.exists(path):
+        return path
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            _container().download_blob(blob_name).readinto(f)
+    except ResourceNotFoundError:
+        os.remove(tmp_path)
+        return None
+    os.replace(tmp_path, path)
+    return path
+
+
+def _local_parts(container, prefix: str):
+    """Downloads (once) every part file under `prefix` and returns their local paths."""
+    paths = []
+    for blob in container.list_blobs(name_starts_with=f"{prefix}/"):
+        if not blob.name.endswith(".parquet"):
+            continue
+        path = os.path.join(LOCAL_DIR, *blob.name.split("/"))
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                container.download_blob(blob.name).readinto(f)
+            os.replace(tmp_path, path)
+        paths.append(path)
+    return paths
+
+
+def _is_complete(container, prefix: str) -> bool:
+    try:
+        container.get_blob_client(f"{prefix}/{SUCCESS_MARKER}").get_blob_properties()
+        return True
+    except ResourceNotFoundError:
+        return False
+
+
+def _read_parts(paths, columns, filters=None) -> pd.DataFrame:
+    tables = []
+    for path in paths:
+        # Files only hold the columns present in the uploaded CSV; missing ones are left to the caller
+        available = [name for name in columns if name in pq.read_schema(path).names]
+        tables.append(pq.read_table(path, columns=available, filters=filters, memory_map=True))
+    if not tables:
+        return pd.DataFrame(columns=columns)
+    return pa.concat_tables(tables).to_pandas()
+
+
+def _policy_parts(policy_set_versions: dict, product_code: str):
+    """
+    Local paths of one product's part files across the sets whose snapshot holds their
+    current EditVersion, and the IDs of the other (stale or unsnapshotted) sets.
+    """
+    container = _container()
+    paths, stale_set_ids = [], []
+    for set_id, version in policy_set_versions.items():
+        if policy_snapshot_version(set_id, container) != version:
+            logging.info(f"No current snapshot for PolicySetID {set_id}; reading it from SQL.")
+            stale_set_ids.append(set_id)
+            continue
+        paths += _local_parts(container, f"{_policy_generation(set_id, version)}/{_partition('Product_Code', product_code)}")
+    return paths, stale_set_ids
+
+
+def read_policies(policy_set_versions: dict, product_code: str, columns: list, policy_range=None):
+    """
+    Reads one product's policies from the snapshots of the given sets ({PolicySetID: EditVersion}).
+    Returns (DataFrame, stale set IDs): sets without a current snapshot are left out of the
+    DataFrame and listed for the caller to read from SQL.
+
+    `policy_range` is an optional [lo, hi) Policy_ID key range, hi None meaning unbounded. Keys compare
+    by code point (Arrow's binary string order), as db.SELECT_POLICY_BATCH_STARTS cuts them.
+    """
+    filters = None
+    if policy_range:
+        lo, hi = policy_range
+        filters = [("Policy_ID", ">=", lo)] + ([("Policy_ID", "<", hi)] if hi is not None else [])
+    paths, stale_set_ids = _policy_parts(policy_set_versions, product_code)
+    return _read_parts(paths, columns, filters), stale_set_ids
+
+
+def _iter_parts(paths, columns, policy_range, batch_rows: int):
+    pending, pending_rows = [], 0
+    for path in paths:
+        parquet_file = pq.ParquetFile(path, memory_map=True)
+        available = [name for name in columns if name in parquet_file.schema_arrow.names]
+        for batch in parquet_file.iter_batches(batch_size=batch_rows, columns=available):
+            if policy_range:
+                lo, hi = policy_range
+                keep = pc.greater_equal(batch.column("Policy_ID"), lo)
+                if hi is not None:
+                    keep = pc.and_(keep, pc.less(batch.column("Policy_ID"), hi))
+                batch = batch.filter(keep)
+            if batch.num_rows:
+                pending.append(batch.to_pandas())
+                pending_rows += batch.num_rows
+            if pending_rows >= batch_rows:
+                yield pd.concat(pending, ignore_index=True)
+                pending, pending_rows = [], 0
+    if pending:
+        yield pd.concat(pending, ignore_index=True)
+
+
+def iter_policies(policy_set_versions: dict, product_code: str, columns: list, policy_range=None, batch_rows: int = 50_000):
+    """
+    Like read_policies, but returns an iterator over DataFrames of about `batch_rows` rows
+    (never more than twice that), reading one record batch at a time so memory is bounded
+    by the batch size rather than the product size, and the stale set IDs.
+    """
+    paths, stale_set_ids = _policy_parts(policy_set_versions, product_code)
+    return _iter_parts(paths, columns, policy_range, batch_rows), stale_set_ids
+
+
+def read_scenarios(scenario_set_id, columns: list):
+    """Reads a scenario set from its snapshot, or returns None if it has no complete snapshot."""
+    container = _container()
+    prefix = scenario_prefix(scenario_set_id)
+    if not _is_complete(container, prefix):
+        return None
+    return _read_parts(_local_parts(container, prefix), columns)
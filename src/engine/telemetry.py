@@ -0,0 +1,112 @@
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+import pandas as pd
+
+import db
+
+try:
+    import resource
+except ImportError:  # Windows (local development)
+    resource = None
+
+# =================================================================
+#  JOB TELEMETRY
+# =================================================================
+# Every activity records timing spans for its phases (SQL/snapshot load,
+# compute, result write) with the rows and bytes it touched and the worker's
+# peak RSS, and writes them to JobMetrics in one executemany when it
+# finishes. Batches are labelled so stragglers can be traced back to their
+# product, policy range and scenario range.
+#
+# Peak RSS is the process high-water mark (getrusage), so on a warm worker it
+# covers earlier invocations too; it is an upper bound for the span.
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def batch_label(product_code: str, policy_range, scenario_range) -> str:
+    lo, hi = policy_range or ["", None]
+    start, stop = scenario_range or [0, 1]
+    return f"{product_code}|{lo}..{hi if hi is not None else ''}|{start}..{stop}"
+
+
+class JobTelemetry:
+    """Collects the spans of one activity invocation for a job."""
+
+    def __init__(self, job_id, activity: str, batch: str = None):
+        self.job_id = job_id
+        self.activity = activity
+        self.batch = batch
+        self.spans = []
+
+    @contextmanager
+    def span(self, phase: str):
+        """
+        Times a phase. The yielded dict can be given 'rows' and 'bytes' counts by the caller.
+        """
+        counts = {}
+        started = datetime.now(timezone.utc).replace(tzinfo=None)
+        start = time.perf_counter()
+        try:
+            yield counts
+        finally:
+            self.spans.append({
+                "activity": self.activity, "batch": self.batch, "phase": phase,
+                "started": started, "duration": round((time.perf_counter() - start) * 1000.0, 3),
+                "rows": counts.get("rows"), "bytes": counts.get("bytes"), "rss": peak_rss_mb(),
+            })
+
+    def flush(self, con):
+        """Bulk-inserts the collected spans (the caller commits). Spans outside a job (dry runs) are dropped."""
+        if self.spans and self.job_id is not None:
+            con.execute(db.INSERT_JOB_METRIC, [{**span, "jobid": self.job_id} for span in self.spans])
+            self.spans = []
+
+
+def frame_bytes(df: pd.DataFrame) -> int:
+    return int(df.memory_usage(deep=True).sum())
+
+
+def critical_path(metrics_df: pd.DataFrame) -> dict:
+    """
+    Summarises a job's spans: wall-clock time, time per activity and phase, and the
+    critical path through the fan-out (the slowest batch is what the orchestrator waits for).
+    """
+    if metrics_df.empty:
+        return {}
+    ends = metrics_df["Started"] + pd.to_timedelta(metrics_df["Duration_Ms"], unit="ms")
+    # An invocation lasts from its first span's start to its last span's end; pipelined spans overlap
+    extents = metrics_df.assign(Ended=ends).groupby(["Activity", "Batch"], dropna=False).agg(first=("Started", "min"), last=("Ended", "max"))
+    per_invocation = ((extents["last"] - extents["first"]).dt.total_seconds() * 1000.0).rename("Duration_Ms").reset_index()
+    activity_order = metrics_df.groupby("Activity")["Started"].min().sort_values().index
+
+    path = []
+    for activity in activity_order:
+        group = per_invocation[per_invocation["Activity"] == activity]
+        slowest = group.loc[group["Duration_Ms"].idxmax()]
+        step = {"activity": activity, "invocations": len(group), "durationMs": float(slowest["Duration_Ms"])}
+        if len(group) > 1:
+            median = float(group["Duration_Ms"].median())
+            step.update({"slowestBatch": slowest["Batch"], "medianMs": median})
+            if median > 0:
+                step["stragglerRatio"] = round(float(slowest["Duration_Ms"]) / median, 2)
+        path.append(step)
+
+    phases = metrics_df.groupby("Phase")["Duration_Ms"].agg(["sum", "max"])
+    loads = metrics_df[metrics_df["Phase"].str.startswith("load")]
+    return {
+        "wallClockMs": (ends.max() - metrics_df["Started"].min()).total_seconds() * 1000.0,
+        "criticalPathMs": sum(step["durationMs"] for step in path),
+        "criticalPath": path,
+        "phases": {phase: {"totalMs": float(row["sum"]), "maxMs": float(row["max"])} for phase, row in phases.iterrows()},
+        "rowsLoaded": int(loads["Row_Count"].fillna(0).sum()),
+        "bytesLoaded": int(loads["Byte_Count"].fillna(0).sum()),
+        "peakRssMb": float(metrics_df["Peak_RSS_MB"].max()) if metrics_df["Peak_RSS_MB"].notna().any() else None,
+    }
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The engine modules import each other by bare name, as the Functions host runs them from src/engine
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
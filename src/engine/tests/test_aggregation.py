@@ -0,0 +1,41 @@
+import random
+
+import numpy as np
+
+import aggregation
+
+
+def test_partials_merge_to_the_whole_in_any_order():
+    rng = np.random.default_rng(1)
+    # Two policy ranges x three scenario ranges of a 10-scenario job
+    reserves = rng.uniform(0, 1e6, (2, 10))
+    counts, account_values = [4, 6], [400.0, 600.0]
+    partials = [
+        aggregation.partial_aggregate(start, reserves[block, start:stop], counts[block], account_values[block],
+                                      sensitivities={"rate+0.01": 2 * reserves[block, start:stop]})
+        for block in range(2) for start, stop in aggregation.split_range(10, 4)
+    ]
+    merged = aggregation.merge_partials(partials, 10)
+    random.Random(2).shuffle(partials)
+    assert aggregation.merge_partials(partials, 10) == merged
+    np.testing.assert_allclose(merged["scenario_reserves"], reserves.sum(axis=0))
+    np.testing.assert_allclose(merged["sensitivities"]["rate+0.01"], 2 * reserves.sum(axis=0))
+    assert (merged["policy_count"], merged["account_value"], merged["batches"]) == (10, 1000.0, 6)
+
+
+def test_cte_is_the_mean_of_the_worst_scenarios():
+    values = np.random.default_rng(3).normal(1e6, 2e5, 1000)
+    aggregate = {"scenario_reserves": values.tolist()}
+    worst = np.sort(values)[::-1]
+    assert aggregation.tail_size(1000) == 300
+    np.testing.assert_allclose(aggregation.cte(aggregate), worst[:300].mean())
+    assert [index for index, _ in aggregation.top_scenarios(aggregate, 5)] == list(np.argsort(-values)[:5])
+    # A tail always holds at least one scenario
+    assert aggregation.cte({"scenario_reserves": [5.0]}) == 5.0
+    assert aggregation.cte({"scenario_reserves": []}) == 0.0
+
+
+def test_split_range_covers_everything_once():
+    assert aggregation.split_range(10, 4) == [[0, 3], [3, 7], [7, 10]]
+    assert aggregation.split_range(8, 4) == [[0, 4], [4, 8]]
+    assert aggregation.split_range(0, 4) == []
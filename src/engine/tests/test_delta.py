@@ -0,0 +1,95 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import aggregation
+import curves
+import db
+import delta
+import projection
+import result_store
+import snapshots
+import validation
+
+BENCHMARKS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "benchmarks")
+SCENARIO_SET_ID = 9001
+POLICY = {
+    "Policy_ID": "P-1", "Product_Code": "ABC", "Account_Value": 50_000.0, "Guaranteed_Crediting_Rate": 0.03,
+    "GLWB_Benefit_Base": 60_000.0, "GLWB_Withdrawal_Rate": 0.05, "Load_Timestamp": "2026-01-01T00:00:00",
+}
+
+
+@pytest.fixture
+def stand_in(tmp_path, monkeypatch):
+    """The SQLite and local blob stand-in from the benchmarks, undone after the test."""
+    monkeypatch.syspath_prepend(BENCHMARKS_DIR)
+    import local_stand_in
+    for name in ["_engine", *local_stand_in.SQLITE_STATEMENTS]:
+        monkeypatch.setattr(db, name, getattr(db, name))
+    for module in (snapshots, result_store, validation):
+        monkeypatch.setattr(module, "_container", module._container)
+    monkeypatch.delenv("AzureWebJobsStorage", raising=False)
+    monkeypatch.setenv("SqlConnectionString", "sqlite (test stand-in)")
+    engine = local_stand_in.install(str(tmp_path))
+    yield engine
+    engine.dispose()
+
+
+def policy_reserves(row, discount) -> np.ndarray:
+    return projection.policy_reserves(projection.policy_arrays(pd.DataFrame([row])), discount)[0]
+
+
+def add_job(engine, requested: str, discount: np.ndarray) -> int:
+    """A completed ABC job requested at `requested` that valued POLICY alone."""
+    aggregate = aggregation.partial_aggregate(0, policy_reserves(POLICY, discount), 1, POLICY["Account_Value"])
+    with engine.begin() as con:
+        job_id = con.exec_driver_sql(
+            "INSERT INTO CalculationJobs (Product_Code, Job_Status, Requested_Timestamp, UserID, ScenarioSetID) "
+            f"VALUES ('ABC', 'Complete', '{requested}', 'u1', {SCENARIO_SET_ID})"
+        ).lastrowid
+        con.exec_driver_sql("INSERT INTO JobProductResults (JobID, Product_Code, Aggregate) VALUES (?, 'ABC', ?)", (job_id, json.dumps(aggregate)))
+    return job_id
+
+
+def job_reserves(engine, job_id: int) -> list:
+    with engine.connect() as con:
+        aggregate = con.exec_driver_sql("SELECT Aggregate FROM JobProductResults WHERE JobID = ?", (job_id,)).scalar()
+    return json.loads(aggregate)["scenario_reserves"]
+
+
+def test_edit_adjusts_the_job_requested_before_it_once(stand_in):
+    discount = projection.discount_factors(np.random.default_rng(7).uniform(0.0, 0.06, (5, 24)))
+    curves.put(SCENARIO_SET_ID, discount)
+    before = add_job(stand_in, "2026-01-02 00:00:00", discount)
+    after = add_job(stand_in, "2026-01-04 00:00:00", discount)
+    untouched = job_reserves(stand_in, after)
+    edited = {**POLICY, "Account_Value": 80_000.0}
+
+    assert delta.apply_policy_delta("u1", POLICY, edited, edit_id="e1", edited="2026-01-03T00:00:00") == before
+    np.testing.assert_allclose(job_reserves(stand_in, before), policy_reserves(edited, discount))
+    # A later job already read the edited policy
+    assert job_reserves(stand_in, after) == untouched
+    with stand_in.connect() as con:
+        results = dict(con.exec_driver_sql("SELECT Result_Type, Result_Value FROM Results WHERE JobID = ?", (before,)).fetchall())
+    np.testing.assert_allclose(results["Aggregated_Reserve"], policy_reserves(edited, discount).mean())
+
+    # A redelivered message is skipped
+    adjusted = job_reserves(stand_in, before)
+    assert delta.apply_policy_delta("u1", POLICY, edited, edit_id="e1", edited="2026-01-03T00:00:00") is None
+    assert job_reserves(stand_in, before) == adjusted
+
+    # Deleting the policy takes its whole contribution out
+    assert delta.apply_policy_delta("u1", edited, None, edit_id="e2", edited="2026-01-03T01:00:00") == before
+    np.testing.assert_allclose(job_reserves(stand_in, before), 0.0, atol=1e-6)
+
+
+def test_edit_before_every_job_adjusts_nothing(stand_in):
+    discount = projection.discount_factors(np.full((2, 12), 0.03))
+    curves.put(SCENARIO_SET_ID, discount)
+    job_id = add_job(stand_in, "2026-01-02 00:00:00", discount)
+    reserves = job_reserves(stand_in, job_id)
+    assert delta.apply_policy_delta("u1", POLICY, {**POLICY, "Account_Value": 1.0}, edit_id="e3", edited="2026-01-01T12:00:00") is None
+    assert job_reserves(stand_in, job_id) == reserves
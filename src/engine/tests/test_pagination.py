@@ -0,0 +1,33 @@
+import pandas as pd
+import pytest
+
+import pagination
+
+
+@pytest.mark.parametrize("values", [["P-1"], ["ABC", "P-1"], [42, "P-9"], ["ÄBC/+=", "P 1"]])
+def test_cursor_round_trip(values):
+    assert pagination.decode_cursor(pagination.encode_cursor(values), len(values)) == values
+
+
+@pytest.mark.parametrize("cursor, length", [
+    ("not a cursor!", 1),
+    (pagination.encode_cursor(["P-1"]), 2),
+    (pagination.encode_cursor(["ABC", "P-1"]), 1),
+    (pagination.encode_cursor({"sort": "ABC"}), 1),
+    (pagination.encode_cursor([True]), 1),
+    (pagination.encode_cursor([None]), 1),
+])
+def test_cursor_rejection(cursor, length):
+    with pytest.raises(ValueError):
+        pagination.decode_cursor(cursor, length)
+
+
+def test_page_query_binds_the_cursor_after_the_last_row():
+    page = pd.DataFrame({"id": ["P-1", "P-2"], "Product_Code": ["ABC", "XYZ"]})
+    cursor = pagination.next_cursor(page, "Product_Code")
+    query, bind, sort_column, limit = pagination.build_page_query("u1", "7", {"sort": "-Product_Code", "cursor": cursor, "limit": "2"})
+    assert (bind["c_sort"], bind["c_pid"], bind["limit"], sort_column, limit) == ("XYZ", "P-2", 3, "Product_Code", 2)
+    assert "ORDER BY Product_Code DESC, Policy_ID DESC" in str(query)
+    # A Policy_ID cursor doesn't fit a Product_Code sort
+    with pytest.raises(ValueError):
+        pagination.build_page_query("u1", "7", {"sort": "Product_Code", "cursor": pagination.next_cursor(page, "Policy_ID")})
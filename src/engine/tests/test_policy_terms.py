@@ -0,0 +1,48 @@
+import numpy as np
+import pandas as pd
+
+import policy_terms
+
+
+def text_frame() -> pd.DataFrame:
+    return pd.DataFrame({
+        "Surrender_Charge_Schedule": pd.Series(["0.07,0.06,0.05", "", "0.07,0.06,0.05"], dtype="string"),
+        "Sub_Account_Allocation": pd.Series(["FIXED:0.4;sp500:0.6", "BOND:1", "FIXED:0.4;SP500:0.6"], dtype="string"),
+        "Rider_Codes": pd.Series(["GLWB;DB", "", "db,glwb,DB"], dtype="string"),
+    })
+
+
+def test_parse_fills_fixed_width_columns():
+    terms, reasons = policy_terms.parse(text_frame())
+    assert list(terms.columns) == list(policy_terms.COLUMNS)
+    assert reasons.isna().all()
+    arrays = policy_terms.term_arrays(terms)
+    assert arrays["surrender_charges"].shape == (3, policy_terms.SURRENDER_YEARS)
+    assert list(arrays["surrender_charges"][0, :4]) == [0.07, 0.06, 0.05, 0.0]
+    assert not arrays["surrender_charges"][1].any()
+    assert arrays["allocation"][0, policy_terms.SUB_ACCOUNTS.index("SP500")] == 0.6
+    assert arrays["allocation"][1, policy_terms.SUB_ACCOUNTS.index("BOND")] == 1.0
+    assert list(arrays["rider_mask"]) == [9, 0, 9]
+
+
+def test_term_arrays_agree_for_snapshot_sql_and_mixed_rows():
+    text = text_frame()
+    terms, _ = policy_terms.parse(text)
+    snapshot = pd.concat([text, terms], axis=1)
+    # A batch whose last row came from SQL has no parsed columns for it
+    mixed = pd.concat([snapshot.iloc[:2], text.iloc[2:]])
+    expected = policy_terms.term_arrays(snapshot)
+    for frame in (text, mixed):
+        arrays = policy_terms.term_arrays(frame)
+        for name, values in expected.items():
+            assert np.array_equal(arrays[name], values) and arrays[name].flags.c_contiguous
+
+
+def test_malformed_terms_get_reasons():
+    frame = pd.DataFrame({
+        "Surrender_Charge_Schedule": pd.Series(["0.07,abc", ",".join(["0.01"] * 21)], dtype="string"),
+        "Sub_Account_Allocation": pd.Series(["FIXED:0.5", "GOLD:1"], dtype="string"),
+        "Rider_Codes": pd.Series(["", "XYZ"], dtype="string"),
+    })
+    _, reasons = policy_terms.parse(frame)
+    assert reasons.notna().all()
@@ -0,0 +1,29 @@
+import numpy as np
+import pytest
+
+import projection
+
+
+def random_block(seed: int, n_policies: int = 7, n_scenarios: int = 3, n_months: int = 24):
+    """Policy arrays and (scenario, month) rates, some policies withdrawing enough to exhaust their account value."""
+    rng = np.random.default_rng(seed)
+    arrays = {
+        "account_value": rng.uniform(0, 100_000, n_policies),
+        "crediting_rate": rng.uniform(0.0, 0.05, n_policies),
+        "withdrawal_amount": rng.uniform(0, 120_000, n_policies),
+    }
+    rates = rng.uniform(-0.01, 0.08, (n_scenarios, n_months))
+    return arrays, rates
+
+
+@pytest.mark.parametrize("chunk_size", [2, 3, projection.DEFAULT_CHUNK_SIZE])
+def test_vectorised_kernel_matches_reference(chunk_size):
+    arrays, rates = random_block(seed=chunk_size)
+    policies = [{name: float(values[i]) for name, values in arrays.items()} for i in range(len(arrays["account_value"]))]
+    expected = projection.project_reserves_reference(policies, rates.tolist())
+    discount = projection.discount_factors(rates)
+    np.testing.assert_allclose(projection.project_reserves(arrays, discount, chunk_size), expected, rtol=1e-10)
+    scenario_reserves, policy_sums = projection.project_reserves_by_policy(arrays, discount, chunk_size)
+    np.testing.assert_allclose(scenario_reserves, expected, rtol=1e-10)
+    np.testing.assert_allclose(policy_sums.sum(), sum(expected), rtol=1e-10)
+    np.testing.assert_allclose(projection.policy_reserves(arrays, discount).sum(axis=0), expected, rtol=1e-10)
@@ -0,0 +1,36 @@
+import numpy as np
+import pandas as pd
+
+import result_cache
+
+
+def rows(values) -> pd.DataFrame:
+    return pd.DataFrame({
+        "Policy_ID": pd.Series([f"P{i}" for i in range(len(values))], dtype="string"),
+        "Account_Value": np.asarray(values, dtype=np.float64),
+    })
+
+
+def digest(*chunks) -> str:
+    hasher = result_cache.ContentHasher({"Policy_ID": "str", "Account_Value": "float"}, {"Account_Value": 2})
+    for chunk in chunks:
+        hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def test_hash_ignores_row_order_and_chunking():
+    frame = rows([100.0, 250.5, 3.25, 0.0])
+    shuffled = frame.sample(frac=1, random_state=0)
+    assert digest(frame) == digest(shuffled.iloc[:1], shuffled.iloc[1:])
+
+
+def test_hash_sees_values_as_stored():
+    # DECIMAL(18, 2) stores 250.499 as 250.50 and -0.001 as 0.00
+    assert digest(rows([250.499, -0.001])) == digest(rows([250.5, 0.0]))
+    assert digest(rows([250.49, 0.0])) != digest(rows([250.5, 0.0]))
+
+
+def test_hash_ignores_extra_columns_but_not_missing_rows():
+    frame = rows([1.0, 2.0])
+    assert digest(frame.assign(Load_Timestamp="2024-01-01")) == digest(frame)
+    assert digest(frame.iloc[:1]) != digest(frame)
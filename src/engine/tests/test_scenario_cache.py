@@ -0,0 +1,56 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from projection import RATE_COLUMNS
+from scenario_cache import ScenarioCache
+
+
+def scenarios_frame(n_scenarios: int, n_months: int = 12) -> pd.DataFrame:
+    frame = pd.DataFrame({
+        "ScenarioID": np.repeat(np.arange(1, n_scenarios + 1), n_months),
+        "Month": np.tile(np.arange(1, n_months + 1), n_scenarios),
+    })
+    for column in RATE_COLUMNS:
+        frame[column] = 0.03
+    return frame
+
+
+def test_empty_set_is_never_cached(tmp_path):
+    cache = ScenarioCache(spill_dir=str(tmp_path))
+    with pytest.raises(ValueError):
+        cache.get(7, lambda _: scenarios_frame(0))
+    assert cache.stats()["entries"] == 0
+    assert os.listdir(tmp_path) == []
+    # Once the set has rows it loads normally
+    scenario_ids, rates = cache.get(7, lambda _: scenarios_frame(3))
+    assert list(scenario_ids) == [1, 2, 3] and rates.shape == (3, 12, len(RATE_COLUMNS))
+
+
+def test_spill_is_read_back_after_eviction(tmp_path):
+    cache = ScenarioCache(max_bytes=1, spill_dir=str(tmp_path))
+    cache.get(1, lambda _: scenarios_frame(2))
+    cache.get(2, lambda _: scenarios_frame(2))
+    _, rates = cache.get(1, lambda _: pytest.fail("set 1 should come from the spill"))
+    assert cache.stats()["disk_hits"] == 1 and rates.shape[0] == 2
+
+
+def test_spill_keeps_to_its_budget(tmp_path):
+    one_set = scenarios_frame(4)
+    cache = ScenarioCache(spill_dir=str(tmp_path), spill_max_bytes=1)
+    for key in (1, 2, 3):
+        cache.get(key, lambda _: one_set)
+    # Only the set just written survives a budget smaller than one set
+    assert sorted(os.listdir(tmp_path)) == ["scenarioset_3_ids.npy", "scenarioset_3_rates.npy"]
+
+    cache = ScenarioCache(max_bytes=1, spill_dir=str(tmp_path), spill_max_bytes=10**9)
+    for key in (4, 5):
+        cache.get(key, lambda _: one_set)
+    per_set = sum(entry.stat().st_size for entry in os.scandir(tmp_path)) // 3
+    cache.spill_max_bytes = 2 * per_set
+    os.utime(tmp_path / "scenarioset_3_rates.npy", (0, 0))
+    cache.get(6, lambda _: one_set)
+    assert not (tmp_path / "scenarioset_3_rates.npy").exists()
+    assert (tmp_path / "scenarioset_6_rates.npy").exists()
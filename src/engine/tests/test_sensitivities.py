@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+import projection
+import sensitivities
+
+
+def test_parse_rejects_rate_shifts_below_minus_one_hundred_percent():
+    floor = -1 - sensitivities.MIN_DISCOUNT_RATE
+    assert sensitivities.parse([{"kind": "rate", "shift": floor + 0.01}])[0]["shift"] == floor + 0.01
+    for shift in (floor, -0.9):
+        with pytest.raises(ValueError):
+            sensitivities.parse([{"kind": "rate", "shift": shift}])
+
+
+def test_shifted_discount_rejects_rates_at_or_below_minus_one_hundred_percent():
+    discount = projection.discount_factors(np.array([[0.03, -0.1, 0.02]]))
+    assert np.isfinite(sensitivities.shifted_discount(discount, -0.85)).all()
+    with pytest.raises(ValueError):
+        sensitivities.shifted_discount(discount, -0.9)
+
+
+def test_project_matches_brute_force_shifted_runs():
+    rng = np.random.default_rng(5)
+    arrays = {
+        "account_value": rng.uniform(0, 100_000, 9),
+        "crediting_rate": rng.uniform(0.0, 0.05, 9),
+        "withdrawal_amount": rng.uniform(0, 60_000, 9),
+    }
+    rates = rng.uniform(0.0, 0.06, (4, 36))
+    discount = projection.discount_factors(rates)
+    specs = sensitivities.parse([
+        {"kind": "rate", "shift": 0.01}, {"kind": "rate", "shift": -0.02},
+        {"kind": "crediting", "shift": -0.005}, {"kind": "lapse", "shift": 0.05},
+    ])
+    base, policy_sums, reserves = sensitivities.project(arrays, discount, specs, chunk_size=4)
+
+    np.testing.assert_allclose(base, projection.project_reserves(arrays, discount))
+    np.testing.assert_allclose(policy_sums, projection.project_reserves_by_policy(arrays, discount)[1])
+    for shift in (0.01, -0.02):
+        expected = projection.project_reserves(arrays, projection.discount_factors(rates + shift))
+        np.testing.assert_allclose(reserves[f"rate{shift:+g}"], expected)
+    credited = {**arrays, "crediting_rate": arrays["crediting_rate"] - 0.005}
+    np.testing.assert_allclose(reserves["crediting-0.005"], projection.project_reserves(credited, discount))
+
+    # Lapses simulated month by month: the in-force share is paid the withdrawal, then part of it surrenders
+    persistency = 0.95 ** (1 / 12)
+    cash_flows = np.zeros(discount.shape[1])
+    for account_value, crediting_rate, withdrawal_amount in zip(arrays["account_value"], arrays["crediting_rate"], arrays["withdrawal_amount"]):
+        in_force, withdrawal = 1.0, withdrawal_amount / 12
+        for month in range(discount.shape[1]):
+            account_value = max(account_value * (1 + crediting_rate) ** (1 / 12) - withdrawal, 0.0)
+            cash_flows[month] += in_force * withdrawal + in_force * (1 - persistency) * account_value
+            in_force *= persistency
+        cash_flows[-1] += in_force * account_value
+    np.testing.assert_allclose(reserves["lapse+0.05"], discount @ cash_flows)
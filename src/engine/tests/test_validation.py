@@ -0,0 +1,65 @@
+import io
+
+import numpy as np
+import pandas as pd
+
+import ingest
+import validation
+
+SCENARIO_HEADER = ",".join(ingest.SCENARIO_COLUMNS)
+
+
+def scenario_csv(rows) -> io.BytesIO:
+    """A scenarios upload of (ScenarioID, Month, rate) rows, the rate repeated across tenors."""
+    lines = [SCENARIO_HEADER] + [",".join([str(sid), str(month)] + [str(rate)] * 10) for sid, month, rate in rows]
+    return io.BytesIO(("\n".join(lines) + "\n").encode())
+
+
+def split_upload(rows, chunk_rows: int):
+    validator = validation.ChunkValidator(validation.SCENARIO_RULES)
+    return list(ingest.iter_chunks(scenario_csv(rows), ingest.SCENARIO_COLUMNS, chunk_rows, validator))
+
+
+def test_duplicate_keys_across_chunks():
+    rows = [(1, 1, 0.03), (1, 2, 0.03), (1, 1, 0.04), (2, 1, 0.03), (1, 2, 0.05), (2, 2, 0.03)]
+    chunks = split_upload(rows, chunk_rows=2)
+    clean = [len(chunk) for chunk, _ in chunks]
+    assert clean == [2, 1, 1]
+    rejected = [row for _, chunk in chunks for row in chunk["Reason_Codes"]]
+    assert rejected == ["DUPLICATE_KEY:ScenarioID+Month", "DUPLICATE_KEY:ScenarioID+Month"]
+
+
+def test_fully_rejected_chunk_keeps_upload_going():
+    # The middle chunk is all out of range, so it leaves no keys behind
+    rows = [(1, 1, 0.03), (1, 2, 0.03), (1, 3, 5.0), (1, 4, 5.0), (1, 5, 0.03), (1, 1, 0.03)]
+    chunks = split_upload(rows, chunk_rows=2)
+    assert [len(chunk) for chunk, _ in chunks] == [2, 0, 1]
+    assert list(chunks[2][1]["Reason_Codes"]) == ["DUPLICATE_KEY:ScenarioID+Month"]
+
+
+def test_duplicate_keys_compare_like_sql_server():
+    validator = validation.ChunkValidator(validation.POLICY_RULES)
+    keys = pd.DataFrame({"Policy_ID": pd.Series(["p1 ", "P1", "P2"], dtype="string")})
+    duplicate, _ = validator._duplicate_keys(keys, np.ones(3, dtype=bool))
+    assert list(duplicate) == [False, True, False]
+
+
+def test_many_chunks_keep_few_runs():
+    validator = validation.ChunkValidator(validation.SCENARIO_RULES)
+    for start in range(0, 1024, 8):
+        validator._remember(np.arange(start, start + 8, dtype=np.uint64))
+    assert len(validator._seen) <= 11
+    assert list(np.sort(np.concatenate(validator._seen))) == list(range(1024))
+
+
+
+def test_case_variants_of_a_product_code_are_rejected():
+    # SQL Server compares 'ABC', 'abc' and 'ABC ' as one Product_Code
+    codes = [["ABC", "XYZ"], ["abc", "ABC", "ABC "], ["XYZ", "xyz"]]
+    validator = validation.ChunkValidator(validation.POLICY_RULES)
+    rejected = []
+    for chunk_codes in codes:
+        converted = pd.DataFrame({"Product_Code": pd.Series(chunk_codes, dtype="string")})
+        candidates = np.ones(len(chunk_codes), dtype=bool)
+        rejected.append(list(validator._case_variants("Product_Code", converted["Product_Code"], candidates)))
+    assert rejected == [[False, False], [True, False, True], [False, True]]
@@ -0,0 +1,81 @@
+import hashlib
+import os
+import threading
+import time
+
+import db
+
+# =================================================================
+#  PER-USER DATA VERSIONS AND ETAGS
+# =================================================================
+# Every change to what a listing endpoint returns bumps the user's counter
+# for that listing (UserVersions, one row per user and scope) in the same
+# transaction as the change. The listings send the counter as an ETag, and a
+# poll whose If-None-Match still matches is answered 304 without reading the
+# listing.
+#
+# Counters are cached per process for UserVersionCacheSeconds, so repeated
+# polls don't reach SQL at all. A bump made in this process drops the cached
+# counters immediately; one made by another instance (e.g. an ingest or job
+# activity) is seen once the cached entry expires.
+
+JOBS = "jobs"
+POLICY_SETS = "policy-sets"
+SCENARIO_SETS = "scenario-sets"
+
+CACHE_SECONDS = float(os.environ.get("UserVersionCacheSeconds", 15))
+
+# UserID -> (expiry on time.monotonic(), {scope: version})
+_cache = {}
+_lock = threading.Lock()
+
+
+def versions(user_id: str) -> dict:
+    """The user's counters by scope (a scope never bumped is absent)."""
+    now = time.monotonic()
+    with _lock:
+        entry = _cache.get(user_id)
+    if entry is not None and entry[0] > now:
+        return entry[1]
+    with db.connect() as con:
+        current = dict(con.execute(db.SELECT_USER_VERSIONS, {"uid": user_id}).fetchall())
+    with _lock:
+        _cache[user_id] = (now + CACHE_SECONDS, current)
+    return current
+
+
+def etag(user_id: str, scope: str) -> str:
+    """Strong ETag for one of the user's listings; includes the user so a shared browser cache can't match across users."""
+    user = hashlib.sha256(user_id.encode()).hexdigest()[:12]
+    return f'"{scope}-{user}-{int(versions(user_id).get(scope, 0))}"'
+
+
+def matches(if_none_match, tag: str) -> bool:
+    """Whether an If-None-Match header value lists `tag` (weak comparison, as RFC 9110 asks for If-None-Match)."""
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    return "*" in candidates or tag in [candidate.removeprefix("W/") for candidate in candidates]
+
+
+def headers(tag: str) -> dict:
+    """Response headers for a versioned listing: the ETag, and revalidation on every use."""
+    return {"ETag": tag, "Cache-Control": "private, no-cache", "Access-Control-Expose-Headers": "ETag"}
+
+
+def _forget(user_id):
+    with _lock:
+        _cache.pop(user_id, None)
+
+
+def bump(con, user_id: str, scope: str):
+    """Bumps one of the user's counters; run it in the transaction that changes the listing."""
+    con.execute(db.BUMP_USER_VERSION, {"uid": user_id, "scope": scope})
+    _forget(user_id)
+
+
+def bump_for_job(con, job_id: int):
+    """Bumps the JOBS counter of the job's owner."""
+    user_id = con.execute(db.SELECT_JOB_USER, {"jid": job_id}).scalar()
+    if user_id is not None:
+        bump(con, user_id, JOBS)
@@ -0,0 +1,246 @@
+import io
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+from azure.core.exceptions import ResourceExistsError
+from azure.storage.blob import BlobServiceClient
+
+import db
+import policy_terms
+
+# =================================================================
+#  INGEST VALIDATION AND QUARANTINE
+# =================================================================
+# Every ingest chunk is checked column by column with vectorized masks
+# before anything is written: unparseable values, missing required fields,
+# out-of-domain values, repeated keys, (for policies) keys already stored
+# by another upload and spellings of a value SQL Server would treat as the
+# same as one seen earlier in the upload (e.g. Product_Code 'abc' after
+# 'ABC'). Rows that fail any rule are
+# written, as uploaded and with their reason codes, to
+#
+#   quarantine/{UserID}/{policies|scenarios}/{SetID}/part-00000.csv
+#
+# and only the clean rows are loaded. Reason codes are RULE:Column, several
+# separated by ';', e.g. "MISSING_VALUE:Gender;OUT_OF_RANGE:Issue_Age".
+
+QUARANTINE_CONTAINER = "quarantine"
+# Policy_IDs looked up per query against the Policies table (SQL Server takes at most 2100 parameters)
+EXISTING_KEY_BATCH = 2000
+
+POLICY_RULES = {
+    "key": ["Policy_ID"],
+    "required": ["Policy_ID", "Product_Code", "Valuation_Date", "Issue_Date", "Issue_Age", "Gender", "Policy_Status_Code", "Account_Value"],
+    "ranges": {
+        "Issue_Age": (0, 120), "Account_Value": (0, 1e16), "GLWB_Benefit_Base": (0, 1e16),
+        "Guaranteed_Crediting_Rate": (0, 1), "GLWB_Withdrawal_Rate": (0, 1),
+    },
+    "allowed": {"Gender": {"M", "F"}},
+    # NVARCHAR / CHAR widths in schema.sql
+    "max_lengths": {"Policy_ID": 50, "Product_Code": 50, "Gender": 1, "Index_Strategy_Code": 50, "Rider_Codes": 255},
+    # (earlier, later) date pairs
+    "ordered_dates": [("Issue_Date", "Valuation_Date")],
+    # Grouped case-sensitively downstream (set_summaries, snapshot product filters) but compared
+    # case-insensitively by SQL Server, so one upload keeps to its first spelling of each value
+    "case_variants": ["Product_Code"],
+}
+# Rows are checked one at a time; that each scenario ends up with every month
+# is checked once the whole set has loaded (set_summaries.ScenarioSetSummary.check).
+# EconomicScenarios is keyed on (ScenarioSetID, ScenarioID, Month) and each upload is
+# a new set, so only keys repeated within the upload can collide.
+SCENARIO_RULES = {
+    "key": ["ScenarioID", "Month"],
+    "required": [
+        "ScenarioID", "Month", "Rate_0_25_yr", "Rate_0_5_yr", "Rate_1_yr", "Rate_2_yr", "Rate_3_yr",
+        "Rate_5_yr", "Rate_7_yr", "Rate_10_yr", "Rate_20_yr", "Rate_30_yr",
+    ],
+    "ranges": {
+        "ScenarioID": (0, 2**31 - 1), "Month": (1, 1200),
+        **{name: (-0.2, 1) for name in (
+            "Rate_0_25_yr", "Rate_0_5_yr", "Rate_1_yr", "Rate_2_yr", "Rate_3_yr",
+            "Rate_5_yr", "Rate_7_yr", "Rate_10_yr", "Rate_20_yr", "Rate_30_yr",
+        )},
+    },
+    "allowed": {},
+    "max_lengths": {},
+    "ordered_dates": [],
+    "case_variants": [],
+}
+
+
+def _container():
+    storage_conn_str = os.environ["AzureWebJobsStorage"]
+    return BlobServiceClient.from_connection_string(storage_conn_str).get_container_client(QUARANTINE_CONTAINER)
+
+
+def _blank(raw: pd.Series) -> np.ndarray:
+    return (raw.isna() | (raw.str.strip() == "")).to_numpy()
+
+
+def _comparable(keys: pd.DataFrame) -> pd.DataFrame:
+    """Key columns as SQL Server compares them: text case-insensitively and without trailing spaces."""
+    return keys.apply(lambda column: column.str.upper().str.rstrip(" ") if column.dtype == "string" else column)
+
+
+def stored_policy_ids(policy_ids: pd.Series) -> np.ndarray:
+    """Marks the Policy_IDs already in the Policies table, which is keyed on Policy_ID alone across users and sets."""
+    wanted = policy_ids.dropna().unique().tolist()
+    found = []
+    # Runs on the ingest prefetch thread, so it can't share the loading connection
+    with db.connect() as con:
+        for start in range(0, len(wanted), EXISTING_KEY_BATCH):
+            found += [row[0] for row in con.execute(db.SELECT_EXISTING_POLICY_IDS, {"pids": wanted[start:start + EXISTING_KEY_BATCH]})]
+    if not found:
+        return np.zeros(len(policy_ids), dtype=bool)
+    stored = _comparable(pd.DataFrame({"key": pd.Series(found, dtype="string")}))["key"]
+    return _comparable(pd.DataFrame({"key": policy_ids}))["key"].isin(stored).fillna(False).to_numpy(dtype=bool)
+
+
+class ChunkValidator:
+    """
+    Splits converted ingest chunks into clean and rejected rows. Holds the keys seen in
+    earlier chunks, so one validator checks key uniqueness across a whole upload.
+    `existing_keys` (e.g. stored_policy_ids) marks the keys of a single-column key that are
+    already stored, so they are quarantined instead of failing the insert.
+    """
+
+    def __init__(self, rules: dict, terms: bool = False, existing_keys=None):
+        self.rules = rules
+        # Policies also get their contract fields parsed (policy_terms.py); the parsed
+        # columns are added to clean rows for the snapshot
+        self.terms = terms
+        self.existing_keys = existing_keys
+        # 64-bit hashes of the keys loaded so far, as sorted runs for searchsorted lookups. A run is
+        # merged into the one before it once that is no more than twice its size, so there are
+        # O(log n) runs and each hash is re-sorted O(log n) times
+        self._seen = []
+        # Per case_variants column, comparable value -> the spelling the upload used first
+        self._spellings = {name: {} for name in rules["case_variants"]}
+
+    def _remember(self, hashes: np.ndarray):
+        # A chunk with no clean rows adds no run (an empty run can't be searched)
+        if not len(hashes):
+            return
+        self._seen.append(np.sort(hashes))
+        while len(self._seen) > 1 and len(self._seen[-2]) <= 2 * len(self._seen[-1]):
+            last = self._seen.pop()
+            self._seen[-1] = np.sort(np.concatenate([self._seen[-1], last]), kind="stable")
+
+    def check_columns(self, raw: pd.DataFrame):
+        missing = [name for name in self.rules["required"] if name not in raw]
+        if missing:
+            raise ValueError(f"Upload is missing required column(s): {', '.join(missing)}")
+
+    def _duplicate_keys(self, converted: pd.DataFrame, candidates: np.ndarray):
+        """Marks candidate rows whose key was loaded by an earlier chunk or an earlier candidate row; also returns all key hashes."""
+        hashes = pd.util.hash_pandas_object(_comparable(converted[self.rules["key"]]), index=False).to_numpy()
+        rows = np.flatnonzero(candidates)
+        duplicate = np.zeros(len(hashes), dtype=bool)
+        duplicate[rows] = pd.Series(hashes[rows]).duplicated().to_numpy()
+        for run in self._seen:
+            if not len(run):
+                continue
+            positions = np.minimum(np.searchsorted(run, hashes[rows]), len(run) - 1)
+            duplicate[rows] |= run[positions] == hashes[rows]
+        return duplicate, hashes
+
+    def _case_variants(self, name: str, values: pd.Series, candidates: np.ndarray) -> np.ndarray:
+        """Marks values spelled differently from the upload's first spelling of the same comparable value; candidate rows claim spellings."""
+        text = values.astype("string")
+        comparable = _comparable(pd.DataFrame({name: text}))[name]
+        spellings = self._spellings[name]
+        claims = pd.DataFrame({"comparable": comparable, "text": text})[candidates & text.notna().to_numpy()].drop_duplicates()
+        for value, spelling in claims.itertuples(index=False):
+            spellings.setdefault(value, spelling)
+        first = comparable.map(spellings).astype("string")
+        return (first.notna() & (text != first)).fillna(False).to_numpy(dtype=bool)
+
+    def split(self, raw: pd.DataFrame, converted: pd.DataFrame):
+        """Returns (clean, rejected): converted clean rows, and rejected rows as uploaded plus Row_Number and Reason_Codes."""
+        self.check_columns(raw)
+        reasons = np.full(len(raw), "", dtype=object)
+
+        def reject(mask, code):
+            if mask.any():
+                reasons[mask] = reasons[mask] + code + ";"
+
+        for name in converted.columns:
+            text = raw[name].astype("string")
+            blank = _blank(text)
+            if name in self.rules["required"]:
+                reject(blank, f"MISSING_VALUE:{name}")
+            reject(~blank & converted[name].isna().to_numpy(), f"INVALID_TYPE:{name}")
+            if name in self.rules["max_lengths"]:
+                reject((text.str.len() > self.rules["max_lengths"][name]).fillna(False).to_numpy(), f"TOO_LONG:{name}")
+        for name, (lo, hi) in self.rules["ranges"].items():
+            if name in converted:
+                values = converted[name].astype("float64").to_numpy()
+                reject(~np.isnan(values) & ((values < lo) | (values > hi)), f"OUT_OF_RANGE:{name}")
+        for name, allowed in self.rules["allowed"].items():
+            if name in converted:
+                values = converted[name]
+                reject((values.notna() & ~values.isin(list(allowed))).to_numpy(), f"NOT_ALLOWED:{name}")
+        for earlier, later in self.rules["ordered_dates"]:
+            if earlier in converted and later in converted:
+                first, second = pd.to_datetime(converted[earlier]), pd.to_datetime(converted[later])
+                reject((first > second).to_numpy(), f"DATE_ORDER:{earlier}")
+
+        terms = None
+        if self.terms:
+            terms, term_reasons = policy_terms.parse(converted)
+            bad_terms = term_reasons.notna().to_numpy()
+            if bad_terms.any():
+                # policy_terms reasons read "Field: explanation"
+                reasons[bad_terms] = reasons[bad_terms] + "INVALID_TERMS:" + term_reasons[bad_terms].str.split(":").str[0].to_numpy(dtype=object) + ";"
+
+        for name in self.rules["case_variants"]:
+            if name in converted:
+                reject(self._case_variants(name, converted[name], reasons == ""), f"CASE_VARIANT:{name}")
+
+        # Only otherwise clean rows claim their key, so a bad first copy doesn't block a good second one
+        duplicate, hashes = self._duplicate_keys(converted, reasons == "")
+        reject(duplicate, "DUPLICATE_KEY:" + "+".join(self.rules["key"]))
+        if self.existing_keys is not None:
+            candidates = np.flatnonzero(reasons == "")
+            existing = np.zeros(len(reasons), dtype=bool)
+            existing[candidates] = self.existing_keys(converted[self.rules["key"][0]].iloc[candidates])
+            reject(existing, "EXISTING_KEY:" + self.rules["key"][0])
+
+        clean_mask = reasons == ""
+        self._remember(hashes[clean_mask])
+        clean = converted[clean_mask]
+        if terms is not None:
+            clean = pd.concat([clean, terms[clean_mask]], axis=1)
+        rejected = raw[~clean_mask].copy()
+        # 1-based line in the uploaded file, counting the header
+        rejected.insert(0, "Row_Number", rejected.index + 2)
+        rejected["Reason_Codes"] = [codes.rstrip(";") for codes in reasons[~clean_mask]]
+        return clean, rejected
+
+
+class QuarantineWriter:
+    """Writes an upload's rejected rows as CSV part files under its quarantine prefix."""
+
+    def __init__(self, user_id: str, kind: str, set_id):
+        self.prefix = f"{user_id}/{kind}/{int(set_id)}"
+        self.rows = 0
+        self._parts = 0
+        self._container = None
+
+    def write(self, rejected: pd.DataFrame):
+        if rejected.empty:
+            return
+        if self._container is None:
+            self._container = _container()
+            try:
+                self._container.create_container()
+            except ResourceExistsError:
+                pass
+        buffer = io.StringIO()
+        rejected.to_csv(buffer, index=False)
+        self._container.upload_blob(f"{self.prefix}/part-{self._parts:05d}.csv", buffer.getvalue().encode(), overwrite=True)
+        self._parts += 1
+        self.rows += len(rejected)
+        logging.warning(f"Quarantined {len(rejected)} rows under {QUARANTINE_CONTAINER}/{self.prefix}.")
@@ -1,6 +1,12 @@
 import React, { useState, useEffect } from 'react';
 import { useAuthenticatedFetch } from '../hooks/useAuthenticatedFetch';
 
+// "rate:+0.01, lapse:0.05, crediting:-0.005:credDown" -> [{kind, shift, name?}]; the engine validates them
+const parseSensitivities = (text) => text.split(',').map(entry => entry.trim()).filter(Boolean).map(entry => {
+    const [kind, shift, name] = entry.split(':').map(part => part.trim());
+    return name ? { kind, shift: Number(shift), name } : { kind, shift: Number(shift) };
+});
+
 const CalculationLabPage = () => {
     const authFetch = useAuthenticatedFetch();
     
@@ -16,6 +22,8 @@ const CalculationLabPage = () => {
     const [assumptions, setAssumptions] = useState('');
     const [runStochastic, setRunStochastic] = useState(false);
     const [runAttribution, setRunAttribution] = useState(false);
+    const [useModelPoints, setUseModelPoints] = useState(false);
+    const [sensitivities, setSensitivities] = useState('');
     const [isLoading, setIsLoading] = useState(false);
     
     // Fetch initial data (policy sets, scenarios)
@@ -58,6 +66,8 @@ const CalculationLabPage = () => {
             assumptionsText: assumptions,
             runStochastic: runStochastic,
             includeAttribution: runAttribution,
+            compression: useModelPoints,
+            sensitivities: parseSensitivities(sensitivities),
         };
         
         try {
@@ -109,6 +119,9 @@ const CalculationLabPage = () => {
                 <h2>3. Configure Output</h2>
                 <label><input type="checkbox" checked={runStochastic} onChange={e => setRunStochastic(e.target.checked)} /> Run Stochastic Scenarios?</label>
                 <label><input type="checkbox" checked={runAttribution} onChange={e => setRunAttribution(e.target.checked)} /> Include Attribution Analysis?</label>
+                <label><input type="checkbox" checked={useModelPoints} onChange={e => setUseModelPoints(e.target.checked)} /> Compress Policies into Model Points?</label>
+                <label htmlFor="sensitivities" className="label-text">Sensitivities (kind:shift, comma-separated; kinds rate, lapse, crediting):</label>
+                <input id="sensitivities" type="text" placeholder="rate:+0.01, lapse:0.05, crediting:-0.005" value={sensitivities} onChange={e => setSensitivities(e.target.value)} />
                 
                 <button type="submit" disabled={isLoading} style={{marginTop: '20px'}}>Queue Calculation Job</button>
             </form>
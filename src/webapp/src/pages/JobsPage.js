@@ -1,4 +1,4 @@
-import React, { useState, useEffect, useCallback } from 'react';
+import React, { useState, useEffect, useCallback, useRef } from 'react';
 import { AgGridReact } from 'ag-grid-react';
 import { useNavigate } from 'react-router-dom';
 import { useAuthenticatedFetch } from '../hooks/useAuthenticatedFetch';
@@ -7,11 +7,16 @@ const JobsPage = () => {
     const [jobs, setJobs] = useState([]);
     const authFetch = useAuthenticatedFetch();
     const navigate = useNavigate();
+    // The browser revalidates /api/jobs with its ETag; an unchanged ETag means the list hasn't changed
+    const lastEtag = useRef(null);
 
     const fetchJobs = useCallback(async () => {
         try {
             const response = await authFetch('/api/jobs?');
             if (!response.ok) throw new Error('Failed to fetch jobs.');
+            const etag = response.headers.get('ETag');
+            if (etag && etag === lastEtag.current) return;
+            lastEtag.current = etag;
             const data = await response.json();
             setJobs(data);
         } catch (error) {
@@ -7,11 +7,17 @@ const PolicyDataGridPage = () => {
     const { setId } = useParams();
     const [rowData, setRowData] = useState([]);
     const [columnDefs, setColumnDefs] = useState([]);
+    const [nextCursor, setNextCursor] = useState(null);
     const authFetch = useAuthenticatedFetch();
 
-    useEffect(() => {
-        authFetch(`/api/policies?setId=${setId}`)
-            .then(res => res.json())
+    // The API returns one keyset page at a time; the cursor for the next page comes back in X-Next-Cursor
+    const loadPage = (cursor) => {
+        const query = new URLSearchParams({ setId, ...(cursor ? { cursor } : {}) }).toString();
+        authFetch(`/api/policies?${query}`)
+            .then(res => {
+                setNextCursor(res.headers.get('X-Next-Cursor'));
+                return res.json();
+            })
             .then(data => {
                 if (data.length > 0) {
                     // Dynamically create columns from the first data object's keys
@@ -21,10 +27,14 @@ const PolicyDataGridPage = () => {
                         editable: key !== 'id', // Make all fields except ID editable
                     }));
                     setColumnDefs([...cols, { headerName: "Delete", cellRenderer: DeleteButtonRenderer }]);
-                    setRowData(data);
+                    setRowData(prev => cursor ? [...prev, ...data] : data);
                 }
             });
-    }, );
+    };
+
+    useEffect(() => {
+        loadPage(null);
+    }, [setId]); // eslint-disable-line react-hooks/exhaustive-deps
 
     const handleCellValueChanged = (event) => {
         console.log("Saving changes for row:", event.data);
@@ -61,6 +71,7 @@ const PolicyDataGridPage = () => {
                     defaultColDef={{ flex: 1, filter: true, sortable: true }}
                 />
             </div>
+            {nextCursor && <button onClick={() => loadPage(nextCursor)}>Load more</button>}
         </div>
     );
 };